@@ -26,6 +26,7 @@
 
 using System;
 using System.Collections;
+using System.Collections.Generic;
 using System.Text.Json;
 using Mono.Addins;
 using Nini.Config;
@@ -51,6 +52,10 @@ namespace OpenSim.Groups
         // One instance per region server process; we use the Scene we were added to
         private Scene m_scene;
 
+        // Every scene on this simulator, for scope "local" delivery
+        private readonly List<Scene> m_scenes = new List<Scene>();
+        private bool m_handlerRegistered;
+
         public string Name => "MatrixGroupInjectModule";
         public Type ReplaceableInterface => null;
 
@@ -77,6 +82,13 @@ namespace OpenSim.Groups
                 return;
 
             m_scene = scene;
+            lock (m_scenes)
+                m_scenes.Add(scene);
+
+            // MainServer is shared by every region in the process
+            if (m_handlerRegistered)
+                return;
+            m_handlerRegistered = true;
 
             MainServer.Instance.AddHTTPHandler(
                 "/matrix/group-message",
@@ -85,7 +97,15 @@ namespace OpenSim.Groups
             m_log.Info("[MatrixBridge] Region HTTP endpoint registered at /matrix/group-message");
         }
 
-        public void RemoveRegion(Scene scene) { }
+        public void RemoveRegion(Scene scene)
+        {
+            lock (m_scenes)
+            {
+                m_scenes.Remove(scene);
+                if (m_scene == scene)
+                    m_scene = m_scenes.Count > 0 ? m_scenes[0] : null;
+            }
+        }
         public void RegionLoaded(Scene scene) { }
         public void PostInitialise() { }
         public void Close() { }
@@ -103,14 +123,15 @@ namespace OpenSim.Groups
                     return Error(response, 400, "Missing headers");
 
                 string secretHeader = null;
+                string traceId = null;
 
                 foreach (DictionaryEntry entry in headers)
                 {
-                    if (entry.Key.ToString().Equals("X-Bridge-Secret", StringComparison.OrdinalIgnoreCase))
-                    {
+                    string key = entry.Key.ToString();
+                    if (key.Equals("X-Bridge-Secret", StringComparison.OrdinalIgnoreCase))
                         secretHeader = entry.Value?.ToString();
-                        break;
-                    }
+                    else if (key.Equals("X-Bridge-Trace", StringComparison.OrdinalIgnoreCase))
+                        traceId = entry.Value?.ToString();
                 }
 
                 //m_log.InfoFormat("[MatrixBridge] Secret Header {0} :: Config Value {1}", secretHeader, m_secret);
@@ -145,6 +166,12 @@ namespace OpenSim.Groups
                 var fromName = fromEl.GetString() ?? string.Empty;
                 var message  = msgEl.GetString() ?? string.Empty;
 
+                // "group" (default): deliver to the whole group.
+                // "local": only avatars on this simulator — the bridge sends
+                // the message to each simulator when fanning out.
+                bool localOnly = root.TryGetProperty("scope", out var scopeEl) &&
+                    scopeEl.GetString() == "local";
+
                 if (!UUID.TryParse(groupStr, out UUID groupID))
                 {
                     m_log.Info("[MatrixBridge] 400 Invalid Group UUID");
@@ -157,11 +184,17 @@ namespace OpenSim.Groups
                     return Error(response, 400, "Empty message");
                 }
 
-                InjectToGroup(groupID, fromName, message);
+                // Timed so the bridge's trace can split network from injection
+                var sw = System.Diagnostics.Stopwatch.StartNew();
+                InjectToGroup(groupID, fromName, message, traceId, localOnly);
+                sw.Stop();
 
                 response["int_response_code"] = 200;
                 response["content_type"] = "application/json";
-                response["str_response_string"] = "{\"ok\":true}";
+                response["str_response_string"] = string.Format(
+                    System.Globalization.CultureInfo.InvariantCulture,
+                    "{{\"ok\":true,\"inject_ms\":{0:0.##}}}",
+                    sw.Elapsed.TotalMilliseconds);
                 return response;
             }
             catch (Exception e)
@@ -171,7 +204,8 @@ namespace OpenSim.Groups
             }
         }
 
-        private void InjectToGroup(UUID groupID, string fromName, string message)
+        private void InjectToGroup(UUID groupID, string fromName, string message, string traceId,
+                                   bool localOnly)
         {
             if (m_scene == null)
             {
@@ -200,9 +234,27 @@ namespace OpenSim.Groups
             };
 
             // This is the correct injection point (region-side group broadcaster)
-            groupsModule.SendMessageToGroup(im, groupID);
+            if (localOnly)
+                groupsModule.SendMessageToGroup(im, groupID, UUID.Zero, IsOnThisSimulator);
+            else
+                groupsModule.SendMessageToGroup(im, groupID);
 
-            m_log.InfoFormat("[MatrixBridge] Injected message into group {0} from {1}", groupID, fromName);
+            m_log.InfoFormat("[MatrixBridge] Injected message into group {0} from {1} (trace {2})",
+                groupID, fromName, traceId ?? "-");
+        }
+
+        private bool IsOnThisSimulator(GroupMembersData member)
+        {
+            lock (m_scenes)
+            {
+                foreach (Scene scene in m_scenes)
+                {
+                    ScenePresence sp = scene.GetScenePresence(member.AgentID);
+                    if (sp != null && !sp.IsChildAgent)
+                        return true;
+                }
+            }
+            return false;
         }
 
         private static string ExtractBodyAsString(Hashtable request)
@@ -193,36 +193,70 @@ namespace OpenSim.Services.HypergridService
                 }
             }
 
-            var payload = new
-            {
-                type = "group_message",
-                group_uuid = im.imSessionID.ToString(),
-                from_uuid = im.fromAgentID.ToString(),
-                from_name = im.fromAgentName,
-                message = im.message,
-                dialog = im.dialog,
-                ts_unix = DateTimeOffset.UtcNow.ToUnixTimeSeconds()
-            };
-
-            var json = System.Text.Json.JsonSerializer.Serialize(payload);
-            var req = new System.Net.Http.HttpRequestMessage(
-                System.Net.Http.HttpMethod.Post,
-                m_HoloMatrixUrl);
-
-            req.Content = new System.Net.Http.StringContent(
-                json,
-                System.Text.Encoding.UTF8,
-                "application/json");
-
-            if (!string.IsNullOrEmpty(m_HoloMatrixSecret))
-                req.Headers.Add("X-Bridge-Secret", m_HoloMatrixSecret);
+            // Per-message trace: the bridge records its stage timings under
+            // this ID and measures our queueing from the tap timestamp
+            string traceId = Guid.NewGuid().ToString("N");
+            long tapMs = DateTimeOffset.UtcNow.ToUnixTimeMilliseconds();
+            m_log.DebugFormat("[MatrixBridge] Tap group={0} trace={1}", im.imSessionID, traceId);
 
             _ = System.Threading.Tasks.Task.Run(async () =>
             {
-                try { await m_HoloHttp.SendAsync(req); }
+                try
+                {
+                    var payload = new
+                    {
+                        type = "group_message",
+                        group_uuid = im.imSessionID.ToString(),
+                        from_uuid = im.fromAgentID.ToString(),
+                        from_name = im.fromAgentName,
+                        message = im.message,
+                        dialog = im.dialog,
+                        ts_unix = tapMs / 1000,
+                        // Lets the bridge learn which simulator can inject
+                        // this group's Matrix-side messages
+                        region_id = im.RegionID.ToString(),
+                        region_url = ResolveRegionUrl(new UUID(im.RegionID))
+                    };
+
+                    var json = System.Text.Json.JsonSerializer.Serialize(payload);
+                    var req = new System.Net.Http.HttpRequestMessage(
+                        System.Net.Http.HttpMethod.Post,
+                        m_HoloMatrixUrl);
+
+                    req.Content = new System.Net.Http.StringContent(
+                        json,
+                        System.Text.Encoding.UTF8,
+                        "application/json");
+
+                    if (!string.IsNullOrEmpty(m_HoloMatrixSecret))
+                        req.Headers.Add("X-Bridge-Secret", m_HoloMatrixSecret);
+
+                    req.Headers.Add("X-Bridge-Trace", traceId);
+                    req.Headers.Add("X-Bridge-Trace-Ts", tapMs.ToString());
+
+                    await m_HoloHttp.SendAsync(req);
+                }
                 catch { }
             });
         }
+
+        // Sender's simulator URL (cached like TrySendInstantMessage does);
+        // null if the region is unknown to the grid service
+        private static string ResolveRegionUrl(UUID regionID)
+        {
+            if (regionID.IsZero() || m_GridService == null)
+                return null;
+
+            if (m_RegionsCache.TryGetValue(regionID, out string url))
+                return url;
+
+            GridRegion reginfo = m_GridService.GetRegionByUUID(UUID.Zero, regionID);
+            if (reginfo == null)
+                return null;
+
+            m_RegionsCache.AddOrUpdate(regionID, reginfo.ServerURI, 300);
+            return reginfo.ServerURI;
+        }
         // === HOLONEON MATRIX BRIDGE END ===
 
         public bool IncomingInstantMessage(GridInstantMessage im)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Bulk enable: wall time for POST /admin/bridge/enable/bulk's work.
+
+Runs BridgeService.enable_bridges() for --groups new groups against a stub
+homeserver that answers every call after --delay-ms. Each group costs five
+calls (alias lookup, createRoom, register, join, power levels), so with
+C groups in flight the floor is about groups / C * 5 * delay. Mappings go
+to a throwaway SQLite state store in one batched write at the end.
+
+The endpoint caps Concurrency at admin.bulk_concurrency (16 by default);
+higher values here show what raising that cap would buy.
+
+Usage:
+    python benchmarks/bench_bulk_enable.py --groups 500 --concurrency 1 8 16
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.config import Config  # noqa: E402
+from bridge.migrations import migrate  # noqa: E402
+from bridge.service import BridgeService  # noqa: E402
+
+
+def stub_homeserver(delay_ms: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _answer(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+            time.sleep(delay_ms / 1000)
+            if "/directory/room/" in self.path:
+                code, body = 404, {"errcode": "M_NOT_FOUND"}
+            elif self.path.startswith("/_matrix/client/v3/createRoom"):
+                code, body = 200, {"room_id": f"!{uuid.uuid4().hex}:bench"}
+            else:
+                code, body = 200, {}
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = _answer
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16])
+    parser.add_argument("--delay-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    server = stub_homeserver(args.delay_ms)
+    port = server.server_address[1]
+
+    print(f"{args.groups} groups, stub homeserver at {args.delay_ms:g} ms/call")
+    for concurrency in args.concurrency:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "config.yaml")
+            with open(path, "w") as f:
+                f.write(
+                    f"matrix: {{base_url: 'http://127.0.0.1:{port}', "
+                    f"as_token: bench, hs_token: bench}}\n"
+                    f"opensim: {{bridge_secret: bench}}\n"
+                    f"state_store: {{backend: sqlite, "
+                    f"path: '{os.path.join(tmp, 'state.db')}'}}\n"
+                    f"trace: {{enabled: false}}\n"
+                    f"admin: {{bulk_concurrency: {max(args.concurrency)}}}\n"
+                )
+            bridge = BridgeService(Config(path))
+            migrate(bridge.store)
+            groups = [{"group_uuid": str(uuid.uuid4()),
+                       "group_name": f"Bench {i}",
+                       "founder_avatar_uuid": str(uuid.uuid4())}
+                      for i in range(args.groups)]
+
+            t0 = time.perf_counter()
+            summary = list(bridge.enable_bridges(groups, concurrency))[-1]
+            elapsed = time.perf_counter() - t0
+            assert summary["stored"] == args.groups, summary
+            floor = args.groups / concurrency * 5 * args.delay_ms / 1000
+            print(f"  concurrency {concurrency:>3}: {elapsed:6.2f} s "
+                  f"({args.groups / elapsed:6.1f} groups/s, floor {floor:.2f} s)")
+            bridge.store.close()
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Transaction ingest: current path vs the fast path (stdlib and orjson).
+
+Builds synthetic AppService transactions of --events events and times
+turning the raw body into the events the bridge relays, with peak memory
+from tracemalloc:
+
+  baseline  — json.loads of the whole body, then the old per-event loop
+  fast/json — bridge.ingest with the stdlib decoder
+  fast/orjson — bridge.ingest with orjson (if installed)
+  msgs-only   — bridge.ingest without m.room.member (the pre-cache filter)
+
+Three mixes are measured:
+- "chatty": a few real messages among member, state, receipt and puppet
+  echo events;
+- "members": receipts, state and m.room.member, with no messages;
+- "noise": receipts and state only.
+
+The fast path also keeps m.room.member events for the display-name cache,
+so its "kept" count is higher than the baseline's on the chatty mix.
+Keeping them has a cost, which the "members" mix shows: those
+transactions carry nothing to relay, but they are fully decoded because
+they hold a member event. msgs-only skips them undecoded.
+
+Usage:
+    python benchmarks/bench_ingest.py --events 1000 --rounds 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge import ingest  # noqa: E402
+
+SKIP = ("@os_", "@opensim_bot")
+ROOMS = [f"!room{i:03d}:bench.local" for i in range(50)]
+
+
+def make_event(kind: str, i: int) -> dict:
+    room = random.choice(ROOMS)
+    base = {"event_id": f"$e{i:06d}", "room_id": room,
+            "origin_server_ts": 1700000000000 + i, "unsigned": {"age": 12}}
+    if kind == "message":
+        return {**base, "type": "m.room.message", "sender": "@alice:bench.local",
+                "content": {"msgtype": "m.text", "body": f"hello {i}"}}
+    if kind == "echo":
+        return {**base, "type": "m.room.message",
+                "sender": "@os_0123456789abcdef0123456789abcdef:bench.local",
+                "content": {"msgtype": "m.text", "body": f"echo {i} " * 8}}
+    if kind == "member":
+        return {**base, "type": "m.room.member", "state_key": f"@u{i}:bench.local",
+                "sender": f"@u{i}:bench.local",
+                "content": {"membership": "join", "displayname": f"User {i}",
+                            "avatar_url": "mxc://bench.local/abcdefghijklmnop"}}
+    if kind == "receipt":
+        return {**base, "type": "m.receipt", "sender": "@alice:bench.local",
+                "content": {f"$e{i - 1}": {"m.read": {"@alice:bench.local": {"ts": i}}}}}
+    return {**base, "type": "m.room.power_levels", "state_key": "",
+            "sender": "@opensim_bot:bench.local",
+            "content": {"users": {f"@u{j}:bench.local": 0 for j in range(20)}}}
+
+
+def make_body(n: int, mix: str) -> bytes:
+    if mix == "noise":
+        kinds = ["receipt", "state"]
+    elif mix == "members":
+        kinds = ["receipt"] * 4 + ["state"] + ["member"]
+    else:
+        kinds = ["message"] + ["echo"] * 3 + ["member"] * 3 + ["receipt"] * 2 + ["state"]
+    return json.dumps({"events": [make_event(random.choice(kinds), i)
+                                  for i in range(n)]}).encode()
+
+
+def baseline(raw: bytes) -> list:
+    body = json.loads(raw)
+    out = []
+    for ev in body.get("events", []):
+        if ev.get("type") != "m.room.message":
+            continue
+        sender = ev.get("sender", "")
+        if sender.startswith("@os_") or sender.startswith("@opensim_bot"):
+            continue
+        out.append(ev)
+    return out
+
+
+def measure(fn, raw: bytes, rounds: int) -> tuple[float, float, int]:
+    kept = len(fn(raw))
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        fn(raw)
+    per_call = (time.perf_counter() - t0) / rounds
+    tracemalloc.start()
+    fn(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_call * 1000, peak / 1024, kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(42)
+    contenders = [("baseline", baseline)]
+    orjson_mod = ingest.orjson
+    ingest.orjson = None
+    contenders.append(("fast/json", lambda raw: ingest.parse_transaction(
+        raw, skip_senders=SKIP)))
+    if orjson_mod is not None:
+        def fast_orjson(raw):
+            ingest.orjson = orjson_mod
+            try:
+                return ingest.parse_transaction(raw, skip_senders=SKIP)
+            finally:
+                ingest.orjson = None
+        contenders.append(("fast/orjson", fast_orjson))
+    else:
+        print("(orjson not installed — pip install orjson to compare)")
+
+    def msgs_only(raw):
+        ingest.orjson = orjson_mod
+        try:
+            return ingest.parse_transaction(raw, ingest.MESSAGE_TYPES, SKIP)
+        finally:
+            ingest.orjson = None
+    contenders.append(("msgs-only", msgs_only))
+
+    for mix in ("chatty", "members", "noise"):
+        raw = make_body(args.events, mix)
+        print(f"\n{mix}: {args.events} events, {len(raw) / 1024:.0f} KiB body")
+        for name, fn in contenders:
+            ms, peak_kib, kept = measure(fn, raw, args.rounds)
+            print(f"  {name:<12} {ms:8.3f} ms/txn   peak {peak_kib:8.1f} KiB   "
+                  f"kept {kept}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Sharded-mode throughput and per-room ordering.
+
+Pushes synthetic transactions through ShardDispatcher into 1..N worker
+processes running the real consume()/KeyedExecutor loop. Each event costs
+--cpu-us of CPU plus --io-ms of blocking wait (standing in for Matrix and
+OpenSim HTTP calls). Reports events/s per worker count, and checks that
+every room's events were handled in the order they were sent.
+
+Usage:
+    python benchmarks/bench_sharding.py --workers 1 2 4 --events 20000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.shard import ShardDispatcher, consume  # noqa: E402
+
+
+def synthetic_handler(results, cpu_us: int, io_ms: float):
+    last_seq: dict[str, int] = {}
+    out_of_order = 0
+
+    def handle(kind, events):
+        nonlocal out_of_order
+        for ev in events:
+            deadline = time.perf_counter() + cpu_us / 1e6
+            while time.perf_counter() < deadline:
+                pass
+            if io_ms:
+                time.sleep(io_ms / 1000)
+            room, seq = ev["room_id"], ev["seq"]
+            if seq <= last_seq.get(room, -1):
+                out_of_order += 1
+            last_seq[room] = seq
+            if ev.get("last"):
+                results.put(("done", out_of_order))
+    return handle
+
+
+def worker(q, replies, results, lanes, cpu_us, io_ms):
+    consume(q, synthetic_handler(results, cpu_us, io_ms), lanes, replies)
+
+
+def run(workers: int, args) -> tuple[float, int]:
+    ctx = mp.get_context("fork")
+    dispatcher = ShardDispatcher(workers, queue_size=100000)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=worker, args=(q, replies, results, args.lanes,
+                                         args.cpu_us, args.io_ms))
+        for q, replies in zip(dispatcher.queues, dispatcher.replies)
+    ]
+    for p in procs:
+        p.start()
+    for i in range(workers):
+        dispatcher.mark_ready(i)        # synthetic workers need no warm-up
+
+    rooms = [f"!room{i:04d}:bench.local" for i in range(args.rooms)]
+    per_room = args.events // args.rooms
+    t0 = time.perf_counter()
+    for seq in range(per_room):
+        batch = [{"room_id": r, "seq": seq, "last": seq == per_room - 1}
+                 for r in rooms]
+        for i in range(0, len(batch), args.txn_size):
+            # Throughput, not per-request latency: don't wait for the acks
+            dispatcher.submit_transaction(batch[i:i + args.txn_size])
+
+    violations = 0
+    for _ in rooms:
+        _, bad = results.get()
+        violations += bad
+    elapsed = time.perf_counter() - t0
+
+    dispatcher.stop()
+    for p in procs:
+        p.join()
+    dispatcher.close()
+    return per_room * len(rooms) / elapsed, violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--lanes", type=int, default=4)
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--txn-size", type=int, default=50)
+    parser.add_argument("--cpu-us", type=int, default=200)
+    parser.add_argument("--io-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f"{args.events} events, {args.rooms} rooms, {args.lanes} lanes/worker, "
+          f"{args.cpu_us}µs CPU + {args.io_ms}ms I/O per event "
+          f"({os.cpu_count()} CPUs)\n")
+    base = None
+    for n in args.workers:
+        rate, violations = run(n, args)
+        base = base or rate / n
+        print(f"  workers={n:<3} {rate:10.0f} events/s   "
+              f"scaling {rate / base / n:5.0%}   out-of-order {violations}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Time-to-live and time-to-ready for a freshly started bridge.
+
+Starts `run.py` with the given config as a child process and polls the
+OpenSim listener: /health answers once the listeners are up (live), /ready
+once the background warm-up has finished (ready). Reports both, plus each
+warm-up step's own time. Steps run in parallel, so time-to-ready should be
+close to the slowest chain of steps rather than their sum.
+
+Needs the services in config.yaml (MySQL, Conduit) to be reachable, as for
+a real start. Ports in the config must be free.
+
+Usage:
+    python benchmarks/bench_startup.py -c config.yaml --runs 5
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+from bridge.config import Config  # noqa: E402
+
+
+def probe(url: str) -> tuple[int, dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as resp:
+            return resp.status, json.loads(resp.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+    except (OSError, ValueError):
+        return 0, {}
+
+
+def one_run(config: str, base: str, timeout: float, interval: float) -> dict:
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "run.py"), "--config", config],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    live_ms = ready_ms = None
+    body = {}
+    try:
+        while time.perf_counter() - t0 < timeout:
+            if proc.poll() is not None:
+                raise SystemExit(f"bridge exited with {proc.returncode}")
+            if live_ms is None and probe(f"{base}/health")[0] == 200:
+                live_ms = (time.perf_counter() - t0) * 1000
+            if live_ms is not None:
+                status, body = probe(f"{base}/ready")
+                if status == 200:
+                    ready_ms = (time.perf_counter() - t0) * 1000
+                    break
+            time.sleep(interval)
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return {"live_ms": live_ms, "ready_ms": ready_ms, "status": body}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-c", "--config", default="config.yaml")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--timeout", type=float, default=60,
+                    help="give up on a run after this many seconds")
+    ap.add_argument("--interval", type=float, default=0.01,
+                    help="seconds between probes")
+    args = ap.parse_args()
+
+    cfg = Config(args.config)
+    host = "127.0.0.1" if cfg.opensim_host in ("0.0.0.0", "") else cfg.opensim_host
+    base = f"http://{host}:{cfg.opensim_port}"
+
+    live, ready = [], []
+    print(f"{'run':>4} {'live ms':>9} {'ready ms':>9}   warm-up steps (ms)")
+    for i in range(args.runs):
+        r = one_run(args.config, base, args.timeout, args.interval)
+        steps = r["status"].get("steps", {})
+        detail = "  ".join(f"{name}={s.get('ms')}" + (
+            f"×{s['attempts']}" if s.get("attempts", 1) > 1 else "")
+            for name, s in steps.items())
+        if "workers" in r["status"]:        # sharded dispatcher
+            detail = "  ".join(f"worker{w['worker']}={w.get('ready_ms')}"
+                               for w in r["status"]["workers"])
+        if r["ready_ms"] is None:
+            failed = {n: s.get("error") for n, s in steps.items()
+                      if s.get("state") != "ok"}
+            print(f"{i + 1:>4} {r['live_ms'] or 0:>9.0f} {'—':>9}   "
+                  f"not ready after {args.timeout:.0f}s: {failed}")
+            continue
+        live.append(r["live_ms"])
+        ready.append(r["ready_ms"])
+        print(f"{i + 1:>4} {r['live_ms']:>9.0f} {r['ready_ms']:>9.0f}   {detail}")
+        if steps:
+            total = sum(s.get("ms") or 0 for s in steps.values())
+            print(f"{'':>25}steps sum {total:.0f} ms, "
+                  f"warm-up wall {r['status'].get('ready_ms')} ms")
+
+    if ready:
+        print(f"\nmedian  live {statistics.median(live):.0f} ms  "
+              f"ready {statistics.median(ready):.0f} ms  ({len(ready)} runs)")
+
+
+if __name__ == "__main__":
+    main()
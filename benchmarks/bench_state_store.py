@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Per-lookup latency: MySQL vs SQLite state store.
+
+Times get_group_for_room() (the per-Matrix-event lookup) and
+get_room_for_group() (the per-OpenSim-message lookup) on each backend.
+
+The SQLite side uses a throwaway file seeded with --groups rows. The MySQL
+side is read-only against the database in config.yaml and is skipped if
+it cannot be reached.
+
+Usage:
+    python benchmarks/bench_state_store.py -c config.yaml
+    python benchmarks/bench_state_store.py --sqlite-only
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.migrations import migrate  # noqa: E402
+from bridge.storage import SQLiteStateStore  # noqa: E402
+
+
+def seed(store, n: int) -> list[tuple[str, str]]:
+    pairs = []
+    for i in range(n):
+        group_uuid = str(uuid.uuid4())
+        room_id = f"!bench{i:06d}:bench.local"
+        store.upsert_bridge(group_uuid, room_id, str(uuid.uuid4()))
+        pairs.append((group_uuid, room_id))
+    return pairs
+
+
+def time_lookups(fn, keys, rounds: int) -> list[float]:
+    samples = []
+    for _ in range(rounds):
+        key = random.choice(keys)
+        t0 = time.perf_counter()
+        fn(key)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return samples
+
+
+def report(label: str, samples: list[float]):
+    samples.sort()
+    p = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))]
+    print(f"  {label:<34} p50 {p(0.50):8.1f}µs   p99 {p(0.99):8.1f}µs   "
+          f"mean {statistics.fmean(samples):8.1f}µs")
+
+
+def bench_store(name, store, pairs, rounds):
+    print(f"\n{name}")
+    groups = [g for g, _ in pairs] + [str(uuid.uuid4())]   # include a miss
+    rooms = [r for _, r in pairs] + ["!missing:bench.local"]
+    report("get_room_for_group", time_lookups(store.get_room_for_group, groups, rounds))
+    report("get_group_for_room", time_lookups(store.get_group_for_room, rooms, rounds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--config", "-c", help="Path to config.yaml")
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=5000)
+    parser.add_argument("--sqlite-only", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStateStore(os.path.join(tmp, "bench.db"))
+        migrate(store)
+        pairs = seed(store, args.groups)
+        bench_store(f"SQLite (WAL, {args.groups} bridges)", store, pairs, args.rounds)
+        store.close()
+
+    if args.sqlite_only:
+        return
+
+    try:
+        from bridge.config import Config
+        from bridge.db import DBPool
+        from bridge.storage import MySQLStateStore
+
+        cfg = Config(args.config)
+        pool = DBPool("lighthouse_bench", size=1, wait_timeout=5,
+                      host=cfg.db_host, port=cfg.db_port, database=cfg.db_name,
+                      user=cfg.db_user, password=cfg.db_password)
+        store = MySQLStateStore(pool)
+        rows = store.list_bridges()
+    except (Exception, SystemExit) as e:
+        print(f"\nMySQL: skipped ({e})")
+        return
+
+    if not rows:
+        print("\nMySQL: skipped (no enabled bridges to look up)")
+        return
+    pairs = [(r["group_uuid"], r["room_id"]) for r in rows]
+    bench_store(f"MySQL ({cfg.db_host}, {len(pairs)} bridges)", store, pairs, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
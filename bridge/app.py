@@ -9,16 +9,35 @@ Endpoints (matching Fiona's exactly):
   POST /admin/bridge/enable                   — Enable bridge for a group
   POST /admin/bridge/resync                   — Resync group puppets
 
+Bulk (NDJSON progress stream, one line per group then a summary):
+  POST /admin/bridge/enable/bulk              — Enable many groups
+  POST /admin/bridge/resync/bulk              — Resync many groups
+
+Diagnostics:
+  POST /admin/profile?seconds=N               — Sample this worker's stacks
+
+Probes:
+  GET  /health                                — Liveness (process is up)
+  GET  /ready                                 — 200 once warmed up, else 503
+  (transactions and /os/event also answer 503 until warmed up)
+
 Future extensibility endpoints:
   POST /admin/oar/download                    — Trigger OAR backup for region owner
   GET  /admin/status                          — Bridge status and stats
 """
 
 import hmac
+import json
 import logging
-from flask import Flask, request, jsonify
+import os
+from datetime import datetime
+from flask import Flask, Response, request, jsonify, stream_with_context
 from .config import Config
+from .db import PoolExhausted
+from .profiler import ProfilerBusy, SamplingProfiler, method_codes
 from .service import BridgeService
+from .storage import BRIDGE_COLUMNS, BridgeFilter
+from .trace import TRACE_HEADER, TRACE_TS_HEADER, parse_ts_ms
 
 logger = logging.getLogger("lighthouse.app")
 
@@ -30,6 +49,33 @@ def cryptographic_equals(a: str | None, b: str | None) -> bool:
     return hmac.compare_digest(a.encode(), b.encode())
 
 
+def hs_authorized(auth_header: str, query_token: str | None,
+                  hs_token: str) -> bool:
+    """
+    Is this an AppService push from our homeserver? The hs_token comes as
+    "Authorization: Bearer", or as ?access_token= from older homeservers.
+    """
+    if auth_header.startswith("Bearer "):
+        return cryptographic_equals(auth_header[len("Bearer "):], hs_token)
+    return cryptographic_equals(query_token, hs_token)
+
+
+LIST_DEFAULT_LIMIT = 100
+LIST_MAX_LIMIT = 1000
+
+
+def _parse_when(value: str | None, end_of_day: bool = False) -> str | None:
+    """'YYYY-MM-DD[ HH:MM:SS]' (or ISO 'T') → comparable DB text; bad → ValueError."""
+    if not value:
+        return None
+    value = value.replace("T", " ")
+    if len(value) == 10:
+        datetime.strptime(value, "%Y-%m-%d")
+        return value + (" 23:59:59" if end_of_day else " 00:00:00")
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").strftime(
+        "%Y-%m-%d %H:%M:%S")
+
+
 def create_app(config_path: str = None) -> Flask:
     """Application factory."""
     cfg = Config(config_path)
@@ -46,6 +92,16 @@ def create_app(config_path: str = None) -> Flask:
     app.config["bridge"] = bridge
     app.config["cfg"] = cfg
 
+    # Pools, migrations, index and Conduit check happen in the background;
+    # /ready says when they are done
+    bridge.start_warm_up()
+
+    def _warming_up():
+        # Conduit calls the AppService port directly, past any /ready-aware
+        # balancer: refuse work until warm. Retries are deduped.
+        return (jsonify({"error": "warming_up"}), 503,
+                {"Retry-After": "1"})
+
     logger.info("=" * 60)
     logger.info("🔦 Lighthouse Bridge starting...")
     logger.info(f"   Homeserver: {cfg.homeserver}")
@@ -60,20 +116,24 @@ def create_app(config_path: str = None) -> Flask:
     def appservice_transaction(txn_id):
         """Receive Matrix events from Conduit's AppService push."""
         # Validate HS token (Conduit authenticates with hs_token)
-        auth = request.headers.get("Authorization", "")
-        if not auth.startswith("Bearer "):
+        if not hs_authorized(request.headers.get("Authorization", ""),
+                             request.args.get("access_token"), cfg.hs_token):
             return jsonify({}), 401
 
-        token = auth[len("Bearer "):]
-        if not cryptographic_equals(token, cfg.hs_token):
-            return jsonify({}), 401
+        if not bridge.warmup.ready:
+            return _warming_up()
 
         logger.debug(f"Transaction {txn_id} received")
 
-        body = request.get_json(silent=True) or {}
+        # Raw bytes: the ingest fast path filters before decoding
+        raw = request.get_data(cache=False)
 
         try:
-            bridge.handle_matrix_transaction(body)
+            bridge.handle_raw_transaction(raw)
+        except PoolExhausted as e:
+            # Non-200 makes Conduit retry; dedupe drops the repeats
+            logger.warning(f"Transaction {txn_id} deferred: {e}")
+            return jsonify({"error": "busy"}), 503, {"Retry-After": "1"}
         except Exception as e:
             logger.error(f"Transaction processing error: {e}", exc_info=True)
 
@@ -84,9 +144,19 @@ def create_app(config_path: str = None) -> Flask:
     @app.route("/transactions/<txn_id>", methods=["POST", "PUT"])
     def appservice_transaction_alt(txn_id):
         """Alternate transaction endpoint (compat)."""
-        body = request.get_json(silent=True) or {}
+        if not hs_authorized(request.headers.get("Authorization", ""),
+                             request.args.get("access_token"), cfg.hs_token):
+            return jsonify({}), 401
+
+        if not bridge.warmup.ready:
+            return _warming_up()
+
+        raw = request.get_data(cache=False)
         try:
-            bridge.handle_matrix_transaction(body)
+            bridge.handle_raw_transaction(raw)
+        except PoolExhausted as e:
+            logger.warning(f"Transaction {txn_id} deferred: {e}")
+            return jsonify({"error": "busy"}), 503, {"Retry-After": "1"}
         except Exception as e:
             logger.error(f"Transaction error: {e}", exc_info=True)
         return jsonify({})
@@ -131,6 +201,9 @@ def create_app(config_path: str = None) -> Flask:
         if not secret or not cryptographic_equals(secret, cfg.bridge_secret):
             return jsonify({"error": "unauthorized"}), 401
 
+        if not bridge.warmup.ready:
+            return _warming_up()
+
         evt = request.get_json(silent=True)
         if not evt:
             return jsonify({"error": "invalid payload"}), 400
@@ -142,8 +215,14 @@ def create_app(config_path: str = None) -> Flask:
                     sender_uuid=evt["from_uuid"],
                     sender_name=evt["from_name"],
                     message=evt["message"],
+                    trace_id=request.headers.get(TRACE_HEADER) or None,
+                    tap_ts_ms=parse_ts_ms(request.headers.get(TRACE_TS_HEADER)),
+                    region_url=evt.get("region_url"),
                 )
                 return jsonify({"ok": True})
+            except PoolExhausted as e:
+                logger.warning(f"OS event deferred: {e}")
+                return jsonify({"error": "busy"}), 503, {"Retry-After": "1"}
             except Exception as e:
                 logger.error(f"OS event error: {e}", exc_info=True)
                 return jsonify({"error": str(e)}), 500
@@ -192,39 +271,219 @@ def create_app(config_path: str = None) -> Flask:
             logger.error(f"Resync error: {e}", exc_info=True)
             return jsonify({"error": str(e)}), 500
 
+    # ─── Admin: Bulk Enable / Resync ──────────────────
+    # NEW — onboarding a whole grid's groups in one call
+
+    def _ndjson(results):
+        """Stream result dicts as NDJSON, one flushed line per result."""
+        def lines():
+            for item in results:
+                yield json.dumps(item) + "\n"
+        return Response(stream_with_context(lines()),
+                        content_type="application/x-ndjson")
+
+    def _bulk_concurrency(data: dict) -> int:
+        """Requested Concurrency, capped; ValueError if not a positive integer."""
+        requested = data.get("Concurrency")
+        if requested is None:
+            return cfg.admin_bulk_concurrency
+        if isinstance(requested, int) and not isinstance(requested, bool):
+            n = requested
+        elif isinstance(requested, str) and requested.strip().isdigit():
+            n = int(requested)
+        else:
+            n = 0
+        if n < 1:
+            raise ValueError("Concurrency must be a positive integer")
+        return min(n, cfg.admin_bulk_concurrency)
+
+    @app.route("/admin/bridge/enable/bulk", methods=["POST"])
+    def admin_enable_bulk():
+        """
+        Enable bridges for many groups.
+
+        Body: {"Groups": [{"GroupUuid", "GroupName", "FounderAvatarUuid"}, ...],
+               "Concurrency": optional, capped at admin.bulk_concurrency}
+        """
+        secret = request.headers.get("X-Bridge-Secret", "")
+        if not cryptographic_equals(secret, cfg.bridge_secret):
+            return jsonify({"error": "unauthorized"}), 401
+
+        data = request.get_json(silent=True) or {}
+        items = data.get("Groups")
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "Groups required"}), 400
+        if len(items) > cfg.admin_bulk_max_groups:
+            return jsonify({"error": f"at most {cfg.admin_bulk_max_groups} "
+                                     f"groups per request"}), 400
+        try:
+            groups = [{
+                "group_uuid": g["GroupUuid"],
+                "group_name": g["GroupName"],
+                "founder_avatar_uuid": g["FounderAvatarUuid"],
+            } for g in items]
+        except (KeyError, TypeError) as e:
+            return jsonify({"error": f"missing field: {e}"}), 400
+
+        try:
+            concurrency = _bulk_concurrency(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return _ndjson(bridge.enable_bridges(groups, concurrency))
+
+    @app.route("/admin/bridge/resync/bulk", methods=["POST"])
+    def admin_resync_bulk():
+        """
+        Resync puppets for many groups.
+
+        Body: {"GroupUuids": [...], "Concurrency": optional}
+        """
+        secret = request.headers.get("X-Bridge-Secret", "")
+        if not cryptographic_equals(secret, cfg.bridge_secret):
+            return jsonify({"error": "unauthorized"}), 401
+
+        data = request.get_json(silent=True) or {}
+        group_uuids = data.get("GroupUuids")
+        if not isinstance(group_uuids, list) or not group_uuids:
+            return jsonify({"error": "GroupUuids required"}), 400
+        if len(group_uuids) > cfg.admin_bulk_max_groups:
+            return jsonify({"error": f"at most {cfg.admin_bulk_max_groups} "
+                                     f"groups per request"}), 400
+
+        try:
+            concurrency = _bulk_concurrency(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return _ndjson(bridge.resync_groups(group_uuids, concurrency))
+
     # ─── Admin: Status ────────────────────────────────
     # NEW — not in Fiona's bridge, but useful for ops
 
     @app.route("/admin/status", methods=["GET"])
     def admin_status():
         """Bridge status overview."""
+        secret = request.headers.get("X-Bridge-Secret", "")
+        if not cryptographic_equals(secret, cfg.bridge_secret):
+            return jsonify({"error": "unauthorized"}), 401
+
         return jsonify({
             "service": "lighthouse-bridge",
             "version": "0.1.0",
             "homeserver": cfg.homeserver,
             "bot": cfg.bot_mxid,
+            "db_pools": bridge.pool_stats(),
+            "member_names": bridge.member_stats(),
+            "tracing": bridge.tracer.stats(),
+            "regions": bridge.regions.stats(),
+            "startup": bridge.warmup.status(),
         })
 
+    # ─── Admin: Live Profiling ────────────────────────
+    # NEW — sample a production worker under real load
+
+    profiler = SamplingProfiler(method_codes(BridgeService))
+
+    @app.route("/admin/profile", methods=["POST"])
+    def admin_profile():
+        """
+        Sample this worker for `seconds` (blocks until done).
+
+        Query parameters:
+          seconds — run time (default 10, max admin.profile_max_seconds)
+          hz      — samples per second (default 100, max 1000)
+          scope   — service (default: stacks through BridgeService) or all
+          format  — json (default) or collapsed (plain text for flamegraphs)
+        """
+        secret = request.headers.get("X-Bridge-Secret", "")
+        if not cryptographic_equals(secret, cfg.bridge_secret):
+            return jsonify({"error": "unauthorized"}), 401
+
+        try:
+            seconds = float(request.args.get("seconds", 10))
+            hz = int(request.args.get("hz", 100))
+        except ValueError as e:
+            return jsonify({"error": f"bad parameter: {e}"}), 400
+        seconds = max(0.1, min(seconds, cfg.admin_profile_max_seconds))
+        hz = max(1, min(hz, 1000))
+
+        try:
+            result = profiler.run(seconds, hz,
+                                  service_only=request.args.get("scope") != "all")
+        except ProfilerBusy as e:
+            return jsonify({"error": str(e)}), 409
+
+        if request.args.get("format") == "collapsed":
+            return Response(result["collapsed"] + "\n", content_type="text/plain")
+        return jsonify({"pid": os.getpid(), **result})
+
     # ─── Admin: List Bridges ──────────────────────────
     # NEW — useful for management
 
     @app.route("/admin/bridge/list", methods=["GET"])
     def admin_list_bridges():
-        """List all active bridges."""
+        """
+        List bridges, keyset-paginated by group_uuid.
+
+        Query parameters:
+          cursor       — next_cursor from the previous page
+          limit        — rows per page (default 100, max 1000)
+          fields       — comma-separated columns (group_uuid always included)
+          enabled      — 1 (default), 0 or all
+          enabled_by   — founder avatar UUID
+          since, until — enabled_at range, YYYY-MM-DD[ HH:MM:SS] UTC, inclusive
+          format       — json (default) or ndjson: stream every matching
+                         row from the cursor on, `limit` rows per fetch
+        """
         secret = request.headers.get("X-Bridge-Secret", "")
         if not cryptographic_equals(secret, cfg.bridge_secret):
             return jsonify({"error": "unauthorized"}), 401
 
-        conn = bridge._db()
+        args = request.args
+        fields = [c.strip() for c in args.get("fields", "").split(",") if c.strip()]
+        unknown = [c for c in fields if c not in BRIDGE_COLUMNS]
+        if unknown:
+            return jsonify({"error": f"unknown field: {unknown[0]}"}), 400
+        columns = ("group_uuid",) + tuple(
+            c for c in (fields or BRIDGE_COLUMNS) if c != "group_uuid")
+
+        enabled = args.get("enabled", "1")
+        if enabled not in ("0", "1", "all"):
+            return jsonify({"error": "enabled must be 0, 1 or all"}), 400
         try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute(
-                "SELECT * FROM group_bridge_state WHERE enabled=1"
-            )
-            rows = cursor.fetchall()
-            return jsonify({"bridges": rows, "count": len(rows)})
-        finally:
-            conn.close()
+            limit = int(args.get("limit", LIST_DEFAULT_LIMIT))
+            since = _parse_when(args.get("since"))
+            until = _parse_when(args.get("until"), end_of_day=True)
+        except ValueError as e:
+            return jsonify({"error": f"bad parameter: {e}"}), 400
+
+        f = BridgeFilter(
+            after=args.get("cursor", ""),
+            limit=max(1, min(limit, LIST_MAX_LIMIT)),
+            enabled=None if enabled == "all" else int(enabled),
+            enabled_by=args.get("enabled_by") or None,
+            since=since,
+            until=until,
+        )
+
+        if args.get("format") == "ndjson":
+            def walk(f):
+                count = 0
+                while True:
+                    rows, source = bridge.list_bridges_page(f, columns)
+                    yield from rows
+                    count += len(rows)
+                    if len(rows) < f.limit:
+                        break
+                    f = f._replace(after=rows[-1]["group_uuid"])
+                yield {"done": True, "count": count, "source": source}
+            return _ndjson(walk(f))
+
+        rows, source = bridge.list_bridges_page(f, columns)
+        next_cursor = rows[-1]["group_uuid"] if len(rows) == f.limit else None
+        return jsonify({"bridges": rows, "count": len(rows),
+                        "next_cursor": next_cursor, "source": source})
 
     # ─── Future: OAR Download Trigger ─────────────────
     # Placeholder for region backup management
@@ -246,4 +505,15 @@ def create_app(config_path: str = None) -> Flask:
     def health():
         return jsonify({"status": "ok", "service": "lighthouse-bridge"})
 
+    # ─── Readiness Probe ──────────────────────────────
+    # NEW — keep load balancers off a worker that is still warming up
+
+    @app.route("/ready", methods=["GET"])
+    def ready():
+        status = bridge.warmup.status()
+        if status["ready"]:
+            return jsonify({"status": "ready", "pid": os.getpid(), **status})
+        return (jsonify({"status": "warming_up", "pid": os.getpid(), **status}),
+                503, {"Retry-After": "1"})
+
     return app
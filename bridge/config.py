@@ -45,6 +45,32 @@ class Config:
             f"database={self.db_name}&user={self.db_user}&"
             f"password={self.db_password}"
         )
+        self.db_pool_size = db.get("pool_size", 5)
+        self.db_pool_wait_timeout = db.get("pool_wait_timeout", 10)
+
+        # OpenSim groups database (os_groups_*) — defaults to the bridge DB.
+        # Point this at a read replica to keep membership scans off the
+        # bridge-state pool.
+        g = d.get("groups_database", {})
+        self.groups_db_host = g.get("host", self.db_host)
+        self.groups_db_port = g.get("port", self.db_port)
+        self.groups_db_name = g.get("name", self.db_name)
+        self.groups_db_user = g.get("user", self.db_user)
+        self.groups_db_password = g.get("password", self.db_password)
+        self.groups_db_pool_size = g.get("pool_size", self.db_pool_size)
+        self.groups_db_pool_wait_timeout = g.get(
+            "pool_wait_timeout", self.db_pool_wait_timeout
+        )
+
+        # Bridge-owned state tables: "mysql" (the database above) or an
+        # embedded "sqlite" file. os_groups_* always come from MySQL.
+        st = d.get("state_store", {})
+        self.state_backend = st.get("backend", "mysql")
+        self.state_db_path = st.get("path", "./data/bridge-state.db")
+        self.state_auto_migrate = st.get("auto_migrate", True)
+        # Seconds the in-memory group ↔ room index is trusted before it
+        # reloads (picks up bridges enabled by other processes)
+        self.state_index_ttl = st.get("index_ttl", 30)
 
         # Avatar
         av = d.get("avatar", {})
@@ -59,6 +85,60 @@ class Config:
         self.opensim_port = s.get("opensim_port", 9010)
         self.opensim_host = s.get("opensim_host", "0.0.0.0")
         self.log_level = s.get("log_level", "INFO")
+        # Request threads per listener (excess connections wait in the
+        # accept backlog) and the per-socket read/write timeout
+        self.server_threads = s.get("threads", 32)
+        self.server_socket_timeout = s.get("socket_timeout", 30)
+        # >1 forks workers sharing both ports (SO_REUSEPORT), with rooms
+        # pinned to workers by hash; run_dir holds their Unix sockets
+        self.server_workers = s.get("workers", 1)
+        self.server_run_dir = s.get("run_dir", "./data/run")
+        # With workers > 1: "reuseport" (workers share the ports) or
+        # "sharded" (one dispatcher feeds per-worker ordered queues)
+        self.server_mode = s.get("mode", "reuseport")
+        self.server_shard_lanes = s.get("shard_lanes", 4)
+        self.server_shard_queue_size = s.get("shard_queue_size", 10000)
+        self.server_shard_ack_timeout = s.get("shard_ack_timeout", 30)
+
+        # Start-up warm-up (see bridge/warmup.py): a failing step is retried
+        # with backoff up to this many seconds apart; /ready stays 503
+        # until every step is done or give_up_after has passed
+        st_up = d.get("startup", {})
+        self.startup_retry_max = st_up.get("retry_max", 30)
+        self.startup_give_up_after = st_up.get("give_up_after", 120)
+        # Longest /ready wait the sharded dispatcher allows per worker
+        self.startup_ready_timeout = st_up.get("ready_timeout", 2)
+
+        # Matrix → OpenSim injection routing (see bridge/regions.py)
+        r = d.get("regions", {})
+        self.regions_mode = r.get("mode", "failover")
+        self.regions_default = r.get("default", []) or []
+        self.regions_groups = r.get("groups", {}) or {}
+        self.regions_learn = r.get("learn", True)
+        self.regions_learn_ttl = r.get("learn_ttl", 86400)
+        self.regions_max_learned = r.get("max_learned", 4)
+        self.regions_cooldown = r.get("cooldown", 5)
+        self.regions_max_parallel = r.get("max_parallel", 8)
+        self.regions_timeout = r.get("timeout", 10)
+
+        # Message tracing (local span log, see bridge/trace.py)
+        t = d.get("trace", {})
+        self.trace_enabled = t.get("enabled", True)
+        self.trace_dir = t.get("dir", "./data/trace")
+        self.trace_sample_rate = t.get("sample_rate", 0.01)
+        self.trace_slow_ms = t.get("slow_ms", 2000)
+        self.trace_max_mb = t.get("max_mb", 20)
+        self.trace_backups = t.get("backups", 5)
+        self.trace_keep_days = t.get("keep_days", 7)
+
+        # Admin API
+        a = d.get("admin", {})
+        # Groups provisioned/resynced at once by the bulk endpoints
+        self.admin_bulk_concurrency = a.get("bulk_concurrency", 16)
+        self.admin_bulk_max_groups = a.get("bulk_max_groups", 1000)
+        # /admin/profile holds its request open for the whole run; keep
+        # this under gunicorn's --timeout (30s by default)
+        self.admin_profile_max_seconds = a.get("profile_max_seconds", 20)
 
         # Validate critical fields
         for field in ["as_token", "hs_token", "bridge_secret"]:
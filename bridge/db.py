@@ -0,0 +1,163 @@
+"""
+Lighthouse Bridge — Database Pools
+Sized, instrumented MySQL connection pools.
+
+The bridge talks to two datasets that may live on different servers:
+- bridge state (group_bridge_state, avatar_mxid_map, ...) — read/write
+- OpenSim groups tables (os_groups_*) — read-only, may be a replica
+
+Each gets its own DBPool so a slow os_groups_membership scan can never
+hold the connections that bridge-state lookups need.
+
+Pools connect lazily: nothing touches MySQL until the first checkout or
+an explicit prefill() (the start-up warm-up calls it in the background),
+so a database hiccup at boot can't take the worker down with it.
+"""
+
+import logging
+import threading
+import time
+from mysql.connector import pooling
+
+logger = logging.getLogger("lighthouse.db")
+
+
+class PoolExhausted(Exception):
+    """No connection became free within the pool's wait timeout."""
+
+
+class DBPool:
+    """
+    MySQLConnectionPool wrapper that queues callers instead of failing.
+
+    mysql-connector raises PoolError the moment every connection is
+    checked out. Here callers wait on a semaphore (up to wait_timeout
+    seconds) for a slot, and wait/checkout times are recorded for
+    /admin/status.
+
+    The underlying pool (which opens all `size` connections at once) is
+    created on first use. If that fails, the next caller tries again.
+    """
+
+    def __init__(self, name: str, *, size: int, wait_timeout: float,
+                 host: str, port: int, database: str, user: str,
+                 password: str):
+        self.name = name
+        self.size = size
+        self._wait_timeout = wait_timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._connect_args = dict(host=host, port=port, database=database,
+                                  user=user, password=password)
+        self._pool = None
+        self._connect_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._held_total = 0.0
+        self._held_max = 0.0
+
+    def _connected(self):
+        pool = self._pool
+        if pool is not None:
+            return pool
+        with self._connect_lock:
+            if self._pool is None:
+                args = self._connect_args
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name=self.name, pool_size=self.size, **args)
+                logger.info(f"DB pool '{self.name}' ready: {args['user']}@"
+                            f"{args['host']}:{args['port']}/{args['database']} "
+                            f"(size={self.size})")
+            return self._pool
+
+    def prefill(self):
+        """Open all connections now instead of on the first checkout."""
+        self._connected()
+
+    @property
+    def connected(self) -> bool:
+        return self._pool is not None
+
+    def get_connection(self):
+        """Check out a connection, waiting for a free slot if needed."""
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self._wait_timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolExhausted(
+                f"DB pool '{self.name}' exhausted: no connection free "
+                f"after {self._wait_timeout}s"
+            )
+
+        try:
+            conn = self._connected().get_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        if waited > 0.1:
+            logger.debug(f"DB pool '{self.name}': waited {waited * 1000:.1f}ms")
+
+        return _Checkout(self, conn)
+
+    def _checkin(self, held: float):
+        with self._lock:
+            self._in_use -= 1
+            self._held_total += held
+            self._held_max = max(self._held_max, held)
+        self._slots.release()
+
+    def stats(self) -> dict:
+        """Snapshot of pool usage counters (times in milliseconds)."""
+        with self._lock:
+            n = self._checkouts or 1
+            return {
+                "size": self.size,
+                "connected": self._pool is not None,
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": round(self._wait_total / n * 1000, 2),
+                "wait_max_ms": round(self._wait_max * 1000, 2),
+                "held_avg_ms": round(self._held_total / n * 1000, 2),
+                "held_max_ms": round(self._held_max * 1000, 2),
+            }
+
+
+class _Checkout:
+    """A pooled connection; close() returns it and records hold time."""
+
+    def __init__(self, pool: DBPool, conn):
+        self._owner = pool
+        self._conn = conn
+        self._since = time.monotonic()
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._conn.close()
+        finally:
+            self._owner._checkin(time.monotonic() - self._since)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,89 @@
+"""
+Lighthouse Bridge — Transaction Ingest
+Fast path from a raw AppService transaction body to the few events the
+bridge acts on.
+
+Conduit batches everything the appservice can see: typing, receipts,
+membership, state and messages. The bridge acts on two types from real
+(non-puppet) users in bridged rooms:
+- m.room.message, to relay;
+- m.room.member, to keep the display-name cache in members.py current.
+
+This module:
+
+- skips decoding entirely when the body holds no wanted event type
+  (a plain substring check on the raw bytes),
+- decodes with orjson when it is installed (optional dependency),
+- filters by type, sender prefix and room before any per-event work.
+
+Member events are everywhere: joins, leaves and profile changes, plus
+the puppets' own joins. Most busy transactions therefore contain one,
+and the substring check alone rarely lets them skip decoding. Only
+pure typing/receipt/presence/state traffic takes the no-decode path.
+See benchmarks/bench_ingest.py.
+"""
+
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:     # optional: pip install orjson
+    orjson = None
+
+logger = logging.getLogger("lighthouse.ingest")
+
+MESSAGE_TYPES = ("m.room.message",)
+MEMBER_TYPES = ("m.room.member",)
+# Everything the bridge consumes: messages to relay, member events to keep
+# the display-name cache current
+RELAY_TYPES = MESSAGE_TYPES + MEMBER_TYPES
+
+
+def loads(raw: bytes):
+    """Decode JSON bytes with orjson if available, else the stdlib."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def filter_events(events, types: tuple, skip_senders: tuple,
+                  room_filter=None) -> list[dict]:
+    """
+    Keep events whose type is in `types`, whose sender does not start with
+    any of `skip_senders`, and (if given) whose room passes room_filter.
+    """
+    out = []
+    if not isinstance(events, list):
+        return out
+    for ev in events:
+        if not isinstance(ev, dict) or ev.get("type") not in types:
+            continue
+        if ev.get("sender", "").startswith(skip_senders):
+            continue
+        if room_filter is not None and not room_filter(ev.get("room_id", "")):
+            continue
+        out.append(ev)
+    return out
+
+
+def parse_transaction(raw: bytes, types: tuple = RELAY_TYPES,
+                      skip_senders: tuple = (), room_filter=None) -> list[dict]:
+    """Raw transaction body → wanted events (empty list if none)."""
+    if not raw:
+        return []
+
+    # Most transactions are typing/receipt/presence noise: if no wanted
+    # type name appears anywhere in the body, don't decode it at all.
+    if not any(f'"{t}"'.encode() in raw for t in types):
+        return []
+
+    try:
+        doc = loads(raw)
+    except ValueError:
+        logger.warning("Dropping transaction with invalid JSON body")
+        return []
+    if not isinstance(doc, dict):
+        return []
+
+    return filter_events(doc.get("events"), types, skip_senders, room_filter)
@@ -0,0 +1,127 @@
+"""
+Lighthouse Bridge — Member Display Names
+Per-room cache of Matrix display names for Matrix → OpenSim relay.
+
+Conduit rarely sets unsigned.sender_display_name, and a /profile lookup
+per message would add a homeserver round-trip to every relay. Instead:
+
+- the first message from a room fills its member list once, in bulk,
+  from /joined_members;
+- m.room.member events in later transactions keep it current
+  (joins, display-name changes, leaves, kicks and bans).
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("lighthouse.members")
+
+# Memberships that keep a user in the room's name map
+_PRESENT = ("join",)
+
+
+class MemberNameCache:
+    """
+    room_id → {mxid: display_name} with LRU eviction by room.
+
+    fetch_joined(room_id) must return {mxid: display_name_or_None} for the
+    room's joined members, or None if the lookup failed.
+    """
+
+    def __init__(self, fetch_joined, max_rooms: int = 2000,
+                 retry_after: float = 60.0):
+        self._fetch = fetch_joined
+        self._max_rooms = max_rooms
+        self._retry_after = retry_after
+        self._rooms: OrderedDict[str, dict] = OrderedDict()
+        # room_id → last failed fill, oldest first
+        self._failed: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._fill_locks: dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.fills = 0
+
+    def observe(self, ev: dict):
+        """Apply an m.room.member event to a room we already hold."""
+        room_id = ev.get("room_id", "")
+        user_id = ev.get("state_key")
+        if not user_id:
+            return
+        content = ev.get("content") or {}
+        with self._lock:
+            names = self._rooms.get(room_id)
+            if names is None:
+                return      # not cached yet; the bulk fill will include it
+            if content.get("membership") in _PRESENT:
+                names[user_id] = content.get("displayname") or None
+            else:
+                names.pop(user_id, None)
+
+    def display_name(self, room_id: str, user_id: str) -> str | None:
+        """Cached display name, filling the room on first use."""
+        with self._lock:
+            names = self._rooms.get(room_id)
+            if names is not None:
+                self._rooms.move_to_end(room_id)
+                self.hits += 1
+                return names.get(user_id)
+
+        names = self._fill(room_id)
+        return names.get(user_id) if names else None
+
+    def forget(self, room_id: str):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+    def _fill(self, room_id: str) -> dict | None:
+        # One bulk /joined_members per room, even under concurrent misses
+        with self._lock:
+            failed_at = self._failed.get(room_id)
+            if failed_at and time.monotonic() - failed_at < self._retry_after:
+                return None
+            fill_lock = self._fill_locks.setdefault(room_id, threading.Lock())
+
+        with fill_lock:
+            with self._lock:
+                if room_id in self._rooms:
+                    return self._rooms[room_id]
+                failed_at = self._failed.get(room_id)
+                if failed_at and time.monotonic() - failed_at < self._retry_after:
+                    return None
+
+            names = self._fetch(room_id)
+
+            with self._lock:
+                self._fill_locks.pop(room_id, None)
+                if names is None:
+                    self._note_failure(room_id)
+                    return None
+                self._failed.pop(room_id, None)
+                self._rooms[room_id] = names
+                self.fills += 1
+                while len(self._rooms) > self._max_rooms:
+                    self._rooms.popitem(last=False)
+                return names
+
+    def _note_failure(self, room_id: str):
+        # Called with self._lock held. Expired entries are dropped from the
+        # front, and the map is capped like _rooms.
+        now = time.monotonic()
+        self._failed[room_id] = now
+        self._failed.move_to_end(room_id)
+        while self._failed and (
+                len(self._failed) > self._max_rooms
+                or now - next(iter(self._failed.values())) >= self._retry_after):
+            self._failed.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rooms": len(self._rooms),
+                "members": sum(len(n) for n in self._rooms.values()),
+                "hits": self.hits,
+                "fills": self.fills,
+                "failed_rooms": len(self._failed),
+            }
@@ -0,0 +1,127 @@
+"""
+Lighthouse Bridge — Schema Migrations
+Versioned changes to the bridge-owned tables.
+
+Each migration has MySQL and SQLite variants and is recorded in a
+schema_version table once applied. Migrations run at startup (unless
+state_store.auto_migrate is off) or on demand:
+
+    python run.py migrate
+
+Never edit a released migration — append a new one.
+"""
+
+import logging
+from typing import NamedTuple
+
+logger = logging.getLogger("lighthouse.migrations")
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    mysql: tuple
+    sqlite: tuple
+
+
+MIGRATIONS = [
+    Migration(
+        1, "baseline bridge tables (schema.sql)",
+        mysql=(
+            """CREATE TABLE IF NOT EXISTS `group_bridge_state` (
+              `group_uuid` char(36) NOT NULL,
+              `enabled` tinyint(1) DEFAULT 0,
+              `room_id` varchar(128) DEFAULT NULL,
+              `enabled_by` char(36) DEFAULT NULL,
+              `enabled_at` datetime DEFAULT NULL,
+              PRIMARY KEY (`group_uuid`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+            """CREATE TABLE IF NOT EXISTS `avatar_mxid_map` (
+              `avatar_uuid` char(36) NOT NULL,
+              `mxid` varchar(128) NOT NULL,
+              `display_name` varchar(128) DEFAULT NULL,
+              `created_at` datetime DEFAULT current_timestamp(),
+              PRIMARY KEY (`avatar_uuid`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+            """CREATE TABLE IF NOT EXISTS `dedupe_events` (
+              `event_id` varchar(128) NOT NULL,
+              `seen_at` datetime DEFAULT current_timestamp(),
+              PRIMARY KEY (`event_id`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+            """CREATE TABLE IF NOT EXISTS `room_invites` (
+              `invite_code` varchar(32) NOT NULL,
+              `group_uuid` char(36) NOT NULL,
+              `room_id` varchar(128) NOT NULL,
+              `created_by` char(36) NOT NULL,
+              `expires_at` datetime DEFAULT NULL,
+              `uses_remaining` int(11) DEFAULT 1,
+              `created_at` datetime DEFAULT current_timestamp(),
+              PRIMARY KEY (`invite_code`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+        ),
+        sqlite=(
+            """CREATE TABLE IF NOT EXISTS group_bridge_state (
+              group_uuid TEXT NOT NULL PRIMARY KEY,
+              enabled    INTEGER DEFAULT 0,
+              room_id    TEXT DEFAULT NULL,
+              enabled_by TEXT DEFAULT NULL,
+              enabled_at TEXT DEFAULT NULL
+            )""",
+            """CREATE TABLE IF NOT EXISTS avatar_mxid_map (
+              avatar_uuid  TEXT NOT NULL PRIMARY KEY,
+              mxid         TEXT NOT NULL,
+              display_name TEXT DEFAULT NULL,
+              created_at   TEXT DEFAULT (datetime('now'))
+            )""",
+            """CREATE TABLE IF NOT EXISTS dedupe_events (
+              event_id TEXT NOT NULL PRIMARY KEY,
+              seen_at  TEXT DEFAULT (datetime('now'))
+            )""",
+            """CREATE TABLE IF NOT EXISTS room_invites (
+              invite_code    TEXT NOT NULL PRIMARY KEY,
+              group_uuid     TEXT NOT NULL,
+              room_id        TEXT NOT NULL,
+              created_by     TEXT NOT NULL,
+              expires_at     TEXT DEFAULT NULL,
+              uses_remaining INTEGER DEFAULT 1,
+              created_at     TEXT DEFAULT (datetime('now'))
+            )""",
+        ),
+    ),
+    Migration(
+        2, "hot-path indexes: room lookup, enabled listing, dedupe pruning",
+        # InnoDB secondary indexes carry the primary key, so
+        # (room_id, enabled) already covers SELECT group_uuid.
+        mysql=(
+            "CREATE INDEX `idx_gbs_room_enabled` "
+            "ON `group_bridge_state` (`room_id`, `enabled`)",
+            "CREATE INDEX `idx_gbs_enabled_group` "
+            "ON `group_bridge_state` (`enabled`, `group_uuid`)",
+            "CREATE INDEX `idx_dedupe_seen_at` "
+            "ON `dedupe_events` (`seen_at`)",
+        ),
+        # SQLite indexes carry the rowid, not the TEXT primary key, so
+        # group_uuid is listed explicitly to keep the lookup covering.
+        sqlite=(
+            "CREATE INDEX IF NOT EXISTS idx_gbs_room_enabled "
+            "ON group_bridge_state (room_id, enabled, group_uuid)",
+            "CREATE INDEX IF NOT EXISTS idx_gbs_enabled_group "
+            "ON group_bridge_state (enabled, group_uuid)",
+            "CREATE INDEX IF NOT EXISTS idx_dedupe_seen_at "
+            "ON dedupe_events (seen_at)",
+        ),
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def migrate(store) -> list[int]:
+    """Bring a state store up to LATEST_VERSION. Returns versions applied."""
+    applied = store.apply_migrations(MIGRATIONS)
+    by_version = {m.version: m for m in MIGRATIONS}
+    for version in applied:
+        m = by_version[version]
+        logger.info(f"Applied migration {version}: {m.description} "
+                    f"({store.backend})")
+    return applied
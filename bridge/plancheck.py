@@ -0,0 +1,206 @@
+"""
+Lighthouse Bridge — Query Plan Check
+EXPLAINs every hot query BridgeService runs and fails if any of them
+would scan a whole table (or a whole index), except the ones listed in
+EXPECTED_SCANS that read every row on purpose.
+
+By default the check runs against a throwaway SQLite database that is
+migrated to the latest schema and seeded with realistic row counts, so it
+needs no server and can run in CI:
+
+    python run.py check-plans            # seeded local DB
+    python run.py check-plans --mysql    # also EXPLAIN on the configured DBs
+
+The MySQL optimizer happily scans tiny tables, so --mysql results are only
+meaningful on a populated database.
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import uuid
+from typing import NamedTuple
+
+from .migrations import migrate
+from .service import GROUPS_SQL
+from .storage import (BRIDGE_COLUMNS, BridgeFilter, MySQLStateStore,
+                      SQLiteStateStore, bridge_page_sql)
+
+logger = logging.getLogger("lighthouse.plancheck")
+
+# os_groups_* with the same keys as schema.sql, for the local check
+OPENSIM_GROUPS_SQLITE = (
+    """CREATE TABLE os_groups_membership (
+      GroupID        TEXT NOT NULL DEFAULT '',
+      PrincipalID    TEXT NOT NULL DEFAULT '',
+      SelectedRoleID TEXT NOT NULL DEFAULT '',
+      PRIMARY KEY (GroupID, PrincipalID)
+    )""",
+    "CREATE INDEX PrincipalID ON os_groups_membership (PrincipalID)",
+    """CREATE TABLE os_groups_roles (
+      GroupID TEXT NOT NULL DEFAULT '',
+      RoleID  TEXT NOT NULL DEFAULT '',
+      Powers  INTEGER NOT NULL DEFAULT 0,
+      PRIMARY KEY (GroupID, RoleID)
+    )""",
+    "CREATE INDEX GroupID ON os_groups_roles (GroupID)",
+)
+
+_SAMPLE_UUID = "11111111-2222-3333-4444-555555555555"
+_SAMPLE_ROOM = "!sample:plan.check"
+
+
+class PlanResult(NamedTuple):
+    target: str
+    query: str
+    ok: bool
+    plan: str
+
+
+def _state_params(backend: str) -> dict:
+    return {
+        "room_for_group": (_SAMPLE_UUID,),
+        "group_for_room": (_SAMPLE_ROOM,),
+        "list_bridges": (),
+        "get_puppet": (_SAMPLE_UUID,),
+        "prune_events": ("-604800 seconds",) if backend == "sqlite" else (604800,),
+    }
+
+
+# Queries that read every matching row by design: BridgeIndex reloads all
+# enabled bridges once per index TTL, so a scan there is not a regression
+EXPECTED_SCANS = ("list_bridges",)
+
+
+# /admin/bridge/list pages (keyset on group_uuid)
+LIST_PAGES = {
+    "list_page": BridgeFilter(after=_SAMPLE_UUID),
+    "list_page_any": BridgeFilter(after=_SAMPLE_UUID, enabled=None),
+    "list_page_range": BridgeFilter(after=_SAMPLE_UUID,
+                                    since="2024-01-01 00:00:00",
+                                    until="2024-12-31 23:59:59"),
+}
+
+GROUPS_PARAMS = {
+    "member_power": (_SAMPLE_UUID, _SAMPLE_UUID),
+    "max_power": (_SAMPLE_UUID,),
+    "group_members": (_SAMPLE_UUID,),
+}
+
+
+# ─── Local seeded SQLite ────────────────────────────────
+
+def _seed(conn: sqlite3.Connection, groups: int, members_per_group: int):
+    for stmt in OPENSIM_GROUPS_SQLITE:
+        conn.execute(stmt)
+
+    bridges, puppets, members, roles = [], [], [], []
+    for i in range(groups):
+        group_uuid = str(uuid.uuid4())
+        bridges.append((group_uuid, i % 10 != 0, f"!r{i:06d}:plan.check",
+                        str(uuid.uuid4())))
+        role_ids = [str(uuid.uuid4()) for _ in range(3)]
+        roles += [(group_uuid, rid, p) for rid, p in zip(role_ids, (0, 1 << 20, 1 << 40))]
+        for j in range(members_per_group):
+            avatar = str(uuid.uuid4())
+            members.append((group_uuid, avatar, role_ids[j % 3]))
+            if j == 0:
+                puppets.append((avatar, f"@os_{avatar.replace('-', '')}:plan.check"))
+    events = [(f"$ev{i:07d}",) for i in range(groups * 10)]
+
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO group_bridge_state "
+        "(group_uuid, enabled, room_id, enabled_by, enabled_at) "
+        "VALUES (?, ?, ?, ?, datetime('now'))", bridges)
+    conn.executemany(
+        "INSERT INTO avatar_mxid_map (avatar_uuid, mxid) VALUES (?, ?)", puppets)
+    conn.executemany("INSERT INTO dedupe_events (event_id) VALUES (?)", events)
+    conn.executemany(
+        "INSERT INTO os_groups_membership (GroupID, PrincipalID, SelectedRoleID) "
+        "VALUES (?, ?, ?)", members)
+    conn.executemany(
+        "INSERT INTO os_groups_roles (GroupID, RoleID, Powers) VALUES (?, ?, ?)",
+        roles)
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+
+
+def _result(target, name, full_scan: bool, plan: str) -> PlanResult:
+    if full_scan and name in EXPECTED_SCANS:
+        return PlanResult(target, name, True, f"{plan} (expected scan)")
+    return PlanResult(target, name, not full_scan, plan)
+
+
+def _explain_sqlite(conn, target, name, sql, params) -> PlanResult:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    details = [r[3] for r in rows]
+    full_scan = any(d.startswith("SCAN ") for d in details)
+    return _result(target, name, full_scan, "; ".join(details))
+
+
+def check_sqlite(groups: int = 2000, members_per_group: int = 20) -> list[PlanResult]:
+    """EXPLAIN every hot query on a freshly migrated, seeded SQLite DB."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "plancheck.db")
+        store = SQLiteStateStore(path)
+        migrate(store)
+        store.close()
+
+        conn = sqlite3.connect(path, isolation_level=None)
+        try:
+            _seed(conn, groups, members_per_group)
+            results = []
+            for name, params in _state_params("sqlite").items():
+                results.append(_explain_sqlite(
+                    conn, "sqlite:state", name,
+                    SQLiteStateStore.SQL[name], params))
+            for name, f in LIST_PAGES.items():
+                results.append(_explain_sqlite(
+                    conn, "sqlite:state", name,
+                    *bridge_page_sql(f, BRIDGE_COLUMNS, "?")))
+            for name, params in GROUPS_PARAMS.items():
+                results.append(_explain_sqlite(
+                    conn, "sqlite:groups", name,
+                    GROUPS_SQL[name].replace("%s", "?"), params))
+            return results
+        finally:
+            conn.close()
+
+
+# ─── Configured MySQL ───────────────────────────────────
+
+def _explain_mysql(pool, target, name, sql, params) -> PlanResult:
+    conn = pool.get_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"EXPLAIN {sql}", params)
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+    # type=ALL is a table scan, type=index a full index scan
+    full_scan = any(r.get("type") in ("ALL", "index") for r in rows)
+    plan = "; ".join(
+        f"{r.get('table')}: type={r.get('type')} key={r.get('key')}"
+        for r in rows
+    )
+    return _result(target, name, full_scan, plan)
+
+
+def check_mysql(state_pool, groups_pool) -> list[PlanResult]:
+    """EXPLAIN every hot query on the configured MySQL databases."""
+    results = []
+    if state_pool is not None:
+        for name, params in _state_params("mysql").items():
+            results.append(_explain_mysql(
+                state_pool, "mysql:state", name,
+                MySQLStateStore.SQL[name], params))
+        for name, f in LIST_PAGES.items():
+            results.append(_explain_mysql(
+                state_pool, "mysql:state", name,
+                *bridge_page_sql(f, BRIDGE_COLUMNS, "%s")))
+    for name, params in GROUPS_PARAMS.items():
+        results.append(_explain_mysql(
+            groups_pool, "mysql:groups", name, GROUPS_SQL[name], params))
+    return results
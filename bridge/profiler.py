@@ -0,0 +1,167 @@
+"""
+Lighthouse Bridge — Live Profiler
+On-demand sampling profiler for a running worker (POST /admin/profile).
+
+Nothing is installed while idle: no trace hooks, no extra thread. A
+profiling request samples every other thread's stack from the request's
+own thread, `hz` times a second for `seconds`, then stops. It returns:
+
+- collapsed stacks ("thread;module.func;module.func count" per line) that
+  flamegraph.pl, speedscope or inferno read as-is;
+- per-BridgeService-method wall-clock vs CPU time. A method's wall time is
+  the time threads spent inside it (callees included). Its CPU time is
+  what those threads burned over the same samples. The gap is blocking:
+  HTTP round-trips, pool waits, locks.
+
+Only one session runs per process at a time. Per-thread CPU clocks need
+Linux. Elsewhere the CPU columns are omitted.
+"""
+
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger("lighthouse.profiler")
+
+_TRAILING_NUMBER = re.compile(r"[-_ ]?\d+$")
+
+
+class ProfilerBusy(Exception):
+    """A profiling session is already running in this process."""
+
+
+def method_codes(cls) -> dict:
+    """code object → "Class.method" for every plain method defined on cls."""
+    codes = {}
+    for name, attr in vars(cls).items():
+        code = getattr(attr, "__code__", None)
+        if code is not None:
+            codes[code] = f"{cls.__name__}.{name}"
+    return codes
+
+
+def _thread_cpu(ident: int) -> float | None:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+
+class SamplingProfiler:
+    """Samples sys._current_frames() for a fixed duration on demand."""
+
+    def __init__(self, targets: dict):
+        self._targets = targets
+        self._lock = threading.Lock()
+        self._labels: dict = {}
+
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            module = code.co_filename.rsplit("/", 1)[-1].removesuffix(".py")
+            label = f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+            self._labels[code] = label
+        return label
+
+    def run(self, seconds: float, hz: int = 100,
+            service_only: bool = True) -> dict:
+        """
+        Sample for `seconds`. With service_only, keep only stacks that pass
+        through a BridgeService method (drops idle listener threads).
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("a profiling session is already running")
+        try:
+            return self._run(seconds, hz, service_only)
+        finally:
+            self._lock.release()
+
+    def _run(self, seconds: float, hz: int, service_only: bool) -> dict:
+        me = threading.get_ident()
+        interval = 1.0 / hz
+        stacks: Counter = Counter()
+        samples: Counter = Counter()
+        wall: Counter = Counter()
+        cpu: Counter = Counter()
+        last_cpu: dict[int, float] = {}
+        names: dict[int, str] = {}
+        has_cpu = hasattr(time, "pthread_getcpuclockid")
+
+        logger.info(f"Profiling for {seconds}s at {hz} Hz")
+        own_cpu0 = time.thread_time()
+        started = last = time.monotonic()
+        deadline = started + seconds
+        next_at = started
+        ticks = 0
+
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            dt = now - last
+            last = now
+            ticks += 1
+
+            if ticks % hz == 1 or not names:
+                names = {t.ident: _TRAILING_NUMBER.sub("", t.name)
+                         for t in threading.enumerate()}
+
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                delta = 0.0
+                if has_cpu:
+                    c = _thread_cpu(ident)
+                    if c is not None:
+                        delta = c - last_cpu.get(ident, c)
+                        last_cpu[ident] = c
+
+                frames, hit = [], set()
+                f = frame
+                while f is not None:
+                    code = f.f_code
+                    frames.append(self._label(code))
+                    method = self._targets.get(code)
+                    if method is not None:
+                        hit.add(method)
+                    f = f.f_back
+                if service_only and not hit:
+                    continue
+
+                frames.append(names.get(ident, "thread"))
+                stacks[";".join(reversed(frames))] += 1
+                if ticks > 1:
+                    for method in hit:
+                        samples[method] += 1
+                        wall[method] += dt
+                        cpu[method] += delta
+
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+        elapsed = time.monotonic() - started
+        methods = []
+        for method, w in wall.most_common():
+            row = {"method": method, "samples": samples[method],
+                   "wall_ms": round(w * 1000, 1)}
+            if has_cpu:
+                c = min(cpu[method], w)
+                row["cpu_ms"] = round(c * 1000, 1)
+                row["blocked_pct"] = round(100 * (1 - c / w), 1) if w else 0.0
+            methods.append(row)
+
+        return {
+            "seconds": round(elapsed, 2),
+            "hz": hz,
+            "ticks": ticks,
+            "overhead_cpu_ms": round((time.thread_time() - own_cpu0) * 1000, 1),
+            "methods": methods,
+            "collapsed": "\n".join(
+                f"{stack} {n}" for stack, n in stacks.most_common()),
+        }
@@ -0,0 +1,251 @@
+"""
+Lighthouse Bridge — Region Routing
+Which simulators inject Matrix messages into each OpenSim group, and how
+healthy each one is.
+
+Candidate regions for a group come from three places, in this order:
+
+- configured: regions.groups maps a group_uuid to region URLs;
+- learned: the source region of the group's recent /os/event traffic
+  (TryMatrixBridgeTap resolves the sender's region to its URL);
+- default: regions.default, or opensim.region_url if that is unset (and
+  opensim.region_url whenever the list would otherwise be empty).
+
+URLs are compared by identity, not spelling: scheme and host are
+lower-cased, default ports and trailing slashes dropped, and host names
+resolved (cached for a few minutes), so "http://Sim1:9000/" and
+"http://10.0.0.5:9000" are one region with one health record and get a
+message once. The first spelling seen is the one requests go to.
+
+Each region URL has a health record: an EWMA of its success rate and
+latency, and a circuit that opens after consecutive failures. An open
+circuit blocks the region for a cooldown that doubles with each further
+failure. Healthy regions are tried first, best score first.
+
+Delivery (regions.mode):
+  failover — whole-group injection through the best region. On failure
+             the next candidate is tried.
+  fanout   — every healthy candidate gets the message in parallel with
+             scope "local", so each simulator delivers to the avatars
+             on it. If none of them accepts, it falls back to failover.
+"""
+
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("lighthouse.regions")
+
+_EWMA_ALPHA = 0.2
+# A failed injection counts as at least this slow, so a region that fails
+# fast never outranks one that delivers
+_FAILURE_LATENCY_MS = 1000.0
+# Seconds a host name → address lookup is reused for region identity
+_RESOLVE_TTL = 300.0
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Region URL with lower-case scheme/host, no default port or trailing /."""
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "http").lower()
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port == _DEFAULT_PORTS.get(scheme):
+        port = None
+    netloc = f"[{host}]" if ":" in host else host
+    if port is not None:
+        netloc += f":{port}"
+    return f"{scheme}://{netloc}{parts.path.rstrip('/')}"
+
+
+def _resolve(host: str) -> str:
+    """Host → address (IPv4 preferred); the name itself if it won't resolve."""
+    for family in (socket.AF_INET, socket.AF_UNSPEC):
+        try:
+            return socket.getaddrinfo(host, None, family,
+                                      socket.SOCK_STREAM)[0][4][0]
+        except (OSError, UnicodeError):
+            continue
+    return host
+
+
+class RegionHealth:
+    """Rolling health of one region URL."""
+
+    def __init__(self, url: str, base_cooldown: float, max_cooldown: float):
+        self.url = url
+        self.ok_rate = 1.0
+        self.latency_ms = 0.0
+        self.failures = 0           # consecutive
+        self.open_until = 0.0
+        self.sent = 0
+        self.failed = 0
+        self._base_cooldown = base_cooldown
+        self._max_cooldown = max_cooldown
+
+    def available(self, now: float) -> bool:
+        return now >= self.open_until
+
+    def score(self) -> float:
+        return self.ok_rate * 1000 / (self.latency_ms + 50)
+
+    def record(self, ok: bool, latency_ms: float, now: float):
+        self.sent += 1
+        if not ok:
+            latency_ms = max(latency_ms, _FAILURE_LATENCY_MS)
+        self.ok_rate += _EWMA_ALPHA * ((1.0 if ok else 0.0) - self.ok_rate)
+        self.latency_ms += _EWMA_ALPHA * (latency_ms - self.latency_ms)
+        if ok:
+            self.failures = 0
+            self.open_until = 0.0
+            return
+        self.failed += 1
+        self.failures += 1
+        if self.failures >= 3:
+            cooldown = min(self._base_cooldown * 2 ** (self.failures - 3),
+                           self._max_cooldown)
+            self.open_until = now + cooldown
+            logger.warning(f"Region {self.url} marked down for {cooldown:.0f}s "
+                           f"({self.failures} consecutive failures)")
+
+    def as_dict(self, now: float) -> dict:
+        return {
+            "url": self.url,
+            "up": self.available(now),
+            "score": round(self.score(), 2),
+            "ok_rate": round(self.ok_rate, 3),
+            "latency_ms": round(self.latency_ms, 1),
+            "sent": self.sent,
+            "failed": self.failed,
+        }
+
+
+class RegionRegistry:
+    """group_uuid → candidate region URLs, plus per-region health."""
+
+    def __init__(self, default: list[str], configured: dict[str, list[str]],
+                 *, fallback: str = "", learn: bool = True,
+                 learn_ttl: float = 86400, max_learned: int = 4,
+                 base_cooldown: float = 5, max_cooldown: float = 300):
+        self._lock = threading.Lock()
+        self._resolved: dict[str, tuple[str, float]] = {}   # host → (addr, at)
+        self._urls: dict[str, str] = {}     # identity → URL requests go to
+        self._default = self._canonical_all(default)
+        if not self._default and fallback:
+            self._default = self._canonical_all([fallback])
+        self._configured = {
+            g: self._canonical_all(urls) for g, urls in configured.items()
+        }
+        self._learn = learn
+        self._learn_ttl = learn_ttl
+        self._max_learned = max_learned
+        self._base_cooldown = base_cooldown
+        self._max_cooldown = max_cooldown
+        self._learned: dict[str, OrderedDict[str, float]] = {}
+        self._health: dict[str, RegionHealth] = {}
+
+    @classmethod
+    def from_config(cls, cfg) -> "RegionRegistry":
+        return cls(
+            cfg.regions_default,
+            cfg.regions_groups,
+            fallback=cfg.region_url,
+            learn=cfg.regions_learn,
+            learn_ttl=cfg.regions_learn_ttl,
+            max_learned=cfg.regions_max_learned,
+            base_cooldown=cfg.regions_cooldown,
+        )
+
+    def learn(self, group_uuid: str, region_url: str):
+        """Remember that this group's traffic comes from region_url."""
+        if not self._learn or not region_url:
+            return
+        url = self._canonical(region_url)
+        with self._lock:
+            seen = self._learned.setdefault(group_uuid, OrderedDict())
+            if url not in seen:
+                logger.info(f"Learned region {url} for group {group_uuid}")
+            seen[url] = time.monotonic()
+            seen.move_to_end(url)
+            while len(seen) > self._max_learned:
+                seen.popitem(last=False)
+
+    def candidates(self, group_uuid: str) -> list[str]:
+        """Region URLs for a group, available ones first, best score first."""
+        now = time.monotonic()
+        urls = list(self._configured.get(group_uuid, ()))
+        with self._lock:
+            seen = self._learned.get(group_uuid)
+            if seen:
+                for url, at in reversed(seen.items()):
+                    if now - at <= self._learn_ttl:
+                        urls.append(url)
+            urls += self._default
+            urls = list(dict.fromkeys(urls))
+            health = [self._health_for(u) for u in urls]
+        ranked = sorted(
+            zip(urls, health),
+            key=lambda uh: (not uh[1].available(now), -uh[1].score()),
+        )
+        return [u for u, _ in ranked]
+
+    def available(self, url: str) -> bool:
+        url = self._canonical(url)
+        with self._lock:
+            return self._health_for(url).available(time.monotonic())
+
+    def record(self, url: str, ok: bool, latency_ms: float):
+        url = self._canonical(url)
+        with self._lock:
+            self._health_for(url).record(ok, latency_ms, time.monotonic())
+
+    def _canonical(self, url: str) -> str:
+        """
+        The URL requests go to for whichever region `url` names: the first
+        spelling seen with the same identity (see the module docstring).
+        """
+        url = normalize_url(url)
+        key = self._identity(url)
+        with self._lock:
+            return self._urls.setdefault(key, url)
+
+    def _canonical_all(self, urls) -> list[str]:
+        return list(dict.fromkeys(self._canonical(u) for u in urls if u))
+
+    def _identity(self, url: str) -> str:
+        parts = urlsplit(url)
+        host = parts.hostname or ""
+        now = time.monotonic()
+        cached = self._resolved.get(host)
+        if cached and now - cached[1] < _RESOLVE_TTL:
+            addr = cached[0]
+        else:
+            addr = _resolve(host)
+            self._resolved[host] = (addr, now)
+        netloc = f"[{addr}]" if ":" in addr else addr
+        if parts.port is not None:
+            netloc += f":{parts.port}"
+        return f"{parts.scheme}://{netloc}{parts.path}"
+
+    def _health_for(self, url: str) -> RegionHealth:
+        h = self._health.get(url)
+        if h is None:
+            h = self._health[url] = RegionHealth(
+                url, self._base_cooldown, self._max_cooldown)
+        return h
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "regions": [h.as_dict(now) for h in self._health.values()],
+                "learned_groups": len(self._learned),
+                "configured_groups": len(self._configured),
+            }
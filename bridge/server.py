@@ -0,0 +1,471 @@
+"""
+Lighthouse Bridge — Server
+Serves both listeners from one process so they share the BridgeService
+(DB pools, HTTP session, caches):
+
+  AppService  127.0.0.1:9009  — Conduit transaction push + user queries
+  OpenSim     0.0.0.0:9010    — /os/event webhook and /admin/*
+
+Each listener only answers its own routes. /health and /ready answer on
+both. Listeners run on PooledWSGIServer: a fixed pool of request threads
+(server.threads) with socket timeouts, rather than a thread per connection.
+A single-process production install runs create_app() under gunicorn's
+gthread worker instead (scripts/lighthouse-bridge.service); this module
+is `python run.py` and the multi-worker modes.
+
+With server.workers > 1, N worker processes are forked. Each one binds
+both ports with SO_REUSEPORT so the kernel spreads connections, and also
+listens on a private Unix socket. Work is pinned to a worker by hashing the
+room: a transaction's room_id, or for an OpenSim event the room its group
+is bridged to. A worker that receives another worker's room forwards it
+over that worker's socket, so every room's caches (and the regions its
+group's events were sent from) live in exactly one process.
+
+server.mode: "sharded" swaps this for a front dispatcher with ordered
+per-room queues — see shard.py.
+"""
+
+import http.client
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from . import ingest
+from .config import Config
+
+logger = logging.getLogger("lighthouse.server")
+
+# Path prefixes each listener is allowed to serve
+APPSERVICE_ROUTES = ("/_matrix/app/", "/transactions/", "/health", "/ready")
+OPENSIM_ROUTES = ("/os/", "/admin/", "/health", "/ready")
+
+_NOT_FOUND = b'{"error":"not found on this listener"}'
+_BUSY = b'{"error":"busy"}'
+_UNAUTHORIZED = b'{"error":"unauthorized"}'
+_BUSY_RESPONSE = (
+    b"HTTP/1.0 503 Service Unavailable\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Content-Length: " + str(len(_BUSY)).encode() + b"\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n\r\n" + _BUSY
+)
+
+
+def shard_for(key: str, workers: int) -> int:
+    """Stable room/group → worker index (same in every process)."""
+    return zlib.crc32(key.encode("utf-8")) % workers
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    werkzeug's server with a bounded pool of request threads.
+
+    ThreadedWSGIServer starts an unbounded thread per connection and never
+    times out a slow client. Here at most `threads` requests run at once
+    and as many again wait for a thread; beyond that a connection gets an
+    immediate 503, so the accept loop never blocks. Connections close after
+    each response (HTTP/1.0): an idle keep-alive client can't hold a pool
+    thread. Every socket read and write times out after `timeout` seconds.
+    """
+
+    multithread = True      # wsgi.multithread
+
+    def __init__(self, host: str, port: int, app, *, threads: int,
+                 timeout: float, fd: int | None = None):
+        handler = type("PooledRequestHandler", (WSGIRequestHandler,),
+                       {"timeout": timeout, "protocol_version": "HTTP/1.0"})
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        name = f"http-{port}" if port else "http-unix"
+        self._pool = ThreadPoolExecutor(max_workers=threads,
+                                        thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(threads * 2)
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self._refuse(request)
+            return
+        self._pool.submit(self._handle, request, client_address)
+
+    def _refuse(self, request):
+        """Answer 503 without reading the request (never blocks)."""
+        try:
+            request.setblocking(False)
+            request.send(_BUSY_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+
+
+def make_listener(host: str, port: int, app, cfg,
+                  fd: int | None = None) -> PooledWSGIServer:
+    return PooledWSGIServer(host, port, app, threads=cfg.server_threads,
+                            timeout=cfg.server_socket_timeout, fd=fd)
+
+
+class RouteFilter:
+    """WSGI middleware: 404 anything outside this listener's prefixes."""
+
+    def __init__(self, app, prefixes: tuple, name: str):
+        self.app = app
+        self.prefixes = prefixes
+        self.name = name
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO", "").startswith(self.prefixes):
+            return self.app(environ, start_response)
+        start_response("404 Not Found", [
+            ("Content-Type", "application/json"),
+            ("Content-Length", str(len(_NOT_FOUND))),
+        ])
+        return [_NOT_FOUND]
+
+
+# ════════════════════════════════════════════════════════
+#  Room-hash affinity (multi-process mode)
+# ════════════════════════════════════════════════════════
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """http.client over a Unix domain socket."""
+
+    def __init__(self, path: str, timeout: float = 30):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class AffinityRouter:
+    """
+    WSGI middleware that keeps each room/group on its owning worker.
+
+    - Transactions are split by room: local events run here, the rest are
+      forwarded (as smaller transactions) to their owners.
+    - /os/event requests are forwarded whole to the owner of the group's
+      room, looked up with `group_key` (group_uuid → routing key).
+
+    Both are authenticated here, before the body is read, so an
+    unauthenticated caller can't cause lookups or forwards.
+    """
+
+    def __init__(self, app, cfg, index: int, workers: int, run_dir: str,
+                 group_key=None):
+        from .app import cryptographic_equals, hs_authorized
+
+        self.app = app
+        self.cfg = cfg
+        self.index = index
+        self.workers = workers
+        self.run_dir = run_dir
+        self.group_key = group_key or (lambda group_uuid: group_uuid)
+        self._equals = cryptographic_equals
+        self._hs_authorized = hs_authorized
+
+    def _authorized(self, environ, is_txn: bool) -> bool:
+        if is_txn:
+            query = parse_qs(environ.get("QUERY_STRING", ""))
+            return self._hs_authorized(
+                environ.get("HTTP_AUTHORIZATION", ""),
+                (query.get("access_token") or [None])[0], self.cfg.hs_token)
+        secret = environ.get("HTTP_X_BRIDGE_SECRET", "")
+        return bool(secret) and self._equals(secret, self.cfg.bridge_secret)
+
+    def _socket_path(self, shard: int) -> str:
+        return worker_socket_path(self.run_dir, shard)
+
+    def _forward(self, shard: int, method: str, path: str, body: bytes,
+                 headers: dict) -> tuple[int, bytes]:
+        conn = _UnixHTTPConnection(self._socket_path(shard))
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            return resp.status, resp.read()
+        finally:
+            conn.close()
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        method = environ.get("REQUEST_METHOD", "GET")
+        is_txn = method in ("PUT", "POST") and (
+            path.startswith("/_matrix/app/v1/transactions/")
+            or path.startswith("/transactions/")
+        )
+        is_os_event = method == "POST" and path == "/os/event"
+        if not (is_txn or is_os_event):
+            return self.app(environ, start_response)
+        if not self._authorized(environ, is_txn):
+            start_response("401 Unauthorized", [
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(_UNAUTHORIZED))),
+            ])
+            return [_UNAUTHORIZED]
+
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length else b""
+
+        headers = {"Content-Type": "application/json"}
+        for name in ("HTTP_AUTHORIZATION", "HTTP_X_BRIDGE_SECRET",
+                     "HTTP_X_BRIDGE_TRACE", "HTTP_X_BRIDGE_TRACE_TS"):
+            if name in environ:
+                headers[name[5:].replace("_", "-").title()] = environ[name]
+        if is_txn:      # may have come as ?access_token=, which isn't forwarded
+            headers["Authorization"] = f"Bearer {self.cfg.hs_token}"
+
+        if is_os_event:
+            try:
+                payload = ingest.loads(body) if body else None
+            except ValueError:
+                payload = None
+            if not isinstance(payload, dict):
+                return self._local(environ, start_response, body)
+            group_uuid = str(payload.get("group_uuid", ""))
+            key = self.group_key(group_uuid) if group_uuid else group_uuid
+            owner = shard_for(key, self.workers)
+            if owner == self.index:
+                return self._local(environ, start_response, body)
+            try:
+                status, resp_body = self._forward(owner, method, path, body,
+                                                  headers)
+            except OSError as e:
+                logger.error(f"Forward to worker {owner} failed: {e}")
+                return self._unavailable(start_response)
+            if status == 503:       # busy or warming up: keep Retry-After
+                return self._unavailable(start_response)
+            start_response(f"{status} {http.client.responses.get(status, '')}", [
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(resp_body))),
+            ])
+            return [resp_body]
+
+        # Transaction: split the events we act on by owning worker
+        by_shard: dict[int, list] = {}
+        for ev in ingest.parse_transaction(body):
+            room_id = ev.get("room_id", "")
+            shard = shard_for(room_id, self.workers) if room_id else self.index
+            by_shard.setdefault(shard, []).append(ev)
+
+        # If a sibling can't take its share (e.g. it is respawning or busy),
+        # answer 503 so Conduit retries the whole transaction. Events that
+        # were already relayed are dropped by dedupe on the retry.
+        for shard, events in by_shard.items():
+            if shard == self.index:
+                continue
+            sub_body = json.dumps({"events": events}).encode()
+            try:
+                status, _ = self._forward(shard, method, path, sub_body, headers)
+            except OSError as e:
+                logger.error(f"Forward to worker {shard} failed: {e}")
+                return self._unavailable(start_response)
+            if status >= 500:
+                logger.warning(f"Worker {shard} answered {status} for "
+                               f"{len(events)} forwarded events")
+                return self._unavailable(start_response)
+            if status >= 300:
+                logger.warning(f"Worker {shard} answered {status} for "
+                               f"{len(events)} forwarded events")
+
+        local_body = json.dumps({"events": by_shard.get(self.index, [])}).encode()
+        return self._local(environ, start_response, local_body)
+
+    @staticmethod
+    def _unavailable(start_response):
+        start_response("503 Service Unavailable", [
+            ("Content-Type", "application/json"),
+            ("Content-Length", str(len(_BUSY))),
+            ("Retry-After", "1"),
+        ])
+        return [_BUSY]
+
+    def _local(self, environ, start_response, body: bytes):
+        environ["wsgi.input"] = io.BytesIO(body)
+        environ["CONTENT_LENGTH"] = str(len(body))
+        return self.app(environ, start_response)
+
+
+def worker_socket_path(run_dir: str, index: int) -> str:
+    return os.path.join(run_dir, f"worker-{index}.sock")
+
+
+# ════════════════════════════════════════════════════════
+#  Listeners
+# ════════════════════════════════════════════════════════
+
+def _reuseport_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    return sock
+
+
+def _start(servers: list) -> list[threading.Thread]:
+    threads = []
+    for srv in servers:
+        t = threading.Thread(target=srv.serve_forever, daemon=True,
+                             name=f"listener-{srv.port}")
+        t.start()
+        threads.append(t)
+    return threads
+
+
+def _wait_for_signal():
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    while not stop.wait(1):
+        pass
+
+
+def _build_servers(app, cfg, reuse_port: bool = False) -> list:
+    listeners = [
+        (cfg.appservice_host, cfg.appservice_port, APPSERVICE_ROUTES, "appservice"),
+        (cfg.opensim_host, cfg.opensim_port, OPENSIM_ROUTES, "opensim"),
+    ]
+    servers = []
+    for host, port, routes, name in listeners:
+        sock = _reuseport_socket(host, port) if reuse_port else None
+        servers.append(make_listener(
+            host, port, RouteFilter(app, routes, name), cfg,
+            fd=sock.fileno() if sock else None,
+        ))
+        if sock:
+            sock.close()    # the server holds its own dup of the fd
+    return servers
+
+
+def serve_single(config_path: str = None):
+    """Both listeners, one process, one BridgeService."""
+    from .app import create_app
+
+    app = create_app(config_path=config_path)
+    cfg = app.config["cfg"]
+    servers = _build_servers(app, cfg)
+    _start(servers)
+    logger.info(f"AppService listener on {cfg.appservice_host}:{cfg.appservice_port}")
+    logger.info(f"OpenSim listener on {cfg.opensim_host}:{cfg.opensim_port}")
+
+    _wait_for_signal()
+    logger.info("Shutting down listeners...")
+    for srv in servers:
+        srv.shutdown()
+
+
+def _worker_main(config_path: str, index: int, workers: int, run_dir: str):
+    from .app import create_app
+
+    app = create_app(config_path=config_path)
+    cfg = app.config["cfg"]
+    routed = AffinityRouter(app, cfg, index, workers, run_dir,
+                            app.config["bridge"].shard_key_for_group)
+
+    servers = _build_servers(routed, cfg, reuse_port=True)
+    # Private socket for work forwarded by other workers (no re-routing)
+    servers.append(make_listener(
+        f"unix://{worker_socket_path(run_dir, index)}", 0,
+        RouteFilter(app, APPSERVICE_ROUTES + OPENSIM_ROUTES, "internal"), cfg,
+    ))
+    _start(servers)
+    logger.info(f"Worker {index}/{workers} ready (pid {os.getpid()})")
+
+    _wait_for_signal()
+    for srv in servers:
+        srv.shutdown()
+
+
+def serve_multi(config_path: str, workers: int, run_dir: str):
+    """Fork `workers` processes sharing both ports via SO_REUSEPORT."""
+    os.makedirs(run_dir, exist_ok=True)
+    children: dict[int, int] = {}      # pid → worker index
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _worker_main(config_path, index, workers, run_dir)
+            finally:
+                os._exit(0)
+        children[pid] = index
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for i in range(workers):
+        spawn(i)
+
+    # Respawn crashed workers in the same slot so shard ownership is stable
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            logger.warning(f"Worker {index} (pid {pid}) exited ({status}); "
+                           f"respawning")
+            time.sleep(1)
+            spawn(index)
+
+
+def serve(config_path: str = None):
+    """Entry point: single process, or forked workers if configured."""
+    cfg = Config(config_path)
+    if cfg.server_workers > 1 and cfg.server_mode == "sharded":
+        from .shard import serve_sharded
+
+        logging.basicConfig(
+            level=getattr(logging, cfg.log_level, logging.INFO),
+            format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+        serve_sharded(cfg, config_path)
+    elif cfg.server_workers > 1:
+        if not hasattr(socket, "SO_REUSEPORT"):
+            sys.exit("server.workers > 1 needs SO_REUSEPORT (Linux/BSD)")
+        logging.basicConfig(
+            level=getattr(logging, cfg.log_level, logging.INFO),
+            format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+        serve_multi(config_path, cfg.server_workers, cfg.server_run_dir)
+    else:
+        serve_single(config_path)
@@ -13,18 +13,62 @@ All Matrix API calls use standard Client-Server spec endpoints.
 AppService features use the ?user_id= parameter for puppet control.
 """
 
+import contextvars
 import logging
 import hmac
-import mysql.connector
-from mysql.connector import pooling
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from functools import cached_property
 from urllib.parse import quote
 import requests
+from requests.adapters import HTTPAdapter
+import time
 import uuid as uuid_lib
+from .db import DBPool
+from . import ingest
+from .members import MemberNameCache
+from .migrations import migrate
+from .regions import RegionRegistry
+from .storage import (
+    BRIDGE_COLUMNS, BridgeFilter, BridgeIndex, EventDedupe, _sqlite_value,
+    open_state_store,
+)
+from .trace import TRACE_HEADER, Tracer, parse_ts_ms
+from .warmup import WarmUp
 
 logger = logging.getLogger("lighthouse.bridge")
 
 ZERO_UUID = "00000000-0000-0000-0000-000000000000"
 
+# Matrix event IDs are remembered this long to drop retried transactions
+DEDUPE_TTL = 7 * 24 * 3600
+DEDUPE_PRUNE_INTERVAL = 3600
+
+# Queries against the OpenSim groups DB (also EXPLAINed by
+# `run.py check-plans`)
+GROUPS_SQL = {
+    "member_power": """
+        SELECT r.Powers
+        FROM os_groups_membership m
+        JOIN os_groups_roles r
+          ON r.GroupID = m.GroupID AND r.RoleID = m.SelectedRoleID
+        WHERE m.GroupID = %s AND m.PrincipalID = %s
+        LIMIT 1
+    """,
+    "max_power": """
+        SELECT MAX(r.Powers)
+        FROM os_groups_membership m
+        JOIN os_groups_roles r
+          ON r.GroupID = m.GroupID AND r.RoleID = m.SelectedRoleID
+        WHERE m.GroupID = %s
+    """,
+    "group_members": """
+        SELECT PrincipalID
+        FROM os_groups_membership
+        WHERE GroupID = %s
+    """,
+}
+
 
 class BridgeService:
     """
@@ -38,32 +82,145 @@ class BridgeService:
         self._hs = config.homeserver
         self._as_token = config.as_token
         self._avatar_base_url = config.avatar_base_url
-        self._region_url = config.region_url.rstrip("/")
         self._bridge_secret = config.bridge_secret
 
-        # HTTP session with AppService token (like Fiona's _http with Bearer)
-        self._http = requests.Session()
-        self._http.headers.update({
+        # Nothing below connects to anything: DB pools connect on first
+        # checkout, HTTP sessions are built on first use, and the warm-up
+        # (start_warm_up) does both ahead of traffic.
+
+        # Database connection pools — bridge state and OpenSim groups
+        # tables are sized separately (the groups pool may be a replica).
+        # The state pool is only needed when state lives in MySQL.
+        self._pool = None
+        if config.state_backend == "mysql":
+            self._pool = DBPool(
+                "lighthouse_state",
+                size=config.db_pool_size,
+                wait_timeout=config.db_pool_wait_timeout,
+                host=config.db_host,
+                port=config.db_port,
+                database=config.db_name,
+                user=config.db_user,
+                password=config.db_password,
+            )
+        self._groups_pool = DBPool(
+            "lighthouse_groups",
+            size=config.groups_db_pool_size,
+            wait_timeout=config.groups_db_pool_wait_timeout,
+            host=config.groups_db_host,
+            port=config.groups_db_port,
+            database=config.groups_db_name,
+            user=config.groups_db_user,
+            password=config.groups_db_password,
+        )
+
+        # Bridge-owned tables (MySQL or embedded SQLite); migrations run
+        # in the warm-up
+        self.store = open_state_store(config, self._pool)
+
+        # In-memory group ↔ room map used on every message
+        self._index = BridgeIndex(self.store, ttl=config.state_index_ttl)
+
+        # Conduit's transaction resends are caught in memory before the
+        # dedupe_events table
+        self._dedupe = EventDedupe(self.store)
+
+        # Senders never relayed to OpenSim: our puppets and the bot (loops)
+        self._skip_senders = ("@os_", f"@{config.bot_localpart}")
+
+        # Matrix display names per bridged room, fed by m.room.member events
+        self._members = MemberNameCache(self._fetch_joined_members)
+
+        # Per-message stage timings (sampled; slow/failed always kept)
+        self.tracer = Tracer.from_config(config)
+
+        # Matrix → OpenSim: candidate simulators per group, with health.
+        # Injections share one pooled session and a bounded thread pool.
+        self.regions = RegionRegistry.from_config(config)
+        self._last_dedupe_prune = 0.0
+
+        self.warmup = self._build_warm_up()
+
+        logger.info(f"BridgeService initialized (state: {self.store.backend})")
+
+    @cached_property
+    def _http(self) -> requests.Session:
+        """HTTP session with AppService token (like Fiona's _http with Bearer)."""
+        http = requests.Session()
+        http.headers.update({
             "Authorization": f"Bearer {self._as_token}",
             "Content-Type": "application/json",
         })
-
-        # Database connection pool
-        self._pool = pooling.MySQLConnectionPool(
-            pool_name="lighthouse",
-            pool_size=5,
-            host=config.db_host,
-            port=config.db_port,
-            database=config.db_name,
-            user=config.db_user,
-            password=config.db_password,
+        # Bulk admin calls share this session across threads; size its
+        # connection pool so they don't open and drop extra sockets
+        adapter = HTTPAdapter(
+            pool_maxsize=max(10, self.cfg.admin_bulk_concurrency)
         )
+        http.mount("http://", adapter)
+        http.mount("https://", adapter)
+        return http
+
+    @cached_property
+    def _region_http(self) -> requests.Session:
+        http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16, pool_maxsize=self.cfg.regions_max_parallel
+        )
+        http.mount("http://", adapter)
+        http.mount("https://", adapter)
+        return http
+
+    @cached_property
+    def _region_pool(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.cfg.regions_max_parallel,
+            thread_name_prefix="region",
+        )
+
+    # ─── Start-up Warm-up ───────────────────────────────
+    # NEW — see warmup.py; /ready reports when these are done
+
+    def _build_warm_up(self) -> WarmUp:
+        cfg = self.cfg
+        w = WarmUp(retry_max=cfg.startup_retry_max,
+                   give_up_after=cfg.startup_give_up_after)
+        state_ready = ()
+        if self._pool is not None:
+            w.add("state_pool", self._pool.prefill)
+            state_ready = ("state_pool",)
+        w.add("groups_pool", self._groups_pool.prefill)
+        if cfg.state_auto_migrate:
+            # Optional: without DDL rights the bridge runs on the existing
+            # schema. On a fresh DB the index step retries until it exists.
+            w.add("migrate", lambda: migrate(self.store), after=state_ready,
+                  required=False)
+        w.add("index", self._index.refresh, after=state_ready)
+        w.add("conduit", self._check_conduit)
+        return w
+
+    def start_warm_up(self):
+        """Begin warming up in the background (call once per process)."""
+        self.warmup.start()
+
+    def _check_conduit(self):
+        """Conduit is reachable (this also opens the session's first socket)."""
+        resp = self._http.get(f"{self._base}/_matrix/client/versions", timeout=5)
+        if not resp.ok:
+            raise Exception(f"Conduit /versions returned {resp.status_code}")
 
-        logger.info("BridgeService initialized")
+    def _groups_db(self):
+        """Get a connection for the OpenSim os_groups_* tables."""
+        return self._groups_pool.get_connection()
 
-    def _db(self):
-        """Get a database connection from the pool."""
-        return self._pool.get_connection()
+    def member_stats(self) -> dict:
+        return self._members.stats()
+
+    def pool_stats(self) -> dict:
+        """Wait/checkout instrumentation for both DB pools."""
+        stats = {"groups": self._groups_pool.stats()}
+        if self._pool is not None:
+            stats["state"] = self._pool.stats()
+        return stats
 
     # ─── Room Alias Lookup ──────────────────────────────
     # Port of: GetRoomIdFromAliasAsync (line 66)
@@ -88,105 +245,248 @@ class BridgeService:
         Creates a Matrix room, registers founder puppet, stores mapping.
         Returns the Matrix room_id.
         """
-        conn = self._db()
-        try:
-            cursor = conn.cursor(dictionary=True)
+        # Check if already enabled (authoritative: ask the store)
+        existing = self.store.get_room_for_group(group_uuid)
+        if existing:
+            return existing
+
+        room_id, _ = self._provision_room(group_uuid, group_name,
+                                          founder_avatar_uuid)
+        self._store_bridge(group_uuid, room_id, founder_avatar_uuid)
+        return room_id
+
+    def _provision_room(self, group_uuid: str, group_name: str,
+                        founder_avatar_uuid: str) -> tuple[str, bool]:
+        """
+        Find or create the group's Matrix room (no state written).
+        Returns (room_id, created).
+        """
+        # Build alias from first 8 chars of UUID (no dashes)
+        alias = f"os_{group_uuid.replace('-', '')[:8]}"
+
+        # Check if room already exists with this alias
+        existing_room_id = self.get_room_id_from_alias(alias)
+        if existing_room_id:
+            return existing_room_id, False
+
+        # Create Matrix room
+        create_payload = {
+            "name": f"OpenSim | {group_name}",
+            "topic": f"Bridged OpenSimulator group chat\nGroup UUID: {group_uuid}",
+            "preset": "private_chat",
+            "room_alias_name": alias,
+            "visibility": "private",
+        }
 
-            # Check if already enabled
-            cursor.execute(
-                "SELECT room_id FROM group_bridge_state "
-                "WHERE group_uuid=%s AND enabled=1",
-                (group_uuid,)
-            )
-            existing = cursor.fetchone()
-            if existing:
-                return existing["room_id"]
-
-            # Build alias from first 8 chars of UUID (no dashes)
-            alias = f"os_{group_uuid.replace('-', '')[:8]}"
-
-            # Check if room already exists with this alias
-            existing_room_id = self.get_room_id_from_alias(alias)
-            if existing_room_id:
-                cursor.execute(
-                    "INSERT INTO group_bridge_state "
-                    "(group_uuid, enabled, room_id, enabled_by, enabled_at) "
-                    "VALUES (%s, 1, %s, %s, NOW()) "
-                    "ON DUPLICATE KEY UPDATE "
-                    "enabled=1, room_id=%s, enabled_by=%s, enabled_at=NOW()",
-                    (group_uuid, existing_room_id, founder_avatar_uuid,
-                     existing_room_id, founder_avatar_uuid)
-                )
-                conn.commit()
-                return existing_room_id
-
-            # Create Matrix room
-            create_payload = {
-                "name": f"OpenSim | {group_name}",
-                "topic": f"Bridged OpenSimulator group chat\nGroup UUID: {group_uuid}",
-                "preset": "private_chat",
-                "room_alias_name": alias,
-                "visibility": "private",
-            }
+        resp = self._http.post(
+            f"{self._base}/_matrix/client/v3/createRoom",
+            json=create_payload
+        )
+        if resp.status_code != 200:
+            raise Exception(f"Room creation failed: {resp.text}")
 
-            resp = self._http.post(
-                f"{self._base}/_matrix/client/v3/createRoom",
-                json=create_payload
-            )
-            if resp.status_code != 200:
-                raise Exception(f"Room creation failed: {resp.text}")
+        room_id = resp.json()["room_id"]
 
-            room_id = resp.json()["room_id"]
+        # Ensure founder puppet exists and joins
+        founder_mxid = f"@os_{founder_avatar_uuid.replace('-', '')}:{self._hs}"
+        self.ensure_user_exists(founder_avatar_uuid)
 
-            # Ensure founder puppet exists and joins
-            founder_mxid = f"@os_{founder_avatar_uuid.replace('-', '')}:{self._hs}"
-            self.ensure_user_exists(founder_avatar_uuid)
+        self._http.post(
+            f"{self._base}/_matrix/client/v3/rooms/"
+            f"{quote(room_id, safe='')}/join"
+            f"?user_id={quote(founder_mxid, safe='')}",
+        )
 
-            self._http.post(
-                f"{self._base}/_matrix/client/v3/rooms/"
-                f"{quote(room_id, safe='')}/join"
-                f"?user_id={quote(founder_mxid, safe='')}",
-            )
+        # Set power levels (bot=100, founder=100)
+        bot_mxid = f"@{self.cfg.bot_localpart}:{self._hs}"
+        power_payload = {
+            "users": {
+                bot_mxid: 100,
+                founder_mxid: 100,
+            },
+            "state_default": 50,
+            "users_default": 0,
+            "events_default": 0,
+            "invite": 50,
+            "kick": 50,
+            "ban": 75,
+            "redact": 50,
+        }
 
-            # Set power levels (bot=100, founder=100)
-            bot_mxid = f"@{self.cfg.bot_localpart}:{self._hs}"
-            power_payload = {
-                "users": {
-                    bot_mxid: 100,
-                    founder_mxid: 100,
-                },
-                "state_default": 50,
-                "users_default": 0,
-                "events_default": 0,
-                "invite": 50,
-                "kick": 50,
-                "ban": 75,
-                "redact": 50,
-            }
+        self._http.put(
+            f"{self._base}/_matrix/client/v3/rooms/"
+            f"{quote(room_id, safe='')}/state/m.room.power_levels",
+            json=power_payload
+        )
 
-            self._http.put(
-                f"{self._base}/_matrix/client/v3/rooms/"
-                f"{quote(room_id, safe='')}/state/m.room.power_levels",
-                json=power_payload
-            )
+        logger.info(f"Bridge enabled: {group_name} → {room_id}")
+        return room_id, True
+
+    def shard_key_for_group(self, group_uuid: str) -> str:
+        """Multi-worker routing key for a group's OpenSim events."""
+        return self._index.shard_key(group_uuid)
+
+    def _store_bridge(self, group_uuid: str, room_id: str, enabled_by: str):
+        """Persist a group → room mapping and update the local index."""
+        self._store_bridges([(group_uuid, room_id, enabled_by)])
+
+    def _store_bridges(self, rows: list[tuple[str, str, str]]):
+        """Persist mappings in one batch and update the local index."""
+        # One timestamp (UTC) for the store and the index, so listings
+        # read the same whichever one serves them
+        enabled_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        if len(rows) == 1:
+            self.store.upsert_bridge(*rows[0], enabled_at)
+        else:
+            self.store.upsert_bridges(rows, enabled_at)
+        for group_uuid, room_id, enabled_by in rows:
+            self._index.put({
+                "group_uuid": group_uuid,
+                "enabled": 1,
+                "room_id": room_id,
+                "enabled_by": enabled_by,
+                "enabled_at": enabled_at,
+            })
+
+    def list_bridges_page(self, f: BridgeFilter,
+                          columns: tuple = BRIDGE_COLUMNS) -> tuple[list[dict], str]:
+        """
+        One page of bridge rows, JSON-ready. Returns (rows, source).
 
-            # Store mapping in database
-            cursor.execute(
-                "INSERT INTO group_bridge_state "
-                "(group_uuid, enabled, room_id, enabled_by, enabled_at) "
-                "VALUES (%s, 1, %s, %s, NOW()) "
-                "ON DUPLICATE KEY UPDATE "
-                "enabled=1, room_id=%s, enabled_by=%s, enabled_at=NOW()",
-                (group_uuid, room_id, founder_avatar_uuid,
-                 room_id, founder_avatar_uuid)
+        A fresh in-memory index answers enabled-only listings without a
+        DB round-trip. The index only holds enabled rows, so date-range
+        and disabled-row queries always go to the store.
+        """
+        if f.enabled == 1 and not (f.since or f.until) and self._index.fresh():
+            rows, source = self._index.page(f), "index"
+        else:
+            rows, source = self.store.list_bridges_page(f, columns), self.store.backend
+        return [
+            {c: _sqlite_value(r.get(c)) for c in columns} for r in rows
+        ], source
+
+    # ─── Bulk Enable / Resync ───────────────────────────
+    # NEW — onboarding many groups at once
+
+    def enable_bridges(self, groups: list[dict], concurrency: int = None):
+        """
+        Enable many groups, provisioning rooms `concurrency` at a time.
+
+        Yields one result dict per group as it finishes, then a summary.
+        Every new mapping is written in one batched upsert at the end —
+        including when the consumer stops early, so no created room is
+        left unmapped. If that write fails, an error line lists the groups
+        whose rooms exist but are not mapped, and the summary's "stored"
+        is what actually reached the store.
+        """
+        started = time.monotonic()
+        limit = max(1, concurrency or self.cfg.admin_bulk_concurrency)
+        known = {r["group_uuid"]: r["room_id"] for r in self.store.list_bridges()}
+
+        provisioned: list[tuple[str, str, str]] = []
+        lock = threading.Lock()
+        counts = {"existing": 0, "created": 0, "linked": 0, "failed": 0}
+
+        def provision(g: dict) -> tuple[str, bool]:
+            room_id, created = self._provision_room(
+                g["group_uuid"], g["group_name"], g["founder_avatar_uuid"]
             )
-            conn.commit()
+            with lock:
+                provisioned.append(
+                    (g["group_uuid"], room_id, g["founder_avatar_uuid"])
+                )
+            return room_id, created
+
+        executor = ThreadPoolExecutor(max_workers=limit,
+                                      thread_name_prefix="bulk-enable")
+        futures = {}
+        stored, store_error = 0, None
+        try:
+            seen = set()
+            for g in groups:
+                if g["group_uuid"] in seen:
+                    continue
+                seen.add(g["group_uuid"])
+                if g["group_uuid"] in known:
+                    counts["existing"] += 1
+                    yield {"group_uuid": g["group_uuid"], "status": "existing",
+                           "room_id": known[g["group_uuid"]]}
+                    continue
+                futures[executor.submit(provision, g)] = g
+
+            for fut in as_completed(futures):
+                g = futures[fut]
+                try:
+                    room_id, created = fut.result()
+                except Exception as e:
+                    counts["failed"] += 1
+                    logger.error(f"Bulk enable failed for {g['group_uuid']}: {e}")
+                    yield {"group_uuid": g["group_uuid"], "status": "error",
+                           "error": str(e)}
+                    continue
+                status = "created" if created else "linked"
+                counts[status] += 1
+                yield {"group_uuid": g["group_uuid"], "status": status,
+                       "room_id": room_id}
+        finally:
+            for fut in futures:
+                fut.cancel()
+            executor.shutdown(wait=True)
+            if provisioned:
+                # Also runs when the consumer went away, so it can't raise
+                # into a generator that is being closed
+                try:
+                    self._store_bridges(provisioned)
+                    stored = len(provisioned)
+                except Exception as e:
+                    store_error = e
+                    logger.error(f"Bulk enable: storing {len(provisioned)} "
+                                 f"mappings failed: {e}")
+
+        if store_error is not None:
+            yield {"status": "error",
+                   "error": f"mappings not stored: {store_error}",
+                   "group_uuids": [row[0] for row in provisioned]}
+        logger.info(f"Bulk enable: {stored} mappings stored, "
+                    f"{counts['failed']} failed")
+        yield {"done": True, **counts, "stored": stored,
+               "elapsed_ms": round((time.monotonic() - started) * 1000)}
+
+    def resync_groups(self, group_uuids: list[str], concurrency: int = None):
+        """
+        Resync many groups, `concurrency` at a time.
+        Yields one result dict per group as it finishes, then a summary.
+        """
+        started = time.monotonic()
+        limit = max(1, concurrency or self.cfg.admin_bulk_concurrency)
+        counts = {"resynced": 0, "failed": 0}
 
-            logger.info(f"Bridge enabled: {group_name} → {room_id}")
-            return room_id
+        executor = ThreadPoolExecutor(max_workers=limit,
+                                      thread_name_prefix="bulk-resync")
+        futures = {}
+        try:
+            for group_uuid in dict.fromkeys(group_uuids):
+                futures[executor.submit(self.resync_group, group_uuid)] = group_uuid
 
+            for fut in as_completed(futures):
+                group_uuid = futures[fut]
+                try:
+                    members = fut.result()
+                except Exception as e:
+                    counts["failed"] += 1
+                    yield {"group_uuid": group_uuid, "status": "error",
+                           "error": str(e)}
+                    continue
+                counts["resynced"] += 1
+                yield {"group_uuid": group_uuid, "status": "resynced",
+                       "members": members}
         finally:
-            conn.close()
+            for fut in futures:
+                fut.cancel()
+            executor.shutdown(wait=True)
+
+        yield {"done": True, **counts,
+               "elapsed_ms": round((time.monotonic() - started) * 1000)}
 
     # ─── Puppet User Registration ───────────────────────
     # Port of: EnsureUserExistsAsync (line 213)
@@ -231,10 +531,10 @@ class BridgeService:
     # Port of: EnsurePuppetDisplayNameAsync (line 425)
 
     def ensure_puppet_display_name(self, puppet_mxid: str,
-                                   desired_name: str, force: bool = False):
-        """Set display name for a puppet user."""
+                                   desired_name: str, force: bool = False) -> bool:
+        """Set display name for a puppet user. False if Conduit refused it."""
         if not desired_name or not desired_name.strip():
-            return
+            return True
 
         desired_name = desired_name.strip()[:64]
 
@@ -249,18 +549,25 @@ class BridgeService:
             if resp.ok:
                 current = resp.json().get("displayname", "")
                 if current == desired_name:
-                    return  # Already correct
+                    return True  # Already correct
 
-        self._http.put(url, json={"displayname": desired_name})
+        resp = self._http.put(url, json={"displayname": desired_name})
+        if not resp.ok:
+            logger.warning(f"Display name update failed for {puppet_mxid}: "
+                           f"{resp.text}")
+        return resp.ok
 
     # ─── Puppet Avatar Photo ────────────────────────────
     # Port of: EnsurePuppetAvatarAsync (line 282)
 
     def ensure_puppet_avatar(self, puppet_mxid: str,
-                             sender_uuid: str, force: bool = False):
-        """Download avatar photo from OpenSim, upload to Matrix, set on puppet."""
+                             sender_uuid: str, force: bool = False) -> bool:
+        """
+        Download avatar photo from OpenSim, upload to Matrix, set on puppet.
+        Returns False if any step failed, so the caller can try again later.
+        """
         if not self._avatar_base_url:
-            return
+            return True
 
         profile_url = (
             f"{self._base}/_matrix/client/v3/profile/"
@@ -273,17 +580,20 @@ class BridgeService:
             if resp.ok:
                 existing = resp.json().get("avatar_url", "")
                 if existing:
-                    return  # Already set
+                    return True  # Already set
 
         # Fetch avatar image from our photo endpoint
         src_url = self._avatar_base_url.replace("{uuid}", sender_uuid)
         try:
             img_resp = requests.get(src_url, timeout=10)
             if not img_resp.ok:
-                return
+                logger.warning(f"Avatar fetch failed for {sender_uuid}: "
+                               f"HTTP {img_resp.status_code}")
+                return False
             img_bytes = img_resp.content
-        except Exception:
-            return
+        except Exception as e:
+            logger.warning(f"Avatar fetch failed for {sender_uuid}: {e}")
+            return False
 
         # Upload to Matrix media
         upload_url = (
@@ -300,12 +610,15 @@ class BridgeService:
         )
         if not upload_resp.ok:
             logger.error(f"Avatar upload failed: {upload_resp.text}")
-            return
+            return False
 
         mxc = upload_resp.json().get("content_uri")
 
         # Set avatar_url on puppet profile
-        self._http.put(profile_url, json={"avatar_url": mxc})
+        resp = self._http.put(profile_url, json={"avatar_url": mxc})
+        if not resp.ok:
+            logger.error(f"Avatar profile update failed: {resp.text}")
+        return resp.ok
 
     # ─── OpenSim Power Level Mapping ────────────────────
     # Port of: GetOpenSimPowerLevelAsync (line 482)
@@ -316,19 +629,14 @@ class BridgeService:
         Map OpenSim group role powers to Matrix power levels.
         Owner/Officer → 100, Member → 0
         """
-        conn = self._db()
+        conn = self._groups_db()
         try:
             cursor = conn.cursor()
 
             # Get this member's role power
-            cursor.execute("""
-                SELECT r.Powers
-                FROM os_groups_membership m
-                JOIN os_groups_roles r
-                  ON r.GroupID = m.GroupID AND r.RoleID = m.SelectedRoleID
-                WHERE m.GroupID = %s AND m.PrincipalID = %s
-                LIMIT 1
-            """, (group_uuid, agent_uuid))
+            cursor.execute(
+                GROUPS_SQL["member_power"], (group_uuid, agent_uuid)
+            )
 
             row = cursor.fetchone()
             if not row:
@@ -336,13 +644,7 @@ class BridgeService:
             member_power = int(row[0])
 
             # Get highest power in group
-            cursor.execute("""
-                SELECT MAX(r.Powers)
-                FROM os_groups_membership m
-                JOIN os_groups_roles r
-                  ON r.GroupID = m.GroupID AND r.RoleID = m.SelectedRoleID
-                WHERE m.GroupID = %s
-            """, (group_uuid,))
+            cursor.execute(GROUPS_SQL["max_power"], (group_uuid,))
 
             max_row = cursor.fetchone()
             max_power = int(max_row[0]) if max_row and max_row[0] else 1
@@ -403,44 +705,63 @@ class BridgeService:
     # Port of: RelayMessageFromOpenSimAsync (line 351)
 
     def relay_from_opensim(self, group_uuid: str, sender_uuid: str,
-                           sender_name: str, message: str):
+                           sender_name: str, message: str,
+                           trace_id: str = None, tap_ts_ms: int = None,
+                           region_url: str = None):
         """
         Relay a group chat message from OpenSim to Matrix.
         Creates puppet, sets profile, joins room, sends message AS puppet.
+        trace_id/tap_ts_ms come from TryMatrixBridgeTap's trace headers;
+        region_url (the sender's simulator) feeds the region registry.
         """
         if sender_uuid == ZERO_UUID:
             return  # Echo prevention (line 358)
 
-        conn = self._db()
-        try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute(
-                "SELECT room_id FROM group_bridge_state "
-                "WHERE group_uuid=%s AND enabled=1",
-                (group_uuid,)
-            )
-            row = cursor.fetchone()
-            if not row:
-                return  # Bridge not enabled
-            room_id = row["room_id"]
-        finally:
-            conn.close()
+        with self.tracer.trace("os_to_matrix", trace_id, tap_ts_ms,
+                               group=group_uuid, sender=sender_uuid):
+            self._relay_from_opensim(group_uuid, sender_uuid, sender_name,
+                                     message, region_url)
+
+    def _relay_from_opensim(self, group_uuid: str, sender_uuid: str,
+                            sender_name: str, message: str,
+                            region_url: str = None):
+        span = self.tracer.span
+
+        with span("db.mapping"):
+            room_id = self._index.room_for_group(group_uuid)
+        if not room_id:
+            return  # Bridge not enabled
+
+        # This simulator can inject the group's Matrix-side messages too
+        self.regions.learn(group_uuid, region_url)
 
-        # Ensure puppet exists
-        self.ensure_user_exists(sender_uuid)
         puppet_mxid = f"@os_{sender_uuid.replace('-', '')}:{self._hs}"
 
-        # Set display name and avatar
-        self.ensure_puppet_display_name(puppet_mxid, sender_name)
-        self.ensure_puppet_avatar(puppet_mxid, sender_uuid)
+        # Puppets already in avatar_mxid_map under this name are registered
+        # and profiled; skip straight to the join/send.
+        with span("db.puppet"):
+            puppet = self.store.get_puppet(sender_uuid)
+        if not puppet or puppet.get("display_name") != sender_name:
+            with span("register"):
+                self.ensure_user_exists(sender_uuid)
+
+            # Set display name and avatar. The puppet is only cached once
+            # both took, so a failed avatar is retried on the next message.
+            with span("profile"):
+                name_ok = self.ensure_puppet_display_name(puppet_mxid, sender_name)
+                avatar_ok = self.ensure_puppet_avatar(puppet_mxid, sender_uuid)
+                if name_ok and avatar_ok:
+                    self.store.put_puppet(sender_uuid, puppet_mxid, sender_name)
 
         # Ensure puppet is in the room
-        self.ensure_user_joined(room_id, puppet_mxid)
+        with span("join"):
+            self.ensure_user_joined(room_id, puppet_mxid)
 
         # Sync power level
-        self.sync_matrix_power_level(
-            room_id, puppet_mxid, group_uuid, sender_uuid
-        )
+        with span("power_sync"):
+            self.sync_matrix_power_level(
+                room_id, puppet_mxid, group_uuid, sender_uuid
+            )
 
         # Send message AS the puppet (the key AppService feature)
         txn_id = str(uuid_lib.uuid4())
@@ -449,12 +770,13 @@ class BridgeService:
             "body": message,
         }
 
-        resp = self._http.put(
-            f"{self._base}/_matrix/client/v3/rooms/"
-            f"{quote(room_id, safe='')}/send/m.room.message/{txn_id}"
-            f"?user_id={quote(puppet_mxid, safe='')}",
-            json=payload
-        )
+        with span("send"):
+            resp = self._http.put(
+                f"{self._base}/_matrix/client/v3/rooms/"
+                f"{quote(room_id, safe='')}/send/m.room.message/{txn_id}"
+                f"?user_id={quote(puppet_mxid, safe='')}",
+                json=payload
+            )
 
         if not resp.ok:
             raise Exception(f"Message send failed: {resp.text}")
@@ -469,20 +791,33 @@ class BridgeService:
         Process a transaction pushed by Conduit's AppService API.
         Extracts m.room.message events and relays them to OpenSim.
         """
-        events = transaction_json.get("events", [])
-
+        # Skip our own puppets to prevent loops (line 654)
+        self._relay_events(ingest.filter_events(
+            transaction_json.get("events", []),
+            ingest.RELAY_TYPES, self._skip_senders,
+            self._index.may_contain_room,
+        ))
+
+    def handle_raw_transaction(self, raw: bytes):
+        """Same as handle_matrix_transaction, straight from the HTTP body."""
+        self._relay_events(ingest.parse_transaction(
+            raw, ingest.RELAY_TYPES, self._skip_senders,
+            self._index.may_contain_room,
+        ))
+
+    def _relay_events(self, events: list[dict]):
+        """
+        Relay pre-filtered m.room.message events to OpenSim, applying
+        m.room.member events to the name cache in stream order.
+        """
         for ev in events:
-            ev_type = ev.get("type")
-            if ev_type != "m.room.message":
+            if ev.get("type") == "m.room.member":
+                self._members.observe(ev)
                 continue
 
             sender = ev.get("sender", "")
             room_id = ev.get("room_id", "")
 
-            # Skip our own puppets to prevent loops (line 654)
-            if sender.startswith("@os_") or sender.startswith(f"@{self.cfg.bot_localpart}"):
-                continue
-
             content = ev.get("content", {})
             if content.get("msgtype") != "m.text":
                 continue
@@ -491,36 +826,78 @@ class BridgeService:
             if not message:
                 continue
 
-            # Look up which OpenSim group this room bridges to
+            with self.tracer.trace("matrix_to_os", None,
+                                   parse_ts_ms(ev.get("origin_server_ts")),
+                                   room=room_id, event_id=ev.get("event_id")):
+                self._relay_message(ev, room_id, sender, message)
+
+        self._maybe_prune_dedupe()
+
+    def _relay_message(self, ev: dict, room_id: str, sender: str,
+                       message: str):
+        span = self.tracer.span
+
+        # Look up which OpenSim group this room bridges to
+        with span("db.mapping"):
             group_uuid = self._get_group_for_room(room_id)
-            if not group_uuid:
-                continue
+        if not group_uuid:
+            return
 
-            # Get display name (check unsigned first, then use mxid)
-            from_name = sender
-            unsigned = ev.get("unsigned", {})
-            if isinstance(unsigned, dict):
-                dn = unsigned.get("sender_display_name", "")
-                if dn:
-                    from_name = dn
+        # Conduit retries a transaction until it is acknowledged
+        event_id = ev.get("event_id")
+        with span("dedupe"):
+            if event_id and not self._dedupe.first_seen(event_id):
+                return
 
-            # Relay to OpenSim
-            self.relay_to_opensim(group_uuid, from_name, message)
+        # Get display name (unsigned first, then the room's member
+        # cache, then the raw mxid)
+        from_name = None
+        unsigned = ev.get("unsigned", {})
+        if isinstance(unsigned, dict):
+            from_name = unsigned.get("sender_display_name") or None
+        if not from_name:
+            with span("profile"):
+                from_name = self._members.display_name(room_id, sender) or sender
+
+        # Relay to OpenSim
+        self.relay_to_opensim(group_uuid, from_name, message)
+
+    def _maybe_prune_dedupe(self):
+        """Drop old dedupe_events rows, at most once per interval."""
+        now = time.monotonic()
+        if now - self._last_dedupe_prune < DEDUPE_PRUNE_INTERVAL:
+            return
+        self._last_dedupe_prune = now
+        try:
+            removed = self.store.prune_events(DEDUPE_TTL)
+            if removed:
+                logger.debug(f"Pruned {removed} dedupe_events rows")
+        except Exception as e:
+            logger.warning(f"Dedupe prune failed: {e}")
+
+    def _fetch_joined_members(self, room_id: str) -> dict | None:
+        """Bulk {mxid: display_name} for a room, as the bridge bot."""
+        try:
+            resp = self._http.get(
+                f"{self._base}/_matrix/client/v3/rooms/"
+                f"{quote(room_id, safe='')}/joined_members",
+                timeout=10,
+            )
+        except requests.RequestException as e:
+            logger.warning(f"joined_members failed for {room_id}: {e}")
+            return None
+        if not resp.ok:
+            logger.warning(f"joined_members failed for {room_id}: {resp.text}")
+            return None
+        joined = resp.json().get("joined", {})
+        return {
+            mxid: (info or {}).get("display_name") or None
+            for mxid, info in joined.items()
+        }
 
     def _get_group_for_room(self, room_id: str) -> str | None:
         """Look up group_uuid for a bridged Matrix room."""
-        conn = self._db()
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT group_uuid FROM group_bridge_state "
-                "WHERE room_id=%s AND enabled=1 LIMIT 1",
-                (room_id,)
-            )
-            row = cursor.fetchone()
-            return row[0] if row else None
-        finally:
-            conn.close()
+        return self._index.group_for_room(room_id)
 
     # Port of: RelayMessageToOpenSimAsync (line 711)
 
@@ -532,52 +909,99 @@ class BridgeService:
             "from_name": from_name,
             "message": message,
         }
+        candidates = self.regions.candidates(group_uuid)
+
+        # Fan-out: each healthy simulator delivers to its own avatars
+        if self.cfg.regions_mode == "fanout":
+            up = [u for u in candidates if self.regions.available(u)]
+            if len(up) > 1:
+                results = self._inject_parallel(up, {**payload, "scope": "local"})
+                delivered = [u for u, err in results.items() if err is None]
+                if delivered:
+                    if len(delivered) < len(up):
+                        logger.warning(
+                            f"Matrix→OS: {len(up) - len(delivered)} of "
+                            f"{len(up)} regions failed for {group_uuid}")
+                    logger.info(f"Matrix→OS: [{from_name}] {message[:80]} "
+                                f"({len(delivered)} regions)")
+                    return
+
+        # Failover: whole-group injection via the best region that answers
+        errors = []
+        for url in candidates:
+            err = self._inject(url, payload)
+            if err is None:
+                logger.info(f"Matrix→OS: [{from_name}] {message[:80]} via {url}")
+                return
+            errors.append(f"{url}: {err}")
 
-        logger.info(
-            f"Matrix→OS: Sending to {self._region_url}/matrix/group-message"
-        )
-
-        resp = requests.post(
-            f"{self._region_url}/matrix/group-message",
-            json=payload,
-            headers={"X-Bridge-Secret": self._bridge_secret},
-            timeout=10,
-        )
+        raise Exception(f"OpenSim injection failed: {'; '.join(errors)}")
 
-        if not resp.ok:
-            raise Exception(f"OpenSim injection failed: {resp.text}")
+    def _inject(self, region_url: str, payload: dict) -> str | None:
+        """POST one injection; records region health. Returns an error or None."""
+        headers = {"X-Bridge-Secret": self._bridge_secret}
+        trace_id = self.tracer.current_id()
+        if trace_id:
+            headers[TRACE_HEADER] = trace_id
 
-        logger.info(f"Matrix→OS: [{from_name}] {message[:80]}")
+        logger.debug(f"Matrix→OS: Sending to {region_url}/matrix/group-message")
+        start = time.monotonic()
+        with self.tracer.span("region.inject", region=region_url) as sp:
+            try:
+                resp = self._region_http.post(
+                    f"{region_url}/matrix/group-message",
+                    json=payload,
+                    headers=headers,
+                    timeout=self.cfg.regions_timeout,
+                )
+                err = None if resp.ok else f"HTTP {resp.status_code}: {resp.text[:200]}"
+            except requests.RequestException as e:
+                resp, err = None, str(e)
+            sp.set(ok=err is None)
+            # MatrixGroupInjectModule reports its own share of the time
+            if trace_id and err is None:
+                try:
+                    sp.set(region_ms=resp.json().get("inject_ms"))
+                except ValueError:
+                    pass
+
+        self.regions.record(region_url, err is None,
+                            (time.monotonic() - start) * 1000)
+        if err:
+            logger.warning(f"Matrix→OS: {region_url} failed: {err}")
+        return err
+
+    def _inject_parallel(self, urls: list[str], payload: dict) -> dict:
+        """_inject to every URL at once. Returns {url: error or None}."""
+        futures = {
+            # Each task runs in a copy of our context so its spans land
+            # in the current trace
+            self._region_pool.submit(
+                contextvars.copy_context().run, self._inject, url, payload
+            ): url
+            for url in urls
+        }
+        wait(futures)
+        return {url: fut.result() for fut, url in futures.items()}
 
     # ─── Resync Group ───────────────────────────────────
     # Port of: ResyncGroupAsync (line 581)
 
-    def resync_group(self, group_uuid: str):
+    def resync_group(self, group_uuid: str) -> int:
         """
         Force resync of all puppet users for a group.
         Re-registers puppets, refreshes names/avatars/power levels.
+        Returns the number of members processed.
         """
-        conn = self._db()
+        room_id = self.store.get_room_for_group(group_uuid)
+        if not room_id:
+            raise Exception("Bridge not enabled for this group.")
+
+        # Get all group members from OpenSim tables
+        conn = self._groups_db()
         try:
             cursor = conn.cursor(dictionary=True)
-
-            # Get room ID
-            cursor.execute(
-                "SELECT room_id FROM group_bridge_state "
-                "WHERE group_uuid=%s AND enabled=1",
-                (group_uuid,)
-            )
-            row = cursor.fetchone()
-            if not row:
-                raise Exception("Bridge not enabled for this group.")
-            room_id = row["room_id"]
-
-            # Get all group members from OpenSim tables
-            cursor.execute("""
-                SELECT PrincipalID
-                FROM os_groups_membership
-                WHERE GroupID = %s
-            """, (group_uuid,))
+            cursor.execute(GROUPS_SQL["group_members"], (group_uuid,))
 
             members = []
             for member_row in cursor.fetchall():
@@ -598,8 +1022,12 @@ class BridgeService:
             puppet_mxid = f"@os_{avatar_uuid.replace('-', '')}:{self._hs}"
             try:
                 self.ensure_user_exists(avatar_uuid)
-                self.ensure_puppet_display_name(puppet_mxid, avatar_uuid, force=True)
-                self.ensure_puppet_avatar(puppet_mxid, avatar_uuid, force=True)
+                name_ok = self.ensure_puppet_display_name(
+                    puppet_mxid, avatar_uuid, force=True)
+                avatar_ok = self.ensure_puppet_avatar(
+                    puppet_mxid, avatar_uuid, force=True)
+                if name_ok and avatar_ok:
+                    self.store.put_puppet(avatar_uuid, puppet_mxid, avatar_uuid)
                 self.ensure_user_joined(room_id, puppet_mxid)
                 self.sync_matrix_power_level(
                     room_id, puppet_mxid, group_uuid, avatar_uuid, force=True
@@ -610,3 +1038,5 @@ class BridgeService:
         logger.info(
             f"Resync complete: {group_uuid} — {len(members)} members"
         )
+        return len(members)
+
@@ -0,0 +1,643 @@
+"""
+Lighthouse Bridge — Room-Affinity Sharding
+server.mode: "sharded" — a thin front dispatcher plus N shard workers.
+
+  ┌──────────────┐  mp.Queue[0]  ┌──────────────────────────┐
+  │  dispatcher  │──────────────▶│ worker 0: BridgeService, │
+  │  :9009 :9010 │  mp.Queue[1]  │ caches, pools, lanes     │
+  │ (index only) │──────────────▶│ worker 1: ...            │
+  └──────────────┘               └──────────────────────────┘
+
+The dispatcher owns both listeners. It authenticates requests, splits
+transactions by room_id and hashes each room to a fixed worker. An OpenSim
+event goes by the room its group is bridged to, which the dispatcher reads
+from its own group ↔ room index; the worker that injects a room's Matrix
+messages is then the one that learns its group's regions. Each worker
+drains its queue into a KeyedExecutor whose lanes run one key at a time.
+Events for a room are therefore handled in arrival order by the one
+process that caches that room.
+
+A request is only answered once its work items have been handled: each
+worker replies per item on its shard's reply queue, and the dispatcher
+answers 503 (Conduit retries) if any item is refused, times out
+(server.shard_ack_timeout), hits an exhausted DB pool or dies with its
+worker. That is the same at-least-once contract as single-process mode.
+
+/admin/* requests are proxied to worker 0 over its Unix socket. /ready
+asks every worker and is only 200 once all of them have warmed up. A
+shard takes no work until its worker has warmed up: the supervisor polls
+each new worker's /ready, and until then that shard's work gets 503.
+
+Workers are started with the "spawn" method, so they inherit neither the
+dispatcher's threads nor its listener sockets. A worker that dies may
+hold its queue's read lock, so WorkerSet gives the replacement fresh
+queues. Its unfinished items are answered 503, and until the replacement
+is up that shard's work is refused with 503; Conduit retries both.
+"""
+
+import itertools
+import json
+import logging
+import multiprocessing as mp
+import multiprocessing.connection
+import os
+import queue as queue_lib
+import signal
+import threading
+import time
+import zlib
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as futures_wait
+
+from flask import Flask, Response, jsonify, request
+
+from . import ingest
+from .db import DBPool, PoolExhausted
+from .storage import BridgeIndex, open_state_store
+from .trace import TRACE_HEADER, TRACE_TS_HEADER, parse_ts_ms
+from .server import (APPSERVICE_ROUTES, OPENSIM_ROUTES, RouteFilter,
+                     _UnixHTTPConnection, _build_servers, _start,
+                     make_listener, shard_for, worker_socket_path)
+
+logger = logging.getLogger("lighthouse.shard")
+
+_STOP = None
+
+
+class KeyedExecutor:
+    """
+    Runs work on `lanes` threads. Everything submitted under one key runs
+    on the same lane in submission order, so per-room ordering holds while
+    different rooms proceed in parallel.
+    """
+
+    def __init__(self, lanes: int, name: str = "lane"):
+        self._queues = [queue_lib.Queue() for _ in range(lanes)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), daemon=True,
+                             name=f"{name}-{i}")
+            for i, q in enumerate(self._queues)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, key: str, fn, *args):
+        # adler32, not the crc32 used for shards, so keys that share a
+        # shard still spread across its lanes
+        lane = zlib.adler32(key.encode("utf-8")) % len(self._queues)
+        self._queues[lane].put((fn, args))
+
+    def _run(self, q: queue_lib.Queue):
+        while True:
+            item = q.get()
+            if item is _STOP:
+                return
+            fn, args = item
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Shard task failed: {e}", exc_info=True)
+
+    def shutdown(self):
+        """Finish queued work, then stop the lanes."""
+        for q in self._queues:
+            q.put(_STOP)
+        for t in self._threads:
+            t.join()
+
+
+class ShardDispatcher:
+    """
+    Routes work items to per-worker multiprocessing queues.
+
+    Every item carries a ticket. The worker answers each ticket on its
+    shard's reply queue once the item has been handled, and submit()'s
+    Future resolves with the outcome: "ok", "busy" (retry later) or
+    "error". Items of a worker that dies resolve as "busy", so nothing is
+    acknowledged upstream until a worker has actually handled it.
+    """
+
+    def __init__(self, workers: int, queue_size: int,
+                 put_timeout: float = 1.0, ctx=None):
+        self._ctx = ctx or mp.get_context("spawn")
+        self._queue_size = queue_size
+        self.queues = [self._ctx.Queue(queue_size) for _ in range(workers)]
+        self.replies = [self._ctx.Queue() for _ in range(workers)]
+        self._down = [False] * workers
+        self._warm = [False] * workers
+        self._put_timeout = put_timeout
+        self._tickets = itertools.count()
+        self._pending: dict[int, tuple[int, Future]] = {}   # ticket → (shard, future)
+        self._lock = threading.Lock()
+        self._stopped = False
+        for i in range(workers):
+            threading.Thread(target=self._collect, args=(i,), daemon=True,
+                             name=f"shard-replies-{i}").start()
+
+    def mark_down(self, index: int):
+        """
+        Refuse work for a shard until replace_queue() brings it back, and
+        answer "busy" for everything its dead worker had not finished.
+        """
+        self._down[index] = True
+        with self._lock:
+            orphaned = [t for t, (shard, _) in self._pending.items()
+                        if shard == index]
+        for ticket in orphaned:
+            self._resolve(ticket, "busy")
+
+    def mark_ready(self, index: int):
+        """Start taking work for a shard whose worker has warmed up."""
+        self._warm[index] = True
+
+    def warming(self) -> list[int]:
+        """Live shards whose worker has not reported ready yet."""
+        return [i for i, (down, warm) in enumerate(zip(self._down, self._warm))
+                if not down and not warm]
+
+    def replace_queue(self, index: int):
+        """
+        Give a shard fresh queues for its replacement worker.
+
+        The old ones are abandoned, not drained: the dead worker may hold a
+        queue lock forever. mark_down() already answered its unfinished
+        items with "busy", so their senders retry them.
+        """
+        old = self.queues[index], self.replies[index]
+        self.queues[index] = self._ctx.Queue(self._queue_size)
+        self.replies[index] = self._ctx.Queue()
+        self._down[index] = False
+        self._warm[index] = False
+        for q in old:
+            q.cancel_join_thread()
+            q.close()
+        return self.queues[index]
+
+    def submit(self, key: str, kind: str, payload) -> Future | None:
+        """
+        Queue one item on the key's shard. Returns a Future for its outcome,
+        or None if the shard is full, down or warming.
+        """
+        index = shard_for(key, len(self.queues))
+        if self._down[index] or not self._warm[index]:
+            return None
+        ticket = next(self._tickets)
+        fut = Future()
+        with self._lock:
+            self._pending[ticket] = (index, fut)
+        try:
+            self.queues[index].put((kind, key, payload, ticket),
+                                   timeout=self._put_timeout)
+            return fut
+        except queue_lib.Full:
+            with self._lock:
+                self._pending.pop(ticket, None)
+            logger.warning(f"Shard queue full, rejecting {kind} for {key}")
+            return None
+
+    def _resolve(self, ticket: int, outcome: str):
+        with self._lock:
+            entry = self._pending.pop(ticket, None)
+        if entry and not entry[1].done():
+            entry[1].set_result(outcome)
+
+    def _collect(self, index: int):
+        """Resolve tickets as shard `index`'s worker answers them."""
+        while not self._stopped:
+            try:
+                ticket, outcome = self.replies[index].get(timeout=0.5)
+            except queue_lib.Empty:
+                continue
+            except (OSError, ValueError):      # replaced and closed
+                continue
+            self._resolve(ticket, outcome)
+
+    def wait(self, futures: list[Future], timeout: float) -> list[str]:
+        """Outcomes of `futures`; any still pending after `timeout` is "busy"."""
+        futures_wait(futures, timeout)
+        outcomes = []
+        for fut in futures:
+            if fut.done():
+                outcomes.append(fut.result())
+            else:
+                outcomes.append("busy")
+                with self._lock:
+                    for ticket, (_, f) in list(self._pending.items()):
+                        if f is fut:
+                            del self._pending[ticket]
+        return outcomes
+
+    def submit_transaction(self, events: list) -> list[Future] | None:
+        """
+        Split a transaction by room and queue each room's events. None if
+        any room was refused (the rest may still run; dedupe covers it).
+        """
+        by_room: dict[str, list] = {}
+        for ev in events:
+            if isinstance(ev, dict):
+                by_room.setdefault(ev.get("room_id", ""), []).append(ev)
+        futures = []
+        for room_id, room_events in by_room.items():
+            fut = self.submit(room_id, "txn", room_events)
+            if fut is None:
+                return None
+            futures.append(fut)
+        return futures
+
+    def dispatch_transaction(self, events: list, timeout: float) -> bool:
+        """
+        Queue a transaction and wait until every room's events are handled.
+        False means the homeserver should retry it (refused, timed out, a
+        worker died, or a DB pool was exhausted).
+        """
+        futures = self.submit_transaction(events)
+        if futures is None:
+            return False
+        return "busy" not in self.wait(futures, timeout)
+
+    def submit_os_event(self, evt: dict, key: str | None = None) -> Future | None:
+        """Queue an OpenSim event by `key` (its group's room) or group."""
+        return self.submit(key or evt["group_uuid"], "os_event", evt)
+
+    def dispatch_os_event(self, evt: dict, key: str | None,
+                          timeout: float) -> str:
+        """Queue an OpenSim event and wait for its outcome."""
+        fut = self.submit_os_event(evt, key)
+        if fut is None:
+            return "busy"
+        return self.wait([fut], timeout)[0]
+
+    def depths(self) -> list[int] | None:
+        """Items waiting per shard (None where the OS can't tell)."""
+        try:
+            return [q.qsize() for q in self.queues]
+        except NotImplementedError:     # macOS has no sem_getvalue
+            return None
+
+    def stop(self):
+        for q in self.queues:
+            q.put(_STOP)
+
+    def close(self):
+        """Stop the reply collectors (after the workers have exited)."""
+        self._stopped = True
+
+
+def bridge_handler(bridge):
+    """
+    Work-item handler backed by a worker's BridgeService. Returns the
+    outcome the single-process endpoints would answer with: "busy" (503,
+    retry) on an exhausted DB pool, "error" for other failures (logged).
+    """
+    def handle(kind: str, payload) -> str:
+        try:
+            if kind == "txn":
+                bridge.handle_matrix_transaction({"events": payload})
+            elif kind == "os_event":
+                bridge.relay_from_opensim(
+                    group_uuid=payload["group_uuid"],
+                    sender_uuid=payload["from_uuid"],
+                    sender_name=payload["from_name"],
+                    message=payload["message"],
+                    trace_id=payload.get("trace_id"),
+                    tap_ts_ms=payload.get("tap_ts_ms"),
+                    region_url=payload.get("region_url"),
+                )
+            else:
+                logger.warning(f"Unknown shard work item: {kind}")
+            return "ok"
+        except PoolExhausted as e:
+            logger.warning(f"Shard {kind} deferred: {e}")
+            return "busy"
+        except Exception as e:
+            logger.error(f"Shard {kind} error: {e}", exc_info=True)
+            return "error"
+    return handle
+
+
+def consume(q, handler, lanes: int, replies=None):
+    """
+    Worker loop: drain the shard queue into ordered lanes until STOP,
+    answering each item's ticket on `replies` with handler's outcome.
+    """
+    executor = KeyedExecutor(lanes)
+
+    def run(kind, payload, ticket):
+        outcome = "error"
+        try:
+            outcome = handler(kind, payload) or "ok"
+        finally:
+            if replies is not None:
+                replies.put((ticket, outcome))
+
+    while True:
+        item = q.get()
+        if item is _STOP:
+            break
+        kind, key, payload, ticket = item
+        executor.submit(key, run, kind, payload, ticket)
+    executor.shutdown()
+
+
+# ════════════════════════════════════════════════════════
+#  Dispatcher front end
+# ════════════════════════════════════════════════════════
+
+def probe_worker(run_dir: str, index: int, timeout: float) -> dict:
+    """Ask a shard worker's /ready over its Unix socket."""
+    conn = _UnixHTTPConnection(worker_socket_path(run_dir, index),
+                               timeout=timeout)
+    try:
+        conn.request("GET", "/ready")
+        resp = conn.getresponse()
+        body = json.loads(resp.read() or b"{}")
+        return {"worker": index, "ready": resp.status == 200,
+                "elapsed_ms": body.get("elapsed_ms"),
+                "ready_ms": body.get("ready_ms")}
+    except (OSError, ValueError) as e:
+        # Not started yet, respawning, or too busy to answer
+        return {"worker": index, "ready": False, "error": str(e)}
+    finally:
+        conn.close()
+
+
+def _open_index(cfg) -> BridgeIndex:
+    """Read-only group ↔ room index over the configured state store."""
+    pool = None
+    if cfg.state_backend == "mysql":
+        pool = DBPool(
+            "lighthouse_dispatch",
+            size=2,
+            wait_timeout=cfg.db_pool_wait_timeout,
+            host=cfg.db_host,
+            port=cfg.db_port,
+            database=cfg.db_name,
+            user=cfg.db_user,
+            password=cfg.db_password,
+        )
+    return BridgeIndex(open_state_store(cfg, pool), ttl=cfg.state_index_ttl)
+
+
+def create_dispatcher_app(cfg, dispatcher: ShardDispatcher,
+                          run_dir: str) -> Flask:
+    """
+    Listener app for the dispatcher process. No Matrix calls; the only DB
+    access is the group ↔ room index used to route OpenSim events.
+    """
+    from .app import cryptographic_equals, hs_authorized
+
+    app = Flask(__name__)
+    index = _open_index(cfg)
+
+    def _hs_authorized() -> bool:
+        return hs_authorized(request.headers.get("Authorization", ""),
+                             request.args.get("access_token"), cfg.hs_token)
+
+    skip_senders = ("@os_", f"@{cfg.bot_localpart}")
+
+    def _dispatch_raw() -> bool:
+        # Only events a worker would act on cross the process boundary
+        events = ingest.parse_transaction(
+            request.get_data(cache=False), ingest.RELAY_TYPES, skip_senders,
+        )
+        return dispatcher.dispatch_transaction(events, cfg.server_shard_ack_timeout)
+
+    # Acknowledged only once the shard workers have handled every room's
+    # events, as in single-process mode. Non-200 makes Conduit retry;
+    # dedupe drops the repeats.
+
+    @app.route("/_matrix/app/v1/transactions/<txn_id>", methods=["PUT"])
+    def appservice_transaction(txn_id):
+        if not _hs_authorized():
+            return jsonify({}), 401
+        if not _dispatch_raw():
+            logger.warning(f"Transaction {txn_id} deferred")
+            return jsonify({"error": "busy"}), 503, {"Retry-After": "1"}
+        return jsonify({})
+
+    @app.route("/transactions/<txn_id>", methods=["POST", "PUT"])
+    def appservice_transaction_alt(txn_id):
+        if not _hs_authorized():
+            return jsonify({}), 401
+        if not _dispatch_raw():
+            logger.warning(f"Transaction {txn_id} deferred")
+            return jsonify({"error": "busy"}), 503, {"Retry-After": "1"}
+        return jsonify({})
+
+    @app.route("/_matrix/app/v1/users/<path:user_id>", methods=["GET"])
+    def appservice_user_check(user_id):
+        if not _hs_authorized():
+            return jsonify({}), 401
+        return jsonify({})
+
+    @app.route("/os/event", methods=["POST"])
+    def opensim_event():
+        secret = request.headers.get("X-Bridge-Secret", "")
+        if not secret or not cryptographic_equals(secret, cfg.bridge_secret):
+            return jsonify({"error": "unauthorized"}), 401
+
+        evt = request.get_json(silent=True)
+        if not evt:
+            return jsonify({"error": "invalid payload"}), 400
+        if evt.get("type") != "group_message":
+            return jsonify({"error": "unknown event type"}), 400
+        missing = [k for k in ("group_uuid", "from_uuid", "from_name", "message")
+                   if k not in evt]
+        if missing:
+            return jsonify({"error": f"missing field: {missing[0]}"}), 400
+
+        # Trace headers ride along in the work item
+        evt["trace_id"] = request.headers.get(TRACE_HEADER) or None
+        evt["tap_ts_ms"] = parse_ts_ms(request.headers.get(TRACE_TS_HEADER))
+
+        key = index.shard_key(str(evt["group_uuid"]))
+        outcome = dispatcher.dispatch_os_event(evt, key,
+                                               cfg.server_shard_ack_timeout)
+        if outcome == "busy":
+            return jsonify({"error": "busy"}), 503, {"Retry-After": "1"}
+        if outcome == "error":
+            return jsonify({"error": "relay failed"}), 500
+        return jsonify({"ok": True})
+
+    @app.route("/admin/<path:rest>", methods=["GET", "POST"])
+    def admin_proxy(rest):
+        """Admin calls need a BridgeService — proxy them to worker 0."""
+        conn = _UnixHTTPConnection(worker_socket_path(run_dir, 0), timeout=300)
+        headers = {k: v for k, v in request.headers.items()
+                   if k.lower() not in ("host", "content-length")}
+        conn.request(request.method, request.full_path.rstrip("?"),
+                     body=request.get_data(), headers=headers)
+        resp = conn.getresponse()
+
+        def relay():
+            try:
+                while chunk := resp.read1(8192):
+                    yield chunk
+            finally:
+                conn.close()
+
+        return Response(relay(), status=resp.status,
+                        content_type=resp.getheader("Content-Type"))
+
+    @app.route("/health", methods=["GET"])
+    def health():
+        return jsonify({
+            "status": "ok",
+            "service": "lighthouse-bridge",
+            "mode": "sharded",
+            "queued": dispatcher.depths(),
+        })
+
+    def _worker_ready(index: int) -> dict:
+        return probe_worker(run_dir, index, cfg.startup_ready_timeout)
+
+    ready_pool = ThreadPoolExecutor(max_workers=len(dispatcher.queues),
+                                    thread_name_prefix="ready")
+
+    @app.route("/ready", methods=["GET"])
+    def ready():
+        workers = list(ready_pool.map(_worker_ready, range(len(dispatcher.queues))))
+        if all(w["ready"] for w in workers):
+            return jsonify({"status": "ready", "workers": workers})
+        return (jsonify({"status": "warming_up", "workers": workers}),
+                503, {"Retry-After": "1"})
+
+    return app
+
+
+# ════════════════════════════════════════════════════════
+#  Processes
+# ════════════════════════════════════════════════════════
+
+class WorkerSet:
+    """
+    One process per shard, running target(index, queue, replies, *args).
+
+    check() waits on the processes' sentinels, so a death is noticed at
+    once. The dead shard is marked down straight away and respawned on a
+    fresh queue after `respawn_delay`. Call it from the main thread only:
+    it starts processes.
+    """
+
+    def __init__(self, dispatcher: ShardDispatcher, target, args: tuple = (),
+                 *, respawn_delay: float = 1.0, ctx=None):
+        self.dispatcher = dispatcher
+        self._target = target
+        self._args = args
+        self._respawn_delay = respawn_delay
+        self._ctx = ctx or mp.get_context("spawn")
+        self.procs: list = [None] * len(dispatcher.queues)
+        self._respawn_at: dict[int, float] = {}
+
+    def _spawn(self, index: int):
+        p = self._ctx.Process(
+            target=self._target,
+            args=(index, self.dispatcher.queues[index],
+                  self.dispatcher.replies[index]) + self._args,
+            name=f"lighthouse-shard-{index}",
+        )
+        p.start()
+        self.procs[index] = p
+
+    def start(self):
+        for i in range(len(self.dispatcher.queues)):
+            self._spawn(i)
+
+    def check(self, timeout: float = 1.0) -> list[int]:
+        """Handle deaths and due respawns; returns the shards respawned."""
+        now = time.monotonic()
+        if self._respawn_at:
+            timeout = max(0.0, min(timeout,
+                                   min(self._respawn_at.values()) - now))
+        alive = {p.sentinel: i for i, p in enumerate(self.procs)
+                 if i not in self._respawn_at}
+        for sentinel in mp.connection.wait(list(alive), timeout):
+            i = alive[sentinel]
+            p = self.procs[i]
+            p.join()
+            logger.warning(f"Shard worker {i} exited ({p.exitcode}); "
+                           f"respawning in {self._respawn_delay:.0f}s")
+            self.dispatcher.mark_down(i)
+            self._respawn_at[i] = time.monotonic() + self._respawn_delay
+
+        respawned = []
+        now = time.monotonic()
+        for i, at in list(self._respawn_at.items()):
+            if now >= at:
+                del self._respawn_at[i]
+                self.dispatcher.replace_queue(i)
+                self._spawn(i)
+                respawned.append(i)
+        return respawned
+
+    def stop(self):
+        """Let every worker drain its queue, then wait for it to exit."""
+        self.dispatcher.stop()
+        for p in self.procs:
+            p.join()
+        self.dispatcher.close()
+
+
+def _worker_main(index: int, q, replies, config_path: str, run_dir: str,
+                 lanes: int):
+    from .app import create_app
+
+    # Ctrl+C reaches the whole process group; workers stop on the
+    # dispatcher's STOP item instead so their queues drain first.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    app = create_app(config_path=config_path)
+    bridge = app.config["bridge"]
+
+    # Private socket for proxied /admin/* calls
+    internal = make_listener(
+        f"unix://{worker_socket_path(run_dir, index)}", 0,
+        RouteFilter(app, APPSERVICE_ROUTES + OPENSIM_ROUTES, "internal"),
+        app.config["cfg"],
+    )
+    _start([internal])
+    logger.info(f"Shard worker {index} ready (pid {os.getpid()}, "
+                f"{lanes} lanes)")
+
+    consume(q, bridge_handler(bridge), lanes, replies)
+    internal.shutdown()
+    logger.info(f"Shard worker {index} drained and stopped")
+
+
+def serve_sharded(cfg, config_path: str):
+    """Dispatcher in this process, shard workers in child processes."""
+    workers = cfg.server_workers
+    run_dir = cfg.server_run_dir
+    os.makedirs(run_dir, exist_ok=True)
+
+    dispatcher = ShardDispatcher(workers, cfg.server_shard_queue_size)
+    # Started before the listeners, and "spawn"ed anyway, so no worker
+    # inherits the dispatcher's sockets
+    worker_set = WorkerSet(dispatcher, _worker_main,
+                           (config_path, run_dir, cfg.server_shard_lanes))
+    worker_set.start()
+
+    servers = _build_servers(create_dispatcher_app(cfg, dispatcher, run_dir), cfg)
+    _start(servers)
+    logger.info(f"Dispatcher on {cfg.appservice_host}:{cfg.appservice_port} "
+                f"and {cfg.opensim_host}:{cfg.opensim_port} → {workers} shards")
+
+    # Supervise from the main thread: respawn crashed workers on the same
+    # shard index (with a fresh queue) so room ownership holds, and open
+    # each shard to work once its (new) worker has warmed up
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    while not stop.is_set():
+        worker_set.check(timeout=1)
+        for i in dispatcher.warming():
+            if probe_worker(run_dir, i, cfg.startup_ready_timeout)["ready"]:
+                dispatcher.mark_ready(i)
+                logger.info(f"Shard {i} warmed up, taking work")
+
+    logger.info("Stopping listeners, draining shard queues...")
+    for srv in servers:
+        srv.shutdown()
+    worker_set.stop()
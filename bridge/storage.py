@@ -0,0 +1,856 @@
+"""
+Lighthouse Bridge — State Storage
+Backends for the bridge-owned tables:
+  group_bridge_state, avatar_mxid_map, dedupe_events, room_invites
+
+- MySQLStateStore:  the original layout (schema.sql), via a DBPool
+- SQLiteStateStore: embedded file in WAL mode — no network round-trip
+
+The OpenSim os_groups_* tables are never stored here; BridgeService
+always reads those from MySQL.
+"""
+
+import bisect
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import NamedTuple
+
+logger = logging.getLogger("lighthouse.storage")
+
+# Tables owned by the bridge, with their columns (for import/export)
+STATE_TABLES = {
+    "group_bridge_state": (
+        "group_uuid", "enabled", "room_id", "enabled_by", "enabled_at",
+    ),
+    "avatar_mxid_map": (
+        "avatar_uuid", "mxid", "display_name", "created_at",
+    ),
+    "dedupe_events": (
+        "event_id", "seen_at",
+    ),
+    "room_invites": (
+        "invite_code", "group_uuid", "room_id", "created_by",
+        "expires_at", "uses_remaining", "created_at",
+    ),
+}
+
+
+BRIDGE_COLUMNS = STATE_TABLES["group_bridge_state"]
+
+
+class BridgeFilter(NamedTuple):
+    """
+    One page of /admin/bridge/list: rows after `after` in group_uuid order.
+    enabled=None means any; since/until bound enabled_at (inclusive).
+    """
+    after: str = ""
+    limit: int = 100
+    enabled: int | None = 1
+    enabled_by: str | None = None
+    since: str | None = None
+    until: str | None = None
+
+    def matches(self, row: dict) -> bool:
+        """Same predicate as the SQL, for rows held in memory."""
+        if self.enabled is not None and int(row.get("enabled") or 0) != self.enabled:
+            return False
+        if self.enabled_by is not None and row.get("enabled_by") != self.enabled_by:
+            return False
+        if self.since or self.until:
+            at = _sqlite_value(row.get("enabled_at"))
+            if at is None:
+                return False
+            if self.since and at < self.since:
+                return False
+            if self.until and at > self.until:
+                return False
+        return True
+
+
+def bridge_page_sql(f: BridgeFilter, columns: tuple, ph: str) -> tuple[str, tuple]:
+    """Keyset-paginated SELECT for `f` using placeholder `ph`."""
+    where, params = ["group_uuid > " + ph], [f.after]
+    if f.enabled is not None:
+        where.append("enabled = " + ph)
+        params.append(f.enabled)
+    if f.enabled_by is not None:
+        where.append("enabled_by = " + ph)
+        params.append(f.enabled_by)
+    if f.since:
+        where.append("enabled_at >= " + ph)
+        params.append(f.since)
+    if f.until:
+        where.append("enabled_at <= " + ph)
+        params.append(f.until)
+    sql = (
+        f"SELECT {', '.join(columns)} FROM group_bridge_state "
+        f"WHERE {' AND '.join(where)} ORDER BY group_uuid LIMIT {int(f.limit)}"
+    )
+    return sql, tuple(params)
+
+
+class StateStore(ABC):
+    """Interface shared by the state backends."""
+
+    backend = "none"
+
+    # ─── Group ↔ Room mapping ───────────────────────────
+
+    @abstractmethod
+    def get_room_for_group(self, group_uuid: str) -> str | None:
+        ...
+
+    @abstractmethod
+    def get_group_for_room(self, room_id: str) -> str | None:
+        ...
+
+    @abstractmethod
+    def upsert_bridge(self, group_uuid: str, room_id: str, enabled_by: str,
+                      enabled_at: str | None = None):
+        """enabled_at ('YYYY-MM-DD HH:MM:SS', UTC) defaults to the DB's clock."""
+
+    @abstractmethod
+    def upsert_bridges(self, rows: list[tuple[str, str, str]],
+                       enabled_at: str | None = None) -> int:
+        """Batched upsert_bridge: rows of (group_uuid, room_id, enabled_by)."""
+
+    @abstractmethod
+    def list_bridges(self) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def list_bridges_page(self, f: BridgeFilter,
+                          columns: tuple = BRIDGE_COLUMNS) -> list[dict]:
+        """Up to f.limit rows matching f, ordered by group_uuid."""
+
+    # ─── Puppet cache (avatar_mxid_map) ─────────────────
+
+    @abstractmethod
+    def get_puppet(self, avatar_uuid: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def put_puppet(self, avatar_uuid: str, mxid: str, display_name: str):
+        ...
+
+    # ─── Event dedupe ───────────────────────────────────
+
+    @abstractmethod
+    def mark_event_seen(self, event_id: str) -> bool:
+        """Record an event ID. Returns False if it was already seen."""
+
+    @abstractmethod
+    def prune_events(self, max_age_seconds: int) -> int:
+        ...
+
+    # ─── Schema migrations (see migrations.py) ──────────
+
+    @abstractmethod
+    def schema_version(self) -> int:
+        ...
+
+    @abstractmethod
+    def apply_migrations(self, migrations) -> list[int]:
+        """Apply pending migrations in order. Returns versions applied."""
+
+    # ─── Bulk copy (import tool) ────────────────────────
+
+    @abstractmethod
+    def export_rows(self, table: str) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def import_rows(self, table: str, rows: list[dict]) -> int:
+        ...
+
+    def close(self):
+        pass
+
+
+# ════════════════════════════════════════════════════════
+#  MySQL
+# ════════════════════════════════════════════════════════
+
+class MySQLStateStore(StateStore):
+    """Bridge state in the MySQL/MariaDB database from schema.sql."""
+
+    backend = "mysql"
+
+    # Hot-path statements (also EXPLAINed by `run.py check-plans`)
+    SQL = {
+        "room_for_group":
+            "SELECT room_id FROM group_bridge_state "
+            "WHERE group_uuid=%s AND enabled=1",
+        "group_for_room":
+            "SELECT group_uuid FROM group_bridge_state "
+            "WHERE room_id=%s AND enabled=1 LIMIT 1",
+        "list_bridges":
+            "SELECT * FROM group_bridge_state WHERE enabled=1",
+        "get_puppet":
+            "SELECT mxid, display_name FROM avatar_mxid_map "
+            "WHERE avatar_uuid=%s",
+        "prune_events":
+            "DELETE FROM dedupe_events "
+            "WHERE seen_at < NOW() - INTERVAL %s SECOND",
+    }
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def _query_one(self, sql: str, params: tuple):
+        conn = self._pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+        finally:
+            conn.close()
+
+    def _write(self, sql: str, params: tuple) -> int:
+        conn = self._pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def get_room_for_group(self, group_uuid):
+        row = self._query_one(self.SQL["room_for_group"], (group_uuid,))
+        return row[0] if row else None
+
+    def get_group_for_room(self, room_id):
+        row = self._query_one(self.SQL["group_for_room"], (room_id,))
+        return row[0] if row else None
+
+    def upsert_bridge(self, group_uuid, room_id, enabled_by, enabled_at=None):
+        self._write(
+            "INSERT INTO group_bridge_state "
+            "(group_uuid, enabled, room_id, enabled_by, enabled_at) "
+            "VALUES (%s, 1, %s, %s, COALESCE(%s, UTC_TIMESTAMP())) "
+            "ON DUPLICATE KEY UPDATE enabled=1, "
+            "room_id=VALUES(room_id), enabled_by=VALUES(enabled_by), "
+            "enabled_at=VALUES(enabled_at)",
+            (group_uuid, room_id, enabled_by, enabled_at)
+        )
+
+    # Rows per multi-row INSERT (keeps statements well under
+    # max_allowed_packet)
+    UPSERT_CHUNK = 500
+
+    def upsert_bridges(self, rows, enabled_at=None):
+        if not rows:
+            return 0
+        conn = self._pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            for i in range(0, len(rows), self.UPSERT_CHUNK):
+                chunk = rows[i:i + self.UPSERT_CHUNK]
+                cursor.execute(
+                    "INSERT INTO group_bridge_state "
+                    "(group_uuid, enabled, room_id, enabled_by, enabled_at) "
+                    "VALUES " + ", ".join(
+                        ["(%s, 1, %s, %s, COALESCE(%s, UTC_TIMESTAMP()))"] * len(chunk))
+                    + " ON DUPLICATE KEY UPDATE enabled=1, "
+                    "room_id=VALUES(room_id), enabled_by=VALUES(enabled_by), "
+                    "enabled_at=VALUES(enabled_at)",
+                    tuple(v for row in chunk for v in (*row, enabled_at))
+                )
+            conn.commit()
+            return len(rows)
+        finally:
+            conn.close()
+
+    def list_bridges(self):
+        conn = self._pool.get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(self.SQL["list_bridges"])
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def list_bridges_page(self, f, columns=BRIDGE_COLUMNS):
+        sql, params = bridge_page_sql(f, columns, "%s")
+        conn = self._pool.get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def get_puppet(self, avatar_uuid):
+        row = self._query_one(self.SQL["get_puppet"], (avatar_uuid,))
+        return {"mxid": row[0], "display_name": row[1]} if row else None
+
+    def put_puppet(self, avatar_uuid, mxid, display_name):
+        self._write(
+            "INSERT INTO avatar_mxid_map (avatar_uuid, mxid, display_name) "
+            "VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE mxid=%s, display_name=%s",
+            (avatar_uuid, mxid, display_name, mxid, display_name)
+        )
+
+    def mark_event_seen(self, event_id):
+        # INSERT IGNORE affects 0 rows when the event_id already exists
+        return self._write(
+            "INSERT IGNORE INTO dedupe_events (event_id) VALUES (%s)",
+            (event_id,)
+        ) == 1
+
+    def prune_events(self, max_age_seconds):
+        return self._write(self.SQL["prune_events"], (max_age_seconds,))
+
+    def schema_version(self):
+        try:
+            row = self._query_one(
+                "SELECT COALESCE(MAX(version), 0) FROM schema_version", ()
+            )
+        except Exception:
+            return 0    # table not created yet
+        return int(row[0])
+
+    def apply_migrations(self, migrations):
+        # DDL auto-commits in MySQL, so concurrent workers serialize on a
+        # named lock instead of a transaction.
+        applied = []
+        conn = self._pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT GET_LOCK('lighthouse_migrate', 60)")
+            if cursor.fetchone()[0] != 1:
+                raise RuntimeError("Timed out waiting for migration lock")
+            try:
+                cursor.execute(
+                    "CREATE TABLE IF NOT EXISTS schema_version ("
+                    "version int(11) NOT NULL PRIMARY KEY, "
+                    "description varchar(255) NOT NULL, "
+                    "applied_at datetime DEFAULT current_timestamp())"
+                )
+                cursor.execute(
+                    "SELECT COALESCE(MAX(version), 0) FROM schema_version"
+                )
+                current = int(cursor.fetchone()[0])
+
+                for m in migrations:
+                    if m.version <= current:
+                        continue
+                    for stmt in m.mysql:
+                        try:
+                            cursor.execute(stmt)
+                        except Exception as e:
+                            # 1061 = duplicate index name: created by hand
+                            # or by a newer schema.sql — already applied
+                            if getattr(e, "errno", None) != 1061:
+                                raise
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, description) "
+                        "VALUES (%s, %s)",
+                        (m.version, m.description)
+                    )
+                    conn.commit()
+                    applied.append(m.version)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK('lighthouse_migrate')")
+                cursor.fetchone()
+        finally:
+            conn.close()
+        return applied
+
+    def export_rows(self, table):
+        cols = STATE_TABLES[table]
+        conn = self._pool.get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"SELECT {', '.join(cols)} FROM {table}")
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def import_rows(self, table, rows):
+        if not rows:
+            return 0
+        cols = STATE_TABLES[table]
+        sql = (
+            f"REPLACE INTO {table} ({', '.join(cols)}) "
+            f"VALUES ({', '.join(['%s'] * len(cols))})"
+        )
+        conn = self._pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(sql, [tuple(r[c] for c in cols) for r in rows])
+            conn.commit()
+            return len(rows)
+        finally:
+            conn.close()
+
+
+# ════════════════════════════════════════════════════════
+#  SQLite
+# ════════════════════════════════════════════════════════
+
+class SQLiteStateStore(StateStore):
+    """
+    Bridge state in a local SQLite file.
+
+    WAL mode lets every gunicorn worker read concurrently while one
+    writes; writes take BEGIN IMMEDIATE and wait on busy_timeout rather
+    than failing with "database is locked". Each thread gets its own
+    connection, and statements are constant strings so sqlite3's
+    per-connection statement cache keeps them prepared.
+    """
+
+    backend = "sqlite"
+
+    # Hot-path statements (also EXPLAINed by `run.py check-plans`)
+    SQL = {
+        "room_for_group":
+            "SELECT room_id FROM group_bridge_state "
+            "WHERE group_uuid=? AND enabled=1",
+        "group_for_room":
+            "SELECT group_uuid FROM group_bridge_state "
+            "WHERE room_id=? AND enabled=1 LIMIT 1",
+        "list_bridges":
+            "SELECT * FROM group_bridge_state WHERE enabled=1",
+        "get_puppet":
+            "SELECT mxid, display_name FROM avatar_mxid_map "
+            "WHERE avatar_uuid=?",
+        "prune_events":
+            "DELETE FROM dedupe_events "
+            "WHERE seen_at < datetime('now', ?)",
+    }
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self._busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        logger.info(f"SQLite state store opened: {path}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self._busy_timeout_ms / 1000,
+                isolation_level=None,       # explicit BEGIN for writes
+                check_same_thread=False,
+                cached_statements=64,
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={self._busy_timeout_ms}")
+            self._local.conn = conn
+        return conn
+
+    def _query_one(self, sql: str, params: tuple):
+        return self._conn().execute(sql, params).fetchone()
+
+    def _write(self, sql: str, params: tuple) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(sql, params)
+            conn.execute("COMMIT")
+            return cur.rowcount
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_room_for_group(self, group_uuid):
+        row = self._query_one(self.SQL["room_for_group"], (group_uuid,))
+        return row[0] if row else None
+
+    def get_group_for_room(self, room_id):
+        row = self._query_one(self.SQL["group_for_room"], (room_id,))
+        return row[0] if row else None
+
+    def upsert_bridge(self, group_uuid, room_id, enabled_by, enabled_at=None):
+        self._write(
+            "INSERT INTO group_bridge_state "
+            "(group_uuid, enabled, room_id, enabled_by, enabled_at) "
+            "VALUES (?, 1, ?, ?, COALESCE(?, datetime('now'))) "
+            "ON CONFLICT(group_uuid) DO UPDATE SET "
+            "enabled=1, room_id=excluded.room_id, "
+            "enabled_by=excluded.enabled_by, enabled_at=excluded.enabled_at",
+            (group_uuid, room_id, enabled_by, enabled_at)
+        )
+
+    def upsert_bridges(self, rows, enabled_at=None):
+        if not rows:
+            return 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO group_bridge_state "
+                "(group_uuid, enabled, room_id, enabled_by, enabled_at) "
+                "VALUES (?, 1, ?, ?, COALESCE(?, datetime('now'))) "
+                "ON CONFLICT(group_uuid) DO UPDATE SET "
+                "enabled=1, room_id=excluded.room_id, "
+                "enabled_by=excluded.enabled_by, enabled_at=excluded.enabled_at",
+                [(*row, enabled_at) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def list_bridges(self):
+        rows = self._conn().execute(self.SQL["list_bridges"]).fetchall()
+        return [dict(r) for r in rows]
+
+    def list_bridges_page(self, f, columns=BRIDGE_COLUMNS):
+        sql, params = bridge_page_sql(f, columns, "?")
+        return [dict(r) for r in self._conn().execute(sql, params).fetchall()]
+
+    def get_puppet(self, avatar_uuid):
+        row = self._query_one(self.SQL["get_puppet"], (avatar_uuid,))
+        return {"mxid": row[0], "display_name": row[1]} if row else None
+
+    def put_puppet(self, avatar_uuid, mxid, display_name):
+        self._write(
+            "INSERT INTO avatar_mxid_map (avatar_uuid, mxid, display_name) "
+            "VALUES (?, ?, ?) "
+            "ON CONFLICT(avatar_uuid) DO UPDATE SET "
+            "mxid=excluded.mxid, display_name=excluded.display_name",
+            (avatar_uuid, mxid, display_name)
+        )
+
+    def mark_event_seen(self, event_id):
+        return self._write(
+            "INSERT OR IGNORE INTO dedupe_events (event_id) VALUES (?)",
+            (event_id,)
+        ) == 1
+
+    def prune_events(self, max_age_seconds):
+        return self._write(
+            self.SQL["prune_events"], (f"-{int(max_age_seconds)} seconds",)
+        )
+
+    def schema_version(self):
+        try:
+            row = self._query_one(
+                "SELECT COALESCE(MAX(version), 0) FROM schema_version", ()
+            )
+        except sqlite3.OperationalError:
+            return 0    # table not created yet
+        return int(row[0])
+
+    def apply_migrations(self, migrations):
+        # SQLite DDL is transactional: each migration and its version row
+        # commit together, and BEGIN IMMEDIATE serializes other processes.
+        applied = []
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER NOT NULL PRIMARY KEY, "
+            "description TEXT NOT NULL, "
+            "applied_at TEXT DEFAULT (datetime('now')))"
+        )
+        for m in migrations:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = conn.execute(
+                    "SELECT COALESCE(MAX(version), 0) FROM schema_version"
+                ).fetchone()[0]
+                if m.version <= current:
+                    conn.execute("ROLLBACK")
+                    continue
+                for stmt in m.sqlite:
+                    conn.execute(stmt)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) "
+                    "VALUES (?, ?)",
+                    (m.version, m.description)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(m.version)
+        return applied
+
+    def export_rows(self, table):
+        cols = STATE_TABLES[table]
+        rows = self._conn().execute(
+            f"SELECT {', '.join(cols)} FROM {table}"
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def import_rows(self, table, rows):
+        if not rows:
+            return 0
+        cols = STATE_TABLES[table]
+        sql = (
+            f"INSERT OR REPLACE INTO {table} ({', '.join(cols)}) "
+            f"VALUES ({', '.join(['?'] * len(cols))})"
+        )
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(sql, [
+                tuple(_sqlite_value(r[c]) for c in cols) for r in rows
+            ])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _sqlite_value(value):
+    """MySQL datetimes come back as datetime objects; store them as text."""
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+# ════════════════════════════════════════════════════════
+#  Factory / import tool
+# ════════════════════════════════════════════════════════
+
+def open_state_store(cfg, pool=None) -> StateStore:
+    """Build the configured state backend (pool is required for MySQL)."""
+    if cfg.state_backend == "sqlite":
+        return SQLiteStateStore(cfg.state_db_path)
+    if cfg.state_backend == "mysql":
+        return MySQLStateStore(pool)
+    raise ValueError(f"Unknown state_store backend: {cfg.state_backend}")
+
+
+def copy_state(src: StateStore, dst: StateStore) -> dict:
+    """Copy every bridge-owned table from src to dst. Returns row counts."""
+    counts = {}
+    for table in STATE_TABLES:
+        rows = src.export_rows(table)
+        counts[table] = dst.import_rows(table, rows)
+        logger.info(f"Copied {counts[table]} rows: {table} "
+                    f"({src.backend} → {dst.backend})")
+    return counts
+
+
+# ════════════════════════════════════════════════════════
+#  In-memory bridge index
+# ════════════════════════════════════════════════════════
+
+class BridgeIndex:
+    """
+    In-memory copy of the enabled group_bridge_state rows.
+
+    Every Matrix event and OpenSim message needs the group ↔ room mapping;
+    this answers from a dict and reloads from the store once `ttl` seconds
+    have passed. Changes made by this process are applied immediately via
+    put().
+
+    A bridge enabled by another worker is not in the dict until the next
+    reload, so a miss is looked up in the store. A hit is remembered until
+    the reload. A miss is remembered for `miss_ttl` seconds, which keeps
+    traffic in unbridged rooms off the store.
+
+    One thread reloads at a time; the others keep answering from the old
+    copy meanwhile. A failed reload is retried after a delay that doubles
+    (up to `ttl`), so a store outage doesn't turn every lookup into a
+    full-table read.
+    """
+
+    def __init__(self, store: StateStore, ttl: float = 30.0,
+                 miss_ttl: float = 2.0):
+        self._store = store
+        self._ttl = ttl
+        self._miss_ttl = miss_ttl
+        self._lock = threading.Lock()
+        self._by_group: dict[str, dict] = {}
+        self._by_room: dict[str, str] = {}
+        self._sorted: list[str] | None = None     # group_uuids, for paging
+        self._loaded_at = 0.0
+        self._reload_lock = threading.Lock()
+        self._retry_at = 0.0
+        self._retry_delay = 0.0
+        # Store lookups since the last reload
+        self._found_rooms: dict[str, str] = {}    # group_uuid → room_id
+        self._found_groups: dict[str, str] = {}   # room_id → group_uuid
+        self._missing_groups: dict[str, float] = {}
+        self._missing_rooms: dict[str, float] = {}
+
+    def refresh(self):
+        rows = self._store.list_bridges()
+        by_group = {r["group_uuid"]: r for r in rows}
+        by_room = {r["room_id"]: r["group_uuid"] for r in rows if r["room_id"]}
+        with self._lock:
+            self._by_group, self._by_room = by_group, by_room
+            self._sorted = None
+            self._loaded_at = time.monotonic()
+            self._found_rooms, self._found_groups = {}, {}
+            self._missing_groups, self._missing_rooms = {}, {}
+
+    def fresh(self) -> bool:
+        return bool(self._loaded_at) and \
+            time.monotonic() - self._loaded_at < self._ttl
+
+    def _ensure(self):
+        if self.fresh() or time.monotonic() < self._retry_at:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return                      # another thread is reloading
+        try:
+            if self.fresh():
+                return
+            self.refresh()
+            self._retry_delay = 0.0
+        except Exception as e:
+            # Keep serving the last copy; misses still go to the store
+            self._retry_delay = min(max(self._retry_delay * 2, 1.0), self._ttl)
+            self._retry_at = time.monotonic() + self._retry_delay
+            logger.warning(f"Bridge index reload failed (retry in "
+                           f"{self._retry_delay:.0f}s): {e}")
+        finally:
+            self._reload_lock.release()
+
+    def _recently_missing(self, missing: dict, key: str) -> bool:
+        at = missing.get(key)
+        return at is not None and time.monotonic() - at < self._miss_ttl
+
+    def room_for_group(self, group_uuid: str) -> str | None:
+        self._ensure()
+        row = self._by_group.get(group_uuid)
+        if row:
+            return row["room_id"]
+        room_id = self._found_rooms.get(group_uuid)
+        if room_id or self._recently_missing(self._missing_groups, group_uuid):
+            return room_id
+
+        room_id = self._store.get_room_for_group(group_uuid)
+        with self._lock:
+            if room_id:
+                self._found_rooms[group_uuid] = room_id
+                self._found_groups[room_id] = group_uuid
+            else:
+                self._missing_groups[group_uuid] = time.monotonic()
+        return room_id
+
+    def group_for_room(self, room_id: str) -> str | None:
+        self._ensure()
+        group_uuid = self._by_room.get(room_id) or self._found_groups.get(room_id)
+        if group_uuid or self._recently_missing(self._missing_rooms, room_id):
+            return group_uuid
+
+        group_uuid = self._store.get_group_for_room(room_id)
+        with self._lock:
+            if group_uuid:
+                self._found_groups[room_id] = group_uuid
+                self._found_rooms[group_uuid] = room_id
+            else:
+                self._missing_rooms[room_id] = time.monotonic()
+        return group_uuid
+
+    def shard_key(self, group_uuid: str) -> str:
+        """
+        Key a group's OpenSim events are routed by: its bridged room, so they
+        reach the worker that handles that room's Matrix traffic (and so uses
+        the regions those events teach). Unbridged groups, or a failed
+        lookup, fall back to the group itself.
+        """
+        try:
+            return self.room_for_group(group_uuid) or group_uuid
+        except Exception as e:
+            logger.warning(f"Room lookup for {group_uuid} failed: {e}")
+            return group_uuid
+
+    def may_contain_room(self, room_id: str) -> bool:
+        """Cheap pre-filter: False only if the store just said no."""
+        if room_id in self._by_room or room_id in self._found_groups:
+            return True
+        return not self._recently_missing(self._missing_rooms, room_id)
+
+    def put(self, row: dict):
+        """Apply a row this process just wrote."""
+        with self._lock:
+            old = self._by_group.get(row["group_uuid"])
+            if old and old.get("room_id"):
+                self._by_room.pop(old["room_id"], None)
+            if row["group_uuid"] not in self._by_group:
+                self._sorted = None
+            self._by_group[row["group_uuid"]] = row
+            self._missing_groups.pop(row["group_uuid"], None)
+            if row.get("room_id"):
+                self._by_room[row["room_id"]] = row["group_uuid"]
+                self._missing_rooms.pop(row["room_id"], None)
+
+    def rows(self) -> list[dict]:
+        self._ensure()
+        return list(self._by_group.values())
+
+    def page(self, f: BridgeFilter) -> list[dict]:
+        """list_bridges_page answered from memory (enabled rows only)."""
+        with self._lock:
+            if self._sorted is None:
+                self._sorted = sorted(self._by_group)
+            keys, by_group = self._sorted, self._by_group
+
+        out = []
+        for key in keys[bisect.bisect_right(keys, f.after):]:
+            row = by_group.get(key)
+            if row is not None and f.matches(row):
+                out.append(row)
+                if len(out) >= f.limit:
+                    break
+        return out
+
+
+# ════════════════════════════════════════════════════════
+#  Event dedupe
+# ════════════════════════════════════════════════════════
+
+class EventDedupe:
+    """
+    In-memory LRU of recent event IDs in front of dedupe_events.
+
+    Conduit resends a transaction until it is acknowledged, usually within
+    seconds and to the same process, so repeats are answered from memory.
+    An event not in memory is recorded in the table, which still catches a
+    resend that arrives after a restart.
+    """
+
+    def __init__(self, store: StateStore, max_size: int = 10000):
+        self._store = store
+        self._max_size = max_size
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def first_seen(self, event_id: str) -> bool:
+        """Record an event ID. Returns False if it was already seen."""
+        with self._lock:
+            if event_id in self._seen:
+                self._seen.move_to_end(event_id)
+                self.hits += 1
+                return False
+
+        # Concurrent misses for one ID are settled by the table's key.
+        # A failed write is not remembered, so the resend is checked again.
+        new = self._store.mark_event_seen(event_id)
+        with self._lock:
+            self._seen[event_id] = None
+            self._seen.move_to_end(event_id)
+            while len(self._seen) > self._max_size:
+                self._seen.popitem(last=False)
+        return new
@@ -0,0 +1,331 @@
+"""
+Lighthouse Bridge — Message Tracing
+Per-message spans written to a local JSONL log, with no external collector.
+
+A trace ID travels with each message:
+
+  OpenSim → Matrix  TryMatrixBridgeTap sets X-Bridge-Trace (and
+                    X-Bridge-Trace-Ts, the tap time in unix ms) on /os/event
+  Matrix → OpenSim  the bridge mints an ID per event and sends it to
+                    MatrixGroupInjectModule, which echoes its own timing
+
+BridgeService wraps each relay in tracer.trace(...) and each stage in
+tracer.span(...). Spans are buffered per trace and written when it ends,
+and only if the trace is sampled (trace.sample_rate, decided from the ID so
+every hop agrees), slower than trace.slow_ms, or failed. Slow and failed
+traces are always kept.
+
+Each process writes its own rotating spans-<pid>.jsonl, so forked workers
+never share a file. `python run.py trace` reads them all back:
+
+    python run.py trace show <trace id | event id>
+    python run.py trace slow --limit 20
+"""
+
+import contextvars
+import glob
+import heapq
+import json
+import logging
+import os
+import time
+import uuid
+from logging.handlers import RotatingFileHandler
+
+logger = logging.getLogger("lighthouse.trace")
+
+TRACE_HEADER = "X-Bridge-Trace"
+TRACE_TS_HEADER = "X-Bridge-Trace-Ts"
+
+_current: contextvars.ContextVar = contextvars.ContextVar(
+    "lighthouse_trace", default=None
+)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def parse_ts_ms(value) -> int | None:
+    """Header/field → unix ms, or None if absent or malformed."""
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+class _NoopSpan:
+    """Stands in for a span when nothing is being traced."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, trace: "_Trace", name: str, attrs: dict):
+        self._trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        t1 = time.perf_counter()
+        error = f"{exc_type.__name__}: {exc}" if exc_type else None
+        self._trace.add(self.name, self._t0, t1, self.attrs, error)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _Trace:
+    def __init__(self, tracer: "Tracer", kind: str, trace_id: str,
+                 origin_ts_ms: int | None, attrs: dict):
+        self.tracer = tracer
+        self.kind = kind
+        self.trace_id = trace_id
+        self.attrs = attrs
+        self.spans: list[dict] = []
+        self.error = None
+        self.wall_start = time.time()
+        self.t0 = time.perf_counter()
+        if origin_ts_ms is not None:
+            # Time from the tap/origin server to us (clock skew included)
+            self.attrs["origin_lag_ms"] = round(
+                self.wall_start * 1000 - origin_ts_ms, 1)
+
+    def add(self, name: str, t0: float, t1: float, attrs: dict,
+            error: str | None = None):
+        span = {
+            "span": name,
+            "start_ms": round((t0 - self.t0) * 1000, 2),
+            "ms": round((t1 - t0) * 1000, 2),
+        }
+        if attrs:
+            span["attrs"] = attrs
+        if error:
+            span["error"] = error
+            self.error = self.error or f"{name}: {error}"
+        self.spans.append(span)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        total_ms = (time.perf_counter() - self.t0) * 1000
+        if exc_type and not self.error:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.tracer._finish(self, total_ms)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """Creates traces and spans; writes kept traces to the span log."""
+
+    def __init__(self, directory: str, *, enabled: bool = True,
+                 sample_rate: float = 0.01, slow_ms: float = 2000,
+                 max_bytes: int = 20 * 1024 * 1024, backups: int = 5,
+                 keep_days: float = 7):
+        self.enabled = enabled
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.kept = 0
+        self.dropped = 0
+        self._out = None
+
+        if not enabled:
+            return
+
+        os.makedirs(directory, exist_ok=True)
+        _prune_old_logs(directory, keep_days)
+
+        # A private logger gives us thread-safe appends and size rotation
+        self._out = logging.getLogger(f"lighthouse.trace.spans.{os.getpid()}")
+        self._out.propagate = False
+        self._out.setLevel(logging.INFO)
+        handler = RotatingFileHandler(
+            os.path.join(directory, f"spans-{os.getpid()}.jsonl"),
+            maxBytes=max_bytes, backupCount=backups, encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._out.handlers[:] = [handler]
+
+    @classmethod
+    def from_config(cls, cfg) -> "Tracer":
+        return cls(
+            cfg.trace_dir,
+            enabled=cfg.trace_enabled,
+            sample_rate=cfg.trace_sample_rate,
+            slow_ms=cfg.trace_slow_ms,
+            max_bytes=int(cfg.trace_max_mb * 1024 * 1024),
+            backups=cfg.trace_backups,
+            keep_days=cfg.trace_keep_days,
+        )
+
+    def trace(self, kind: str, trace_id: str | None = None,
+              origin_ts_ms: int | None = None, **attrs):
+        """Context manager for one message's trace (no-op if disabled)."""
+        if not self.enabled:
+            return _NOOP
+        return _Trace(self, kind, trace_id or new_trace_id(), origin_ts_ms, attrs)
+
+    def span(self, name: str, **attrs):
+        """Context manager timing one stage of the current trace."""
+        trace = _current.get()
+        if trace is None:
+            return _NOOP
+        return _Span(trace, name, attrs)
+
+    @staticmethod
+    def current_id() -> str | None:
+        trace = _current.get()
+        return trace.trace_id if trace is not None else None
+
+    def sampled(self, trace_id: str) -> bool:
+        """Head sampling from the ID, so every hop makes the same call."""
+        try:
+            bucket = int(trace_id[-8:], 16) / 0xFFFFFFFF
+        except ValueError:
+            bucket = (hash(trace_id) & 0xFFFFFFFF) / 0xFFFFFFFF
+        return bucket < self.sample_rate
+
+    def _finish(self, trace: _Trace, total_ms: float):
+        # "Slow" is judged end to end, so a message that sat in the tap's
+        # queue is kept even if the bridge itself was quick
+        e2e_ms = total_ms + max(0.0, trace.attrs.get("origin_lag_ms", 0.0))
+        keep = (trace.error is not None or e2e_ms >= self.slow_ms
+                or self.sampled(trace.trace_id))
+        if not keep:
+            self.dropped += 1
+            return
+        self.kept += 1
+
+        root = {
+            "trace": trace.trace_id,
+            "kind": trace.kind,
+            "ts": round(trace.wall_start, 3),
+            "ms": round(total_ms, 2),
+            "e2e_ms": round(e2e_ms, 2),
+            "attrs": trace.attrs,
+            "spans": trace.spans,
+        }
+        if trace.error:
+            root["error"] = trace.error
+        try:
+            self._out.info(json.dumps(root, default=str))
+        except Exception as e:
+            logger.warning(f"Span log write failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "kept": self.kept,
+            "dropped": self.dropped,
+        }
+
+
+def _prune_old_logs(directory: str, keep_days: float):
+    cutoff = time.time() - keep_days * 86400
+    for path in glob.glob(os.path.join(directory, "spans-*.jsonl*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+# ════════════════════════════════════════════════════════
+#  Reading the span log (run.py trace)
+# ════════════════════════════════════════════════════════
+
+def iter_traces(directory: str):
+    """Every trace record in the directory's span logs (any order)."""
+    for path in glob.glob(os.path.join(directory, "spans-*.jsonl*")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue    # torn line from a crash mid-write
+        except OSError:
+            continue
+
+
+def find_trace(directory: str, key: str) -> dict | None:
+    """Look up a trace by trace ID (or prefix) or by Matrix event ID."""
+    for rec in iter_traces(directory):
+        if rec.get("trace", "").startswith(key) or \
+                rec.get("attrs", {}).get("event_id") == key:
+            return rec
+    return None
+
+
+def slowest(directory: str, limit: int = 20, kind: str | None = None,
+            since: float | None = None) -> list[dict]:
+    recs = (
+        r for r in iter_traces(directory)
+        if (kind is None or r.get("kind") == kind)
+        and (since is None or r.get("ts", 0) >= since)
+    )
+    return heapq.nlargest(limit, recs,
+                          key=lambda r: r.get("e2e_ms", r.get("ms", 0)))
+
+
+def render_waterfall(rec: dict, width: int = 50) -> str:
+    """Text waterfall: one bar per span on the trace's time axis."""
+    spans = list(rec.get("spans", []))
+    lag = rec.get("attrs", {}).get("origin_lag_ms")
+    if lag is not None and lag > 0:
+        spans.insert(0, {"span": "origin → bridge", "start_ms": -lag, "ms": lag})
+
+    start = min([0.0] + [s["start_ms"] for s in spans])
+    end = max([rec.get("ms", 0)] + [s["start_ms"] + s["ms"] for s in spans])
+    scale = width / max(end - start, 0.001)
+
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(rec.get("ts", 0)))
+    lines = [
+        f"trace {rec.get('trace')}  {rec.get('kind')}  {when}  "
+        f"total {rec.get('ms', 0):.1f} ms",
+    ]
+    attrs = {k: v for k, v in rec.get("attrs", {}).items() if k != "origin_lag_ms"}
+    if attrs:
+        lines.append("  " + "  ".join(f"{k}={v}" for k, v in attrs.items()))
+    if rec.get("error"):
+        lines.append(f"  error: {rec['error']}")
+    lines.append("")
+
+    for s in spans:
+        offset = int((s["start_ms"] - start) * scale)
+        bar = max(1, int(s["ms"] * scale))
+        mark = "!" if s.get("error") else "█"
+        extra = ""
+        if s.get("attrs"):
+            extra = "  " + " ".join(f"{k}={v}" for k, v in s["attrs"].items())
+        if s.get("error"):
+            extra += f"  error: {s['error']}"
+        lines.append(
+            f"  {s['span']:<18} {s['start_ms']:>9.1f} {s['ms']:>9.1f} ms  "
+            f"|{' ' * offset}{mark * bar}{' ' * max(0, width - offset - bar)}|{extra}"
+        )
+    return "\n".join(lines)
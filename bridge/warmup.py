@@ -0,0 +1,186 @@
+"""
+Lighthouse Bridge — Start-up Warm-up
+Gets a worker's pools and caches ready in the background, so the worker
+starts serving straight away and /ready reports when it is warm.
+
+BridgeService builds nothing expensive in its constructor. Its warm-up
+steps (prefill DB pools, apply migrations, load the group ↔ room index,
+check Conduit) run here in parallel, each one starting as soon as the steps
+it depends on are done. A failing step is retried with exponential backoff
+(capped at startup.retry_max seconds), so a database that comes up late
+delays readiness instead of crash-looping the worker.
+
+A step still failing startup.give_up_after seconds in is given up: the
+worker becomes ready without it (/ready lists it under "degraded") rather
+than staying unready, and the request paths deal with the dependency as
+they would with any outage (pools and the index load on first use).
+Optional steps, such as migrations, never hold up readiness.
+
+Readiness latches: once set, the worker stays ready. Anything that fails
+after that is handled by the normal request paths.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger("lighthouse.warmup")
+
+
+_SETTLED = ("ok", "gave_up")
+
+
+class _Step:
+    def __init__(self, name: str, fn, after: tuple, required: bool):
+        self.name = name
+        self.fn = fn
+        self.after = after
+        self.required = required
+        # pending → running → ok, or → failed → running ... → gave_up
+        self.state = "pending"
+        self.attempts = 0
+        self.ms = None
+        self.error = None
+        self.retry_at = 0.0
+
+    def as_dict(self) -> dict:
+        d = {"state": self.state, "attempts": self.attempts}
+        if not self.required:
+            d["required"] = False
+        if self.ms is not None:
+            d["ms"] = self.ms
+        if self.error and self.state != "ok":
+            d["error"] = self.error
+        return d
+
+
+class WarmUp:
+    """Runs named start-up steps in dependency order, in parallel."""
+
+    def __init__(self, *, retry_base: float = 0.5, retry_max: float = 30,
+                 give_up_after: float = 120, parallel: int = 4):
+        self._steps: dict[str, _Step] = {}
+        self._retry_base = retry_base
+        self._retry_max = retry_max
+        self._give_up_after = give_up_after
+        self._parallel = parallel
+        self._ready = threading.Event()
+        self._started = None
+        self._ready_ms = None
+        self._thread = None
+
+    def add(self, name: str, fn, after: tuple = (), *, required: bool = True):
+        """
+        Register a step; it runs once every step named in `after` has
+        succeeded or been given up. Readiness doesn't wait for a step that
+        isn't `required`.
+        """
+        missing = [a for a in after if a not in self._steps]
+        if missing:
+            raise ValueError(f"warm-up step {name} depends on unknown {missing[0]}")
+        self._steps[name] = _Step(name, fn, tuple(after), required)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def start(self):
+        """Run the steps on a background thread (returns immediately)."""
+        if self._thread is not None:
+            return
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="warmup")
+        self._thread.start()
+
+    def _run(self):
+        steps = self._steps.values()
+        running = {}    # future → step
+        deadline = None
+        if self._give_up_after:
+            deadline = self._started + self._give_up_after
+        with ThreadPoolExecutor(max_workers=self._parallel,
+                                thread_name_prefix="warmup") as pool:
+            while True:
+                now = time.monotonic()
+                for step in steps:
+                    if step.state == "failed" and deadline and now >= deadline:
+                        self._give_up(step)
+                    elif step.state in ("pending", "failed") and \
+                            now >= step.retry_at and \
+                            all(self._steps[a].state in _SETTLED for a in step.after):
+                        step.state = "running"
+                        step.attempts += 1
+                        running[pool.submit(self._attempt, step)] = step
+
+                if not self.ready and all(s.state in _SETTLED
+                                          for s in steps if s.required):
+                    self._mark_ready()
+                if all(s.state in _SETTLED for s in steps):
+                    break
+
+                # Sleep until a step finishes, a retry is due or it is time
+                # to give up on the failing ones
+                wake = [s.retry_at for s in steps if s.state == "failed"]
+                if wake and deadline:
+                    wake.append(deadline)
+                timeout = max(0.0, min(wake) - now) if wake else None
+                if not running:
+                    time.sleep(timeout or 0)
+                    continue
+                done, _ = wait(running, timeout=timeout,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+
+    def _mark_ready(self):
+        self._ready_ms = round((time.monotonic() - self._started) * 1000, 1)
+        self._ready.set()
+        done = [s for s in self._steps.values() if s.state == "ok"]
+        gave_up = [s.name for s in self._steps.values() if s.state == "gave_up"]
+        logger.info(f"Warm-up complete in {self._ready_ms:.0f} ms: " + ", ".join(
+            f"{s.name} {s.ms:.0f} ms" for s in done)
+            + (f"; without {', '.join(gave_up)}" if gave_up else ""))
+
+    def _give_up(self, step: _Step):
+        step.state = "gave_up"
+        logger.error(f"Warm-up step {step.name} gave up after "
+                     f"{step.attempts} attempts ({step.error}); carrying on "
+                     f"without it")
+
+    def _attempt(self, step: _Step):
+        t0 = time.perf_counter()
+        try:
+            step.fn()
+        except Exception as e:
+            step.ms = round((time.perf_counter() - t0) * 1000, 1)
+            step.error = f"{type(e).__name__}: {e}"
+            delay = min(self._retry_base * 2 ** (step.attempts - 1),
+                        self._retry_max)
+            step.retry_at = time.monotonic() + delay
+            step.state = "failed"
+            logger.warning(f"Warm-up step {step.name} failed "
+                           f"(attempt {step.attempts}, retry in {delay:.1f}s): "
+                           f"{step.error}")
+            return
+        step.ms = round((time.perf_counter() - t0) * 1000, 1)
+        step.state = "ok"
+        if not step.required and self.ready:
+            logger.info(f"Warm-up step {step.name} done ({step.ms:.0f} ms)")
+
+    def status(self) -> dict:
+        elapsed = None
+        if self._started is not None:
+            elapsed = round((time.monotonic() - self._started) * 1000, 1)
+        return {
+            "ready": self.ready,
+            "ready_ms": self._ready_ms,
+            "elapsed_ms": elapsed,
+            "degraded": [n for n, s in self._steps.items()
+                         if self.ready and s.state != "ok"],
+            "steps": {name: s.as_dict() for name, s in self._steps.items()},
+        }
@@ -6,30 +6,210 @@ OpenSim ↔ Matrix/Conduit Chat Bridge
 Usage:
     python run.py                     # Default config.yaml
     python run.py --config my.yaml    # Custom config
+    python run.py import-state        # Copy bridge tables MySQL → SQLite
+    python run.py migrate             # Apply pending schema migrations
+    python run.py check-plans         # Fail if a hot query full-scans
+    python run.py trace slow          # Slowest traced messages
+    python run.py trace show <id>     # Stage waterfall for one message
 """
 import argparse
-from bridge.app import create_app
+import logging
+import sys
+
+
+def _cli_logging():
+    logging.basicConfig(level=logging.INFO,
+                        format="%(levelname)s %(name)s: %(message)s")
+
+
+def _state_pool(cfg, name: str):
+    from bridge.db import DBPool
+    return DBPool(
+        name,
+        size=1,
+        wait_timeout=cfg.db_pool_wait_timeout,
+        host=cfg.db_host,
+        port=cfg.db_port,
+        database=cfg.db_name,
+        user=cfg.db_user,
+        password=cfg.db_password,
+    )
+
+
+def serve(args):
+    from bridge.server import serve as serve_listeners
+
+    # Both the AppService and OpenSim listeners run from this process
+    print(f"\n🔦 Lighthouse Bridge v0.1.0")
+    print(f"   Press Ctrl+C to stop\n")
+
+    serve_listeners(config_path=args.config)
+
+
+def import_state(args):
+    """Copy bridge-owned tables between the MySQL DB and the SQLite file."""
+    from bridge.config import Config
+    from bridge.migrations import migrate
+    from bridge.storage import MySQLStateStore, SQLiteStateStore, copy_state
+
+    cfg = Config(args.config)
+    _cli_logging()
+
+    mysql_store = MySQLStateStore(_state_pool(cfg, "lighthouse_import"))
+    sqlite_store = SQLiteStateStore(cfg.state_db_path)
+    migrate(mysql_store)
+    migrate(sqlite_store)
+
+    if args.reverse:
+        counts = copy_state(sqlite_store, mysql_store)
+    else:
+        counts = copy_state(mysql_store, sqlite_store)
+
+    for table, n in counts.items():
+        print(f"   {table:<20} {n} rows")
+    if not args.reverse and cfg.state_backend != "sqlite":
+        print("\n   Set state_store.backend: \"sqlite\" in config.yaml to use it.")
+
+
+def run_migrations(args):
+    """Apply pending schema migrations to the configured state store."""
+    from bridge.config import Config
+    from bridge.migrations import LATEST_VERSION, migrate
+    from bridge.storage import open_state_store
+
+    cfg = Config(args.config)
+    _cli_logging()
+
+    pool = _state_pool(cfg, "lighthouse_migrate") \
+        if cfg.state_backend == "mysql" else None
+    store = open_state_store(cfg, pool)
+    applied = migrate(store)
+    print(f"   {store.backend}: schema at version {store.schema_version()} "
+          f"(latest {LATEST_VERSION}), applied {applied or 'nothing'}")
+
+
+def check_plans(args):
+    """EXPLAIN every hot query; exit 1 if any regressed to a full scan."""
+    from bridge import plancheck
+
+    _cli_logging()
+    results = plancheck.check_sqlite()
+
+    if args.mysql:
+        from bridge.config import Config
+        from bridge.db import DBPool
+
+        cfg = Config(args.config)
+        state_pool = _state_pool(cfg, "lighthouse_plans") \
+            if cfg.state_backend == "mysql" else None
+        groups_pool = DBPool(
+            "lighthouse_plans_groups",
+            size=1,
+            wait_timeout=cfg.groups_db_pool_wait_timeout,
+            host=cfg.groups_db_host,
+            port=cfg.groups_db_port,
+            database=cfg.groups_db_name,
+            user=cfg.groups_db_user,
+            password=cfg.groups_db_password,
+        )
+        results += plancheck.check_mysql(state_pool, groups_pool)
+
+    failed = [r for r in results if not r.ok]
+    for r in results:
+        mark = "ok  " if r.ok else "SCAN"
+        print(f"   [{mark}] {r.target:<14} {r.query:<16} {r.plan}")
+    if failed:
+        print(f"\n   {len(failed)} hot quer{'y' if len(failed) == 1 else 'ies'} "
+              f"regressed to a full scan")
+        sys.exit(1)
+    print(f"\n   None of {len(results)} hot queries regressed to a full scan")
+
+
+def show_traces(args):
+    """Read the local span log: one message's waterfall, or the slowest."""
+    import time
+    from bridge import trace
+
+    if args.dir:
+        directory = args.dir
+    else:
+        from bridge.config import Config
+        directory = Config(args.config).trace_dir
+
+    if args.trace_command == "show":
+        rec = trace.find_trace(directory, args.key)
+        if rec is None:
+            print(f"   No trace matching {args.key} in {directory} "
+                  f"(not sampled, or rotated out)")
+            sys.exit(1)
+        print(trace.render_waterfall(rec))
+        return
+
+    since = time.time() - args.hours * 3600 if args.hours else None
+    recs = trace.slowest(directory, args.limit, args.kind, since)
+    if not recs:
+        print(f"   No traces in {directory}")
+        return
+    print(f"   {'e2e ms':>9} {'bridge ms':>9}  {'when':<19}  {'kind':<12}  "
+          f"{'trace':<32}  slowest stage")
+    for r in recs:
+        spans = r.get("spans") or [{}]
+        worst = max(spans, key=lambda s: s.get("ms", 0))
+        stage = f"{worst.get('span', '-')} {worst.get('ms', 0):.0f} ms" \
+            if worst else "-"
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r.get("ts", 0)))
+        flag = "  ERROR" if r.get("error") else ""
+        print(f"   {r.get('e2e_ms', r.get('ms', 0)):>9.1f} {r.get('ms', 0):>9.1f}  "
+              f"{when:<19}  {r.get('kind', ''):<12}  {r.get('trace', ''):<32}  "
+              f"{stage}{flag}")
+
 
 def main():
     parser = argparse.ArgumentParser(description="🔦 Lighthouse Bridge")
     parser.add_argument("--config", "-c", help="Path to config.yaml")
-    args = parser.parse_args()
+    sub = parser.add_subparsers(dest="command")
 
-    app = create_app(config_path=args.config)
-    cfg = app.config["cfg"]
+    sub.add_parser("serve", help="Run the bridge (default)")
 
-    # Note: In production, use gunicorn or run two separate instances
-    # for the two ports. For development, we bind to the opensim port.
-    print(f"\n🔦 Lighthouse Bridge v0.1.0")
-    print(f"   Listening on {cfg.opensim_host}:{cfg.opensim_port}")
-    print(f"   AppService endpoint on {cfg.appservice_host}:{cfg.appservice_port}")
-    print(f"   Press Ctrl+C to stop\n")
+    imp = sub.add_parser(
+        "import-state",
+        help="Copy bridge-owned tables from MySQL into the SQLite state file",
+    )
+    imp.add_argument("--reverse", action="store_true",
+                     help="Copy SQLite → MySQL instead")
 
-    app.run(
-        host=cfg.opensim_host,
-        port=cfg.opensim_port,
-        debug=False,
+    sub.add_parser("migrate", help="Apply pending schema migrations")
+
+    plans = sub.add_parser(
+        "check-plans",
+        help="EXPLAIN hot queries on a seeded local DB; fail on full scans",
     )
+    plans.add_argument("--mysql", action="store_true",
+                       help="Also EXPLAIN against the configured MySQL DBs")
+
+    tr = sub.add_parser("trace", help="Inspect the local message span log")
+    tr.add_argument("--dir", help="Span log directory (default: trace.dir)")
+    tr_sub = tr.add_subparsers(dest="trace_command", required=True)
+    tr_show = tr_sub.add_parser("show", help="Waterfall for one message")
+    tr_show.add_argument("key", help="Trace ID (or prefix) or Matrix event ID")
+    tr_slow = tr_sub.add_parser("slow", help="List the slowest traces")
+    tr_slow.add_argument("--limit", type=int, default=20)
+    tr_slow.add_argument("--kind", choices=("os_to_matrix", "matrix_to_os"))
+    tr_slow.add_argument("--hours", type=float,
+                         help="Only traces from the last N hours")
+
+    args = parser.parse_args()
+
+    if args.command == "import-state":
+        import_state(args)
+    elif args.command == "migrate":
+        run_migrations(args)
+    elif args.command == "check-plans":
+        check_plans(args)
+    elif args.command == "trace":
+        show_traces(args)
+    else:
+        serve(args)
 
 if __name__ == "__main__":
     main()
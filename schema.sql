@@ -5,6 +5,9 @@
 -- Run this on your bridge database:
 --   mysql -u root -p < schema.sql
 --
+-- Later schema changes are versioned in bridge/migrations.py and
+-- applied at startup or with:  python run.py migrate
+--
 -- Note: os_groups_membership and os_groups_roles tables
 -- must be accessible (same DB, replication, or remote access)
 -- ============================================================
@@ -21,7 +24,9 @@ CREATE TABLE IF NOT EXISTS `group_bridge_state` (
   `room_id` varchar(128) DEFAULT NULL,
   `enabled_by` char(36) DEFAULT NULL,
   `enabled_at` datetime DEFAULT NULL,
-  PRIMARY KEY (`group_uuid`)
+  PRIMARY KEY (`group_uuid`),
+  KEY `idx_gbs_room_enabled` (`room_id`, `enabled`),
+  KEY `idx_gbs_enabled_group` (`enabled`, `group_uuid`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Avatar to Matrix ID mapping (puppet user cache)
@@ -46,7 +51,8 @@ CREATE TABLE IF NOT EXISTS `group_room_map` (
 CREATE TABLE IF NOT EXISTS `dedupe_events` (
   `event_id` varchar(128) NOT NULL,
   `seen_at` datetime DEFAULT current_timestamp(),
-  PRIMARY KEY (`event_id`)
+  PRIMARY KEY (`event_id`),
+  KEY `idx_dedupe_seen_at` (`seen_at`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Invite codes (for sharing Matrix room access)
@@ -0,0 +1,131 @@
+"""
+BridgeIndex: store fallback and miss cache, TTL reloads, and reload
+backoff / single-flight when the store is failing or slow.
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.migrations import migrate  # noqa: E402
+from bridge.storage import BridgeIndex, SQLiteStateStore  # noqa: E402
+
+
+class CountingStore:
+    """Stands in for a StateStore: counts calls, can fail or stall."""
+
+    def __init__(self, rows=(), fail=False, delay=0.0):
+        self.rows = list(rows)
+        self.fail = fail
+        self.delay = delay
+        self.reloads = 0
+        self.lookups = 0
+
+    def list_bridges(self):
+        self.reloads += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("store down")
+        return list(self.rows)
+
+    def get_room_for_group(self, group_uuid):
+        self.lookups += 1
+        return next((r["room_id"] for r in self.rows
+                     if r["group_uuid"] == group_uuid), None)
+
+    def get_group_for_room(self, room_id):
+        self.lookups += 1
+        return next((r["group_uuid"] for r in self.rows
+                     if r["room_id"] == room_id), None)
+
+
+def _row(n):
+    return {"group_uuid": f"g{n}", "enabled": 1, "room_id": f"!r{n}:hs",
+            "enabled_by": "u", "enabled_at": None}
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    migrate(store)
+    return store
+
+
+def test_bridge_enabled_elsewhere_is_found_in_the_store(sqlite_store):
+    index = BridgeIndex(sqlite_store, ttl=60)
+    assert index.room_for_group("g1") is None
+
+    # Another worker enables it; the remembered miss expires quickly
+    sqlite_store.upsert_bridge("g1", "!r1:hs", "u")
+    index._miss_ttl = 0
+    assert index.room_for_group("g1") == "!r1:hs"
+    assert index.group_for_room("!r1:hs") == "g1"
+    assert index.may_contain_room("!r1:hs")
+
+
+def test_misses_are_remembered_for_miss_ttl():
+    store = CountingStore()
+    index = BridgeIndex(store, ttl=60, miss_ttl=60)
+    for _ in range(20):
+        assert index.group_for_room("!unbridged:hs") is None
+    assert store.lookups == 1
+    assert not index.may_contain_room("!unbridged:hs")
+
+    index.put(_row(7) | {"room_id": "!unbridged:hs"})
+    assert index.may_contain_room("!unbridged:hs")
+    assert index.group_for_room("!unbridged:hs") == "g7"
+
+
+def test_reloads_after_ttl():
+    store = CountingStore([_row(1)])
+    index = BridgeIndex(store, ttl=0.05)
+    assert index.room_for_group("g1") == "!r1:hs"
+    assert store.reloads == 1
+
+    store.rows.append(_row(2))
+    assert index.room_for_group("g1") == "!r1:hs"
+    assert store.reloads == 1          # still fresh
+    time.sleep(0.06)
+    assert [r["group_uuid"] for r in index.rows()] == ["g1", "g2"]
+    assert store.reloads == 2
+
+
+def test_failed_reload_backs_off():
+    store = CountingStore([_row(1)], fail=True)
+    index = BridgeIndex(store, ttl=30, miss_ttl=30)
+    for _ in range(100):
+        index.room_for_group("g1")
+    assert store.reloads == 1
+    assert index._retry_at > time.monotonic()
+
+    # Once due, the next lookup retries and a success resets the delay
+    store.fail = False
+    index._retry_at = 0.0
+    index.room_for_group("g1")
+    assert store.reloads == 2
+    assert index.fresh() and index._retry_delay == 0.0
+
+
+def test_one_thread_reloads_while_others_use_the_old_copy():
+    store = CountingStore([_row(1)])
+    index = BridgeIndex(store, ttl=0.01)
+    index.refresh()
+    time.sleep(0.02)
+    store.delay = 0.3
+
+    answers = []
+    threads = [threading.Thread(
+        target=lambda: answers.append(index.room_for_group("g1")))
+        for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert answers == ["!r1:hs"] * 8
+    assert store.reloads == 2          # the initial load plus one reload
@@ -0,0 +1,75 @@
+"""
+Bulk enable: mappings are written in one batch at the end, and a failed
+write is reported on the stream instead of cutting it off.
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.config import Config  # noqa: E402
+from bridge.migrations import migrate  # noqa: E402
+from bridge.service import BridgeService  # noqa: E402
+
+
+@pytest.fixture
+def bridge(tmp_path, monkeypatch):
+    cfg = tmp_path / "config.yaml"
+    cfg.write_text(
+        "matrix: {as_token: as, hs_token: hs}\n"
+        "opensim: {bridge_secret: secret}\n"
+        "state_store: {backend: sqlite, path: %s}\n"
+        "trace: {enabled: false}\n" % (tmp_path / "state.db"))
+    service = BridgeService(Config(str(cfg)))
+    migrate(service.store)
+    monkeypatch.setattr(
+        service, "_provision_room",
+        lambda group_uuid, name, founder: (f"!{group_uuid}:hs", True))
+    return service
+
+
+def _groups(*uuids):
+    return [{"group_uuid": g, "group_name": g, "founder_avatar_uuid": "u"}
+            for g in uuids]
+
+
+def test_new_mappings_are_stored_in_one_batch(bridge, monkeypatch):
+    bridge.store.upsert_bridge("g0", "!g0:hs", "u")
+    batches = []
+    upsert = bridge.store.upsert_bridges
+    monkeypatch.setattr(bridge.store, "upsert_bridges",
+                        lambda rows, at=None: batches.append(rows)
+                        or upsert(rows, at))
+
+    lines = list(bridge.enable_bridges(_groups("g0", "g1", "g2", "g1")))
+    assert sorted((r["group_uuid"], r["status"]) for r in lines[:-1]) == [
+        ("g0", "existing"), ("g1", "created"), ("g2", "created")]
+    assert lines[-1]["stored"] == 2 and lines[-1]["existing"] == 1
+    assert len(batches) == 1
+    assert bridge.store.get_room_for_group("g2") == "!g2:hs"
+
+
+def test_failed_write_is_reported_on_the_stream(bridge, monkeypatch):
+    def down(rows, enabled_at=None):
+        raise ConnectionError("store down")
+
+    monkeypatch.setattr(bridge.store, "upsert_bridges", down)
+    lines = list(bridge.enable_bridges(_groups("g1", "g2")))
+
+    error, summary = lines[-2], lines[-1]
+    assert error["status"] == "error"
+    assert error["error"] == "mappings not stored: store down"
+    assert sorted(error["group_uuids"]) == ["g1", "g2"]
+    assert summary["done"] and summary["created"] == 2
+    assert summary["stored"] == 0
+
+
+def test_rooms_are_mapped_when_the_client_goes_away(bridge):
+    stream = bridge.enable_bridges(_groups("g1", "g2"))
+    first = next(stream)["group_uuid"]
+    stream.close()
+    assert bridge.store.get_room_for_group(first) == f"!{first}:hs"
@@ -0,0 +1,66 @@
+"""
+Transaction ingest: the no-decode shortcut and event filtering.
+
+    python -m pytest -q tests
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge import ingest  # noqa: E402
+
+SKIP = ("@os_", "@opensim_bot")
+
+
+def _txn(*events) -> bytes:
+    return json.dumps({"events": list(events)}).encode()
+
+
+def _msg(room="!a:hs", sender="@alice:hs", body="hi"):
+    return {"type": "m.room.message", "room_id": room, "sender": sender,
+            "content": {"msgtype": "m.text", "body": body}}
+
+
+def test_noise_only_transaction_is_not_decoded(monkeypatch):
+    decoded = []
+    monkeypatch.setattr(ingest, "loads",
+                        lambda raw: decoded.append(raw) or json.loads(raw))
+    raw = _txn({"type": "m.typing", "room_id": "!a:hs",
+                "content": {"user_ids": ["@alice:hs"]}},
+               {"type": "m.receipt", "room_id": "!a:hs", "content": {}})
+    assert ingest.parse_transaction(raw, ingest.RELAY_TYPES, SKIP) == []
+    assert decoded == []
+
+    # A message anywhere in the body means it is decoded
+    ingest.parse_transaction(_txn(_msg()), ingest.RELAY_TYPES, SKIP)
+    assert len(decoded) == 1
+
+
+def test_filters_by_type_sender_and_room():
+    member = {"type": "m.room.member", "room_id": "!a:hs",
+              "sender": "@bob:hs", "state_key": "@bob:hs",
+              "content": {"membership": "join", "displayname": "Bob"}}
+    raw = _txn(
+        _msg(),
+        _msg(sender="@os_0123:hs"),             # our puppet: loop
+        _msg(sender="@opensim_bot:hs"),         # our bot
+        _msg(room="!unbridged:hs"),
+        member,
+        {"type": "m.room.topic", "room_id": "!a:hs", "sender": "@alice:hs"},
+        "not an event",
+    )
+    events = ingest.parse_transaction(
+        raw, ingest.RELAY_TYPES, SKIP, lambda room: room == "!a:hs")
+    assert events == [_msg(), member]
+
+    only_messages = ingest.parse_transaction(raw, ingest.MESSAGE_TYPES, SKIP)
+    assert [e["room_id"] for e in only_messages] == ["!a:hs", "!unbridged:hs"]
+
+
+def test_malformed_bodies_yield_nothing():
+    assert ingest.parse_transaction(b"") == []
+    assert ingest.parse_transaction(b'{"events": [{"type": "m.room.message"') == []
+    assert ingest.parse_transaction(b'["m.room.message"]') == []
+    assert ingest.parse_transaction(b'{"events": "m.room.message"}') == []
@@ -0,0 +1,115 @@
+"""
+Member display names: one bulk fill per room, updates from m.room.member
+events, LRU eviction, and the bounded map of failed fills.
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.members import MemberNameCache  # noqa: E402
+
+
+class Joined:
+    """Stands in for /joined_members: counts fills, can fail or stall."""
+
+    def __init__(self, fail=(), delay=0.0):
+        self.fail = set(fail)
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, room_id):
+        self.calls.append(room_id)
+        time.sleep(self.delay)
+        if room_id in self.fail:
+            return None
+        return {"@alice:hs": f"Alice in {room_id}", "@bob:hs": None}
+
+
+def _member(room, user, membership, name=None):
+    return {"type": "m.room.member", "room_id": room, "state_key": user,
+            "content": {"membership": membership, "displayname": name}}
+
+
+def test_room_is_filled_once_and_kept_current():
+    fetch = Joined()
+    cache = MemberNameCache(fetch)
+    cache.observe(_member("!a", "@carol:hs", "join", "Carol"))   # not held yet
+
+    assert cache.display_name("!a", "@alice:hs") == "Alice in !a"
+    assert cache.display_name("!a", "@bob:hs") is None
+    assert cache.display_name("!a", "@carol:hs") is None
+    assert fetch.calls == ["!a"]
+
+    cache.observe(_member("!a", "@carol:hs", "join", "Carol"))
+    cache.observe(_member("!a", "@alice:hs", "join", "Alice R"))
+    cache.observe(_member("!a", "@bob:hs", "leave"))
+    assert cache.display_name("!a", "@carol:hs") == "Carol"
+    assert cache.display_name("!a", "@alice:hs") == "Alice R"
+    assert cache._rooms["!a"].keys() == {"@alice:hs", "@carol:hs"}
+    assert fetch.calls == ["!a"] and cache.hits == 4
+
+
+def test_concurrent_misses_share_one_fill():
+    fetch = Joined(delay=0.2)
+    cache = MemberNameCache(fetch)
+    names = []
+    threads = [threading.Thread(
+        target=lambda: names.append(cache.display_name("!a", "@alice:hs")))
+        for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert names == ["Alice in !a"] * 8
+    assert fetch.calls == ["!a"]
+
+
+def test_least_recently_used_room_is_evicted():
+    fetch = Joined()
+    cache = MemberNameCache(fetch, max_rooms=2)
+    cache.display_name("!a", "@alice:hs")
+    cache.display_name("!b", "@alice:hs")
+    cache.display_name("!a", "@alice:hs")       # !a is now the most recent
+    cache.display_name("!c", "@alice:hs")
+    assert list(cache._rooms) == ["!a", "!c"]
+
+    cache.display_name("!b", "@alice:hs")
+    assert fetch.calls == ["!a", "!b", "!c", "!b"]
+    assert cache.stats()["rooms"] == 2
+
+
+def test_failed_fill_is_retried_after_retry_after():
+    fetch = Joined(fail={"!a"})
+    cache = MemberNameCache(fetch, retry_after=0.05)
+    assert cache.display_name("!a", "@alice:hs") is None
+    assert cache.display_name("!a", "@alice:hs") is None
+    assert fetch.calls == ["!a"]
+
+    fetch.fail.clear()
+    time.sleep(0.06)
+    assert cache.display_name("!a", "@alice:hs") == "Alice in !a"
+    assert fetch.calls == ["!a", "!a"]
+    assert cache.stats()["failed_rooms"] == 0
+
+
+def test_failed_fills_are_bounded():
+    rooms = [f"!r{i}" for i in range(50)]
+    cache = MemberNameCache(Joined(fail=rooms), max_rooms=10,
+                            retry_after=60)
+    for room in rooms:
+        cache.display_name(room, "@alice:hs")
+    assert list(cache._failed) == rooms[-10:]
+
+    # Expired entries are dropped as new failures come in
+    cache = MemberNameCache(Joined(fail=rooms), max_rooms=10,
+                            retry_after=0.05)
+    for room in rooms[:5]:
+        cache.display_name(room, "@alice:hs")
+    time.sleep(0.06)
+    cache.display_name(rooms[5], "@alice:hs")
+    assert list(cache._failed) == [rooms[5]]
@@ -0,0 +1,50 @@
+"""
+Query-plan check: every hot query uses an index on the seeded SQLite
+database, and the full read behind BridgeIndex is not reported as a
+regression on either backend.
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge import plancheck  # noqa: E402
+from bridge.storage import SQLiteStateStore  # noqa: E402
+
+
+def test_hot_queries_use_an_index_on_sqlite():
+    results = plancheck.check_sqlite(groups=300, members_per_group=5)
+    assert [r for r in results if not r.ok] == []
+
+    names = {r.query for r in results}
+    assert set(SQLiteStateStore.SQL) <= names
+    assert set(plancheck.LIST_PAGES) <= names
+    assert set(plancheck.GROUPS_PARAMS) <= names
+
+
+class _ScanningPool:
+    """A MySQL pool whose EXPLAIN reports a table scan for everything."""
+
+    def get_connection(self):
+        return self
+
+    def cursor(self, dictionary=False):
+        return self
+
+    def execute(self, sql, params):
+        pass
+
+    def fetchall(self):
+        return [{"table": "t", "type": "ALL", "key": None}]
+
+    def close(self):
+        pass
+
+
+def test_mysql_scan_is_only_accepted_where_expected():
+    results = plancheck.check_mysql(_ScanningPool(), _ScanningPool())
+    accepted = {r.query for r in results if r.ok}
+    assert accepted == set(plancheck.EXPECTED_SCANS)
+    assert all(r.plan.endswith("(expected scan)") for r in results if r.ok)
@@ -0,0 +1,121 @@
+"""
+Region routing: URL identity, the per-region circuit breaker, candidate
+ranking, and failover/fan-out delivery in relay_to_opensim.
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.config import Config  # noqa: E402
+from bridge.regions import RegionRegistry, normalize_url  # noqa: E402
+from bridge.service import BridgeService  # noqa: E402
+
+SIM1, SIM2, SIM3 = ("http://127.0.0.1:9001", "http://127.0.0.1:9002",
+                    "http://127.0.0.1:9003")
+
+
+def test_normalize_url():
+    assert normalize_url("HTTP://Sim.Example.NET:80/") == "http://sim.example.net"
+    assert normalize_url("https://sim:443/grid/") == "https://sim/grid"
+    assert normalize_url("http://sim:9000") == "http://sim:9000"
+
+
+def test_spellings_of_one_region_share_identity_and_health():
+    reg = RegionRegistry(["http://localhost:9001/"], {})
+    reg.learn("g", "http://127.0.0.1:9001")
+    reg.learn("g", "HTTP://LOCALHOST:9001")
+    assert reg.candidates("g") == ["http://localhost:9001"]
+
+    for _ in range(3):
+        reg.record("http://127.0.0.1:9001/", False, 5)
+    assert not reg.available("http://localhost:9001")
+
+
+def test_falls_back_to_opensim_region_url():
+    reg = RegionRegistry([], {}, fallback="http://sim:9000/")
+    assert reg.candidates("any-group") == ["http://sim:9000"]
+
+
+def test_circuit_opens_after_three_failures_and_cooldown_doubles():
+    reg = RegionRegistry([SIM1], {}, base_cooldown=10)
+    reg.record(SIM1, False, 5)
+    reg.record(SIM1, False, 5)
+    assert reg.available(SIM1)
+    reg.record(SIM1, False, 5)
+    assert not reg.available(SIM1)
+
+    health = reg._health[SIM1]
+    first = health.open_until - time.monotonic()
+    reg.record(SIM1, False, 5)
+    second = health.open_until - time.monotonic()
+    assert 9 < first <= 10 and 19 < second <= 20
+
+    reg.record(SIM1, True, 5)
+    assert reg.available(SIM1)
+
+
+def test_candidates_rank_available_then_score():
+    reg = RegionRegistry([SIM3], {"g": [SIM1, SIM2]})
+    reg.record(SIM1, True, 400)         # slow
+    reg.record(SIM2, True, 10)          # fast
+    reg.record(SIM3, True, 100)
+    assert reg.candidates("g") == [SIM2, SIM3, SIM1]
+
+    for _ in range(3):
+        reg.record(SIM2, False, 10)     # circuit open: last
+    assert reg.candidates("g")[-1] == SIM2
+
+
+def test_learned_regions_expire_and_are_capped():
+    reg = RegionRegistry([SIM3], {}, learn_ttl=60, max_learned=1)
+    reg.learn("g", SIM1)
+    reg.learn("g", SIM2)
+    assert reg.candidates("g") == [SIM2, SIM3]
+    reg._learned["g"][SIM2] -= 120
+    assert reg.candidates("g") == [SIM3]
+
+
+@pytest.fixture
+def bridge(tmp_path, monkeypatch):
+    cfg = tmp_path / "config.yaml"
+    cfg.write_text(
+        "matrix: {as_token: as, hs_token: hs}\n"
+        "opensim: {bridge_secret: secret}\n"
+        "state_store: {backend: sqlite, path: %s}\n"
+        "trace: {enabled: false}\n"
+        "regions: {default: [%s, %s]}\n"
+        % (tmp_path / "state.db", SIM1, SIM2))
+    service = BridgeService(Config(str(cfg)))
+    sent = []
+
+    def inject(url, payload):
+        sent.append((url, payload.get("scope")))
+        return service._down.get(url)
+
+    service._down = {}
+    monkeypatch.setattr(service, "_inject", inject)
+    service.sent = sent
+    return service
+
+
+def test_failover_tries_the_next_region(bridge):
+    bridge._down[SIM1] = "HTTP 502"
+    bridge.relay_to_opensim("g", "Alice", "hi")
+    assert bridge.sent == [(SIM1, None), (SIM2, None)]
+
+    bridge._down[SIM2] = "timeout"
+    with pytest.raises(Exception, match="injection failed"):
+        bridge.relay_to_opensim("g", "Alice", "hi")
+
+
+def test_fanout_sends_once_per_region(bridge):
+    bridge.cfg.regions_mode = "fanout"
+    bridge.regions.learn("g", "http://localhost:9002/")     # same as SIM2
+    bridge.relay_to_opensim("g", "Alice", "hi")
+    assert sorted(bridge.sent) == [(SIM1, "local"), (SIM2, "local")]
@@ -0,0 +1,98 @@
+"""
+Listeners: the pooled server never stalls its accept loop, and the
+multi-worker router rejects unauthenticated work before routing it.
+
+    python -m pytest -q tests
+"""
+import io
+import os
+import socket
+import sys
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.server import AffinityRouter, make_listener  # noqa: E402
+
+CFG = types.SimpleNamespace(hs_token="hs", bridge_secret="secret",
+                            server_threads=1, server_socket_timeout=5)
+
+
+def _status_line(port: int) -> bytes:
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as s:
+        s.sendall(b"GET /health HTTP/1.1\r\nHost: x\r\n\r\n")
+        data = b""
+        while chunk := s.recv(4096):
+            data += chunk
+    return data.split(b"\r\n", 1)[0]
+
+
+def test_full_pool_answers_503_instead_of_blocking():
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b"ok"]
+
+    srv = make_listener("127.0.0.1", 0, app, CFG)
+    port = srv.socket.getsockname()[1]
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        # Keep-alive is off: a served client can't hold the one thread
+        assert _status_line(port) == b"HTTP/1.0 200 OK"
+        assert _status_line(port) == b"HTTP/1.0 200 OK"
+
+        def free_slots_reach(n):
+            deadline = time.monotonic() + 5
+            while srv._slots._value != n and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        # One silent client holds the thread, one waits for it
+        free_slots_reach(2)
+        silent = [socket.create_connection(("127.0.0.1", port))
+                  for _ in range(2)]
+        free_slots_reach(0)
+        assert _status_line(port) == b"HTTP/1.0 503 Service Unavailable"
+        for s in silent:
+            s.close()
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def _call(router, path: str, body: bytes, headers: dict) -> str:
+    environ = {"PATH_INFO": path, "REQUEST_METHOD": "POST",
+               "CONTENT_LENGTH": str(len(body)), "QUERY_STRING": "",
+               "wsgi.input": io.BytesIO(body), **headers}
+    status = []
+    router(environ, lambda s, h: status.append(s))
+    return status[0]
+
+
+def test_router_rejects_unauthenticated_work_before_routing():
+    looked_up = []
+
+    def app(environ, start_response):
+        start_response("200 OK", [])
+        return [b"{}"]
+
+    def group_key(group_uuid):
+        looked_up.append(group_uuid)
+        return group_uuid
+
+    # workers=1: everything is local, nothing is forwarded
+    router = AffinityRouter(app, CFG, 0, 1, "/nonexistent", group_key)
+    event = b'{"type":"group_message","group_uuid":"g0"}'
+
+    assert _call(router, "/os/event", event, {}).startswith("401")
+    assert _call(router, "/os/event", event,
+                 {"HTTP_X_BRIDGE_SECRET": "wrong"}).startswith("401")
+    assert _call(router, "/transactions/1", b'{"events":[]}',
+                 {}).startswith("401")
+    assert looked_up == []
+
+    assert _call(router, "/os/event", event,
+                 {"HTTP_X_BRIDGE_SECRET": "secret"}).startswith("200")
+    assert looked_up == ["g0"]
+    assert _call(router, "/transactions/1", b'{"events":[]}',
+                 {"HTTP_AUTHORIZATION": "Bearer hs"}).startswith("200")
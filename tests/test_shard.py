@@ -0,0 +1,157 @@
+"""
+Shard workers: per-key ordering, and recovery after a worker is killed.
+
+    python -m pytest -q tests
+"""
+import multiprocessing as mp
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.migrations import migrate  # noqa: E402
+from bridge.server import shard_for  # noqa: E402
+from bridge.db import PoolExhausted  # noqa: E402
+from bridge.shard import (KeyedExecutor, ShardDispatcher, WorkerSet,  # noqa: E402
+                          bridge_handler, consume)
+from bridge.storage import BridgeIndex, SQLiteStateStore  # noqa: E402
+
+
+def _echo_worker(index, q, replies, results):
+    """Shard worker that reports every payload it handles."""
+    def handle(kind, payload):
+        if payload == "hang":
+            time.sleep(60)
+        results.put((index, payload))
+    consume(q, handle, lanes=1, replies=replies)
+
+
+def test_keyed_executor_keeps_per_key_order():
+    seen: dict[str, list] = {}
+    lock = threading.Lock()
+
+    def record(key, n):
+        time.sleep(0.0005 * (n % 3))
+        with lock:
+            seen.setdefault(key, []).append(n)
+
+    executor = KeyedExecutor(4)
+    for n in range(200):
+        key = f"!room{n % 7}"
+        executor.submit(key, record, key, n)
+    executor.shutdown()
+
+    for key, ns in seen.items():
+        assert ns == sorted(ns), key
+    assert sum(len(ns) for ns in seen.values()) == 200
+
+
+def test_down_or_warming_shard_refuses_work():
+    dispatcher = ShardDispatcher(1, queue_size=10)
+    assert not dispatcher.submit("!room", "txn", [1])     # warming up
+    dispatcher.mark_ready(0)
+    assert dispatcher.submit("!room", "txn", [1])
+
+    dispatcher.mark_down(0)
+    assert not dispatcher.submit("!room", "txn", [1])
+    dispatcher.replace_queue(0)
+    assert dispatcher.warming() == [0]
+    dispatcher.mark_ready(0)
+    assert dispatcher.submit("!room", "txn", [1])
+
+
+def test_os_event_goes_to_the_rooms_shard():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStateStore(os.path.join(tmp, "state.db"))
+        migrate(store)
+        # Pick a bridge whose room and group hash to different shards
+        n = 0
+        while shard_for(f"g{n}", 4) == shard_for(f"!room{n}:hs", 4):
+            n += 1
+        group_uuid, room_id = f"g{n}", f"!room{n}:hs"
+        store.upsert_bridge(group_uuid, room_id, "@admin:hs")
+        index = BridgeIndex(store)
+
+        assert index.shard_key(group_uuid) == room_id
+        assert index.shard_key("unbridged") == "unbridged"
+
+        dispatcher = ShardDispatcher(4, queue_size=10)
+        for i in range(4):
+            dispatcher.mark_ready(i)
+        evt = {"group_uuid": group_uuid}
+        assert dispatcher.submit_os_event(evt, index.shard_key(group_uuid))
+        item = dispatcher.queues[shard_for(room_id, 4)].get(timeout=5)
+        assert item[:3] == ("os_event", room_id, evt)
+
+
+def test_worker_respawns_after_kill():
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    dispatcher = ShardDispatcher(1, queue_size=100)
+    workers = WorkerSet(dispatcher, _echo_worker, (results,), respawn_delay=0)
+    workers.start()
+    dispatcher.mark_ready(0)
+    try:
+        assert dispatcher.submit("!room", "txn", "before")
+        assert results.get(timeout=30) == (0, "before")
+
+        # Killed while idle in q.get(), i.e. holding the queue's read lock
+        time.sleep(0.2)
+        os.kill(workers.procs[0].pid, signal.SIGKILL)
+
+        deadline = time.monotonic() + 10
+        while not workers.check(timeout=0.5):
+            assert time.monotonic() < deadline, "worker was not respawned"
+        dispatcher.mark_ready(0)
+
+        assert dispatcher.submit("!room", "txn", "after")
+        assert results.get(timeout=30) == (0, "after")
+    finally:
+        workers.stop()
+
+
+def test_pool_exhaustion_is_reported_for_retry():
+    class Bridge:
+        def handle_matrix_transaction(self, txn):
+            raise PoolExhausted("state pool")
+
+        def relay_from_opensim(self, **kwargs):
+            raise RuntimeError("region down")
+
+    handle = bridge_handler(Bridge())
+    assert handle("txn", [{"room_id": "!r"}]) == "busy"
+    assert handle("os_event", {"group_uuid": "g", "from_uuid": "u",
+                               "from_name": "n", "message": "m"}) == "error"
+
+
+def test_transaction_is_acked_only_after_the_worker_handled_it():
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    dispatcher = ShardDispatcher(1, queue_size=100)
+    workers = WorkerSet(dispatcher, _echo_worker, (results,), respawn_delay=0)
+    workers.start()
+    dispatcher.mark_ready(0)
+    try:
+        assert dispatcher.dispatch_transaction([{"room_id": "!r"}], timeout=30)
+        assert results.get(timeout=5) == (0, [{"room_id": "!r"}])
+
+        # Still running when the worker dies: answered "busy", not lost
+        fut = dispatcher.submit("!r", "txn", "hang")
+        time.sleep(0.5)
+        os.kill(workers.procs[0].pid, signal.SIGKILL)
+        deadline = time.monotonic() + 10
+        while not workers.check(timeout=0.5):
+            assert time.monotonic() < deadline, "worker was not respawned"
+        assert fut.done() and fut.result() == "busy"
+
+        # Not handled in time: "busy" too
+        dispatcher.mark_ready(0)
+        assert dispatcher.wait([dispatcher.submit("!r", "txn", "hang")],
+                               timeout=0.2) == ["busy"]
+    finally:
+        os.kill(workers.procs[0].pid, signal.SIGKILL)
+        workers.stop()
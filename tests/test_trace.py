@@ -0,0 +1,91 @@
+"""
+Message tracing: which traces are kept, what a kept trace records, and
+reading the span log back.
+
+    python -m pytest -q tests
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.trace import (  # noqa: E402
+    Tracer, find_trace, render_waterfall, slowest,
+)
+
+SAMPLED = "0" * 32              # last 8 hex digits → bucket 0.0
+NOT_SAMPLED = "f" * 32          # → bucket 1.0
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    return Tracer(str(tmp_path), sample_rate=0.5, slow_ms=1000)
+
+
+def test_sampling_is_decided_by_the_trace_id(tracer):
+    assert tracer.sampled(SAMPLED)
+    assert not tracer.sampled(NOT_SAMPLED)
+    assert tracer.sampled("not-hex") == tracer.sampled("not-hex")
+
+
+def test_only_sampled_slow_or_failed_traces_are_kept(tracer, tmp_path):
+    with tracer.trace("os_to_matrix", NOT_SAMPLED):
+        with tracer.span("db.mapping"):
+            pass
+    assert tracer.dropped == 1
+
+    with tracer.trace("os_to_matrix", SAMPLED, group="g1"):
+        with tracer.span("send", room="!a") as sp:
+            sp.set(ok=True)
+
+    # Quick here, but 5 s behind the tap: slow end to end
+    with tracer.trace("os_to_matrix", "1" + NOT_SAMPLED[1:],
+                      origin_ts_ms=int(time.time() * 1000) - 5000):
+        pass
+
+    with pytest.raises(ValueError):
+        with tracer.trace("matrix_to_os", "2" + NOT_SAMPLED[1:],
+                          event_id="$e1"):
+            with tracer.span("region.inject"):
+                raise ValueError("HTTP 502")
+    assert (tracer.kept, tracer.dropped) == (3, 1)
+
+    sampled = find_trace(str(tmp_path), SAMPLED[:8])
+    assert sampled["attrs"] == {"group": "g1"}
+    assert [(s["span"], s["attrs"]) for s in sampled["spans"]] == [
+        ("send", {"room": "!a", "ok": True})]
+
+    failed = find_trace(str(tmp_path), "$e1")
+    assert failed["error"] == "region.inject: ValueError: HTTP 502"
+    assert slowest(str(tmp_path), limit=1)[0]["trace"][0] == "1"
+    assert "region.inject" in render_waterfall(failed)
+
+
+def test_spans_follow_the_trace_into_worker_threads(tracer, tmp_path):
+    def inject():
+        with tracer.span("region.inject", region="sim1"):
+            pass
+
+    with tracer.trace("matrix_to_os", SAMPLED):
+        t = threading.Thread(target=contextvars.copy_context().run,
+                             args=(inject,))
+        t.start()
+        t.join()
+        inject_id = tracer.current_id()
+    assert inject_id == SAMPLED and tracer.current_id() is None
+    assert find_trace(str(tmp_path), SAMPLED)["spans"][0]["span"] == \
+        "region.inject"
+
+
+def test_disabled_tracer_records_nothing(tmp_path):
+    tracer = Tracer(str(tmp_path / "off"), enabled=False)
+    with tracer.trace("os_to_matrix", SAMPLED):
+        with tracer.span("send") as sp:
+            sp.set(ok=True)
+        assert tracer.current_id() is None
+    assert not os.path.exists(tmp_path / "off")
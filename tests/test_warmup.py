@@ -0,0 +1,53 @@
+"""
+Warm-up: dependency order, optional steps, and giving up on a step that
+keeps failing so the worker still becomes ready.
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bridge.warmup import WarmUp  # noqa: E402
+
+
+def _fail():
+    raise ConnectionError("down")
+
+
+def test_steps_run_after_their_dependencies():
+    order = []
+    w = WarmUp(retry_base=0.01)
+    w.add("pool", lambda: order.append("pool"))
+    w.add("index", lambda: order.append("index"), after=("pool",))
+    w.start()
+    assert w.wait(5)
+    assert order == ["pool", "index"]
+    assert w.status()["degraded"] == []
+
+
+def test_failing_optional_step_does_not_hold_up_readiness():
+    w = WarmUp(retry_base=0.01, give_up_after=0.3)
+    w.add("pool", lambda: None)
+    w.add("migrate", _fail, after=("pool",), required=False)
+    w.add("index", lambda: None, after=("pool",))
+    w.start()
+    assert w.wait(5)
+    status = w.status()
+    assert status["steps"]["migrate"]["state"] in ("failed", "running")
+    assert status["degraded"] == ["migrate"]
+
+
+def test_step_that_stays_down_is_given_up():
+    calls = []
+    w = WarmUp(retry_base=0.01, retry_max=0.05, give_up_after=0.3)
+    w.add("conduit", lambda: calls.append(1) or _fail())
+    w.add("index", lambda: None)
+    w.start()
+    assert w.wait(5)
+    status = w.status()
+    assert status["steps"]["conduit"]["state"] == "gave_up"
+    assert status["steps"]["conduit"]["error"] == "ConnectionError: down"
+    assert status["degraded"] == ["conduit"]
+    assert len(calls) > 1                      # retried before giving up